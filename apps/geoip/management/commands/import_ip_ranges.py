@@ -0,0 +1,93 @@
+import argparse
+import csv
+import logging
+import time
+from collections.abc import Iterator
+from ipaddress import IPv4Network
+from pathlib import Path
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from apps.geoip.entities import WhoisQueryResult
+from apps.geoip.models import ISP
+
+logger = logging.getLogger(__name__)
+
+
+def iterate_ranges(
+    path: str,
+    *,
+    network_column: str,
+    name_column: str,
+    country_column: str | None,
+) -> Iterator[WhoisQueryResult]:
+    """
+    Yield the ipv4 ranges from a csv file with a header row.
+
+    The rows with ipv6 or malformed networks and the rows without an isp name are skipped.
+    """
+    skipped = 0
+    with Path(path).open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                cidr = IPv4Network(row[network_column].strip())
+            except ValueError:
+                skipped += 1
+                continue
+
+            if not (name := (row[name_column] or "").strip()):
+                skipped += 1
+                continue
+
+            country = (row[country_column] or "").strip().lower() if country_column else ""
+            yield WhoisQueryResult(
+                description=name.splitlines()[0][:255],
+                country=country if len(country) == 2 else None,  # noqa: PLR2004
+                cidr=cidr,
+            )
+
+    if skipped:
+        logger.info("skipped %d rows of %s", skipped, path)
+
+
+class Command(BaseCommand):
+    help = "Bulk load ip ranges and their isps from a csv dataset"
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("path", help="Path to a csv file with a header row")
+        parser.add_argument(
+            "--network-column",
+            default="network",
+            help="Column holding the network in cidr notation",
+        )
+        parser.add_argument(
+            "--name-column",
+            default="autonomous_system_organization",
+            help="Column holding the isp name",
+        )
+        parser.add_argument(
+            "--country-column",
+            default=None,
+            help="Column holding the country iso code, if any",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+
+        started_at = time.monotonic()
+        ranges = iterate_ranges(
+            options["path"],
+            network_column=options["network_column"],
+            name_column=options["name_column"],
+            country_column=options["country_column"],
+        )
+        created_isps, imported_ranges = ISP.objects.import_ranges(ranges)
+
+        logger.info(
+            "imported %d ip ranges and created %d isps in %.2fs",
+            imported_ranges,
+            created_isps,
+            time.monotonic() - started_at,
+        )
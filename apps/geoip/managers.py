@@ -1,23 +1,31 @@
 import datetime
 import logging
+import time
+from collections.abc import Iterable, Iterator
 from ipaddress import IPv4Address, IPv4Network
 from typing import TYPE_CHECKING
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Case, F, Q, QuerySet, Value, When
 from django.utils import timezone
 from ipwhois import IPWhois
 from ipwhois.utils import ipv4_is_defined
 
 from apps.geoip.entities import WhoisQueryResult
+from apps.geoip.signals import queued_whois_resolved, whois_resolved
+from apps.geoip.utils import IPRangeIndex
 
 if TYPE_CHECKING:
     from apps.geoip.models import ISP
 
 logger = logging.getLogger(__name__)
 
+# ip ranges known to the current process
+ip_range_index = IPRangeIndex()
+
 
 class IPManager(models.Manager):
     def get_queryset(self) -> QuerySet:
@@ -36,7 +44,10 @@ class IPManager(models.Manager):
                     output_field=models.IntegerField(),
                 ),
                 is_fresh=Case(
-                    When(Q(date_created__gte=min_freshness_date), then=Value(True)),  # noqa: FBT003
+                    When(
+                        Q(is_imported=True) | Q(date_created__gte=min_freshness_date),
+                        then=Value(True),  # noqa: FBT003
+                    ),
                     default=Value(False),  # noqa: FBT003
                     output_field=models.BooleanField(),
                 ),
@@ -47,6 +58,60 @@ class IPManager(models.Manager):
         """Return old IP entries pending removal"""
         return self.get_queryset().filter(is_fresh=False)
 
+    def delete_expired(self, *, chunk_size: int, budget: int) -> int:
+        """
+        Delete expired ip ranges in chunks, oldest first.
+        The imported ranges never expire.
+
+        Every chunk is deleted in its own transaction with a raw delete,
+        continuing from the last deleted range.
+        Stop once the budget is exhausted, leaving the remaining ranges to the next run.
+
+        Return the number of deleted ranges.
+        """
+        min_freshness_date = timezone.now() - datetime.timedelta(seconds=settings.GEOIP_IP_EXPIRY)
+        last_key = (datetime.datetime.min.replace(tzinfo=datetime.UTC), 0)
+        deleted = 0
+
+        while deleted < budget:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    WITH expired AS (
+                        SELECT id
+                        FROM tracker_ip
+                        WHERE NOT is_imported
+                            AND date_created < %s AND (date_created, id) > (%s, %s)
+                        ORDER BY date_created, id
+                        LIMIT %s
+                    )
+                    DELETE FROM tracker_ip
+                    USING expired
+                    WHERE tracker_ip.id = expired.id
+                    RETURNING tracker_ip.date_created, tracker_ip.id
+                    """,
+                    [min_freshness_date, *last_key, min(chunk_size, budget - deleted)],
+                )
+                rows = cursor.fetchall()
+
+            if not rows:
+                break
+
+            deleted += len(rows)
+            last_key = max(rows)
+
+        return deleted
+
+    def get_range_rows(self, *, since_pk: int = 0) -> Iterator[tuple[int, int, int, int | None]]:
+        """Iterate over the ip ranges added after the given pk"""
+        return (
+            self.using("replica")
+            .filter(pk__gt=since_pk)
+            .order_by()
+            .values_list("pk", "range_from", "range_to", "isp_id")
+            .iterator(chunk_size=settings.GEOIP_IP_INDEX_CHUNK_SIZE)
+        )
+
 
 class ISPManager(models.Manager):
     def match(self, ip_address: str | IPv4Address) -> tuple["ISP", int]:
@@ -60,17 +125,167 @@ class ISPManager(models.Manager):
 
         ip_address = IPv4Address(ip_address)
         ip_int = int(ip_address)
+
+        if settings.GEOIP_IP_INDEX_ENABLED and (matched := self._match_with_index(ip_int)):
+            return matched
+
         obj = (
             IP.objects.select_related("isp")
-            .filter(range_from__lte=ip_int, range_to__gte=ip_int)
+            # probe the gist index for the ranges containing the address
+            .filter(ip_range__contains=ip_int)
             .extra(order_by=("length",))[:1]
             .get()
         )
         return obj.isp, obj.length
 
-    def match_or_create(self, ip_address: str | IPv4Address) -> tuple["ISP", bool]:
+    def _match_with_index(self, ip_int: int) -> tuple["ISP", int] | None:
+        self.refresh_ip_range_index()
+
+        if (matched := ip_range_index.lookup(ip_int)) is None:
+            return None
+
+        isp_id, length = matched
+        if isp_id is None:
+            return None, length
+
+        if (isp := ip_range_index.isps.get(isp_id)) is None:
+            try:
+                isp = ip_range_index.isps[isp_id] = self.get(pk=isp_id)
+            except ObjectDoesNotExist:
+                # the isp has been deleted since the index was loaded
+                return None
+        return isp, length
+
+    def refresh_ip_range_index(self) -> None:
+        """
+        Load the ip range index for the current process,
+        then keep it up to date by adding the ranges created since.
+
+        The index is loaded again once it has been reset by any of the processes.
+        Ranges committed out of their pk order or removed from the database
+        are only picked up by the periodic full reload.
+        """
         from apps.geoip.models import IP
 
+        now = time.monotonic()
+        refresh_is_due = (
+            ip_range_index.loaded_at is not None
+            and now - ip_range_index.refreshed_at >= settings.GEOIP_IP_INDEX_REFRESH_INTERVAL
+        )
+
+        if refresh_is_due and ip_range_index.version != self._get_ip_range_index_version():
+            logger.info("ip range index has been reset, reloading")
+            ip_range_index.clear()
+
+        if (
+            ip_range_index.loaded_at is None
+            or now - ip_range_index.loaded_at >= settings.GEOIP_IP_INDEX_RELOAD_INTERVAL
+        ):
+            ip_range_index.clear()
+            # obtain the version beforehand, so that a reset during the load is not missed
+            ip_range_index.version = self._get_ip_range_index_version()
+            loaded = ip_range_index.extend(IP.objects.get_range_rows())
+            ip_range_index.loaded_at = ip_range_index.refreshed_at = now
+            logger.info("loaded %d ip ranges into index", loaded)
+        elif refresh_is_due:
+            since_pk = ip_range_index.last_pk
+            if added := ip_range_index.extend(IP.objects.get_range_rows(since_pk=since_pk)):
+                logger.debug("added %d new ip ranges to index", added)
+            ip_range_index.refreshed_at = now
+
+    def reset_ip_range_index(self) -> None:
+        """
+        Have the ip range index reloaded by every process, the current one straight away.
+        """
+        redis = cache.client.get_client()
+        redis.incr(settings.GEOIP_IP_INDEX_VERSION_REDIS_KEY)
+        ip_range_index.clear()
+
+    def _get_ip_range_index_version(self) -> int:
+        redis = cache.client.get_client()
+        return int(redis.get(settings.GEOIP_IP_INDEX_VERSION_REDIS_KEY) or 0)
+
+    def _add_to_ip_range_index(self, range_from: int, range_to: int, isp_id: int | None) -> None:
+        if settings.GEOIP_IP_INDEX_ENABLED:
+            transaction.on_commit(lambda: ip_range_index.add(range_from, range_to, isp_id))
+
+    @transaction.atomic
+    def import_ranges(self, ranges: Iterable[WhoisQueryResult]) -> tuple[int, int]:
+        """
+        Bulk load ip ranges along with their isps.
+
+        The ranges are copied into a temporary table first,
+        then the missing isps are created and the ranges are upserted in a single statement each.
+        Isps are matched by name and country, the existing ranges are reassigned and renewed.
+        The imported ranges are exempt from expiry and the ip range index is reset on commit.
+
+        Return the number of created isps and the number of imported ranges.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE geoip_import_ranges "
+                "(range_from bigint, range_to bigint, name text, country text) "
+                "ON COMMIT DROP"
+            )
+            with cursor.copy(
+                "COPY geoip_import_ranges (range_from, range_to, name, country) FROM STDIN"
+            ) as copy:
+                for item in ranges:
+                    copy.write_row(
+                        (int(item.cidr[0]), int(item.cidr[-1]), item.description, item.country)
+                    )
+
+            cursor.execute(
+                """
+                -- existing isps may be duplicated, pick the oldest one
+                WITH known_isps AS (
+                    SELECT DISTINCT ON (name, COALESCE(country, '')) id, name, country
+                    FROM tracker_isp
+                    WHERE name IS NOT NULL
+                    ORDER BY name, COALESCE(country, ''), id
+                )
+                INSERT INTO tracker_isp (name, country)
+                SELECT DISTINCT r.name, r.country
+                FROM geoip_import_ranges r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM known_isps i
+                    WHERE i.name = r.name AND COALESCE(i.country, '') = COALESCE(r.country, '')
+                )
+                """
+            )
+            created_isps = cursor.rowcount
+
+            cursor.execute(
+                """
+                -- existing isps may be duplicated, pick the oldest one
+                WITH known_isps AS (
+                    SELECT DISTINCT ON (name, COALESCE(country, '')) id, name, country
+                    FROM tracker_isp
+                    WHERE name IS NOT NULL
+                    ORDER BY name, COALESCE(country, ''), id
+                )
+                INSERT INTO tracker_ip (range_from, range_to, isp_id, date_created, is_imported)
+                SELECT DISTINCT ON (r.range_from, r.range_to)
+                    r.range_from, r.range_to, i.id, %s, true
+                FROM geoip_import_ranges r
+                JOIN known_isps i
+                    ON i.name = r.name AND COALESCE(i.country, '') = COALESCE(r.country, '')
+                ORDER BY r.range_from, r.range_to
+                ON CONFLICT (range_from, range_to) DO UPDATE
+                SET isp_id = EXCLUDED.isp_id,
+                    date_created = EXCLUDED.date_created,
+                    is_imported = true
+                """,
+                [timezone.now()],
+            )
+            imported_ranges = cursor.rowcount
+
+        # have the imported ranges picked up by every process
+        transaction.on_commit(self.reset_ip_range_index)
+
+        return created_isps, imported_ranges
+
+    def match_or_create(self, ip_address: str | IPv4Address) -> tuple["ISP", bool]:
         ip_address = IPv4Address(ip_address)
         fallback_obj = None
         # match against the known networks
@@ -100,6 +315,144 @@ class ISPManager(models.Manager):
             )
             return fallback_obj, False
 
+        return self._save_whois_result(network_data)
+
+    def match_or_queue(self, ip_address: str | IPv4Address) -> "ISP | None":
+        """
+        Return the isp of the best known ip range for the address,
+        leaving the whois lookup to the background if the range is unknown or too broad.
+        """
+        if not settings.GEOIP_WHOIS_ASYNC_ENABLED:
+            return self.match_or_create(ip_address)[0]
+
+        ip_address = IPv4Address(ip_address)
+        try:
+            isp, length = self.match(ip_address)
+        except ObjectDoesNotExist:
+            isp = None
+        else:
+            if length <= settings.GEOIP_ACCEPTED_IP_LENGTH:
+                return isp
+            logger.info("existing IP range for %s is too broad: %s", ip_address, length)
+
+        self.queue_whois(ip_address)
+        return isp
+
+    def queue_whois(self, ip_address: IPv4Address) -> None:
+        """
+        Queue a whois lookup for the ip address once the current transaction commits,
+        unless a lookup for the same network is already queued or has recently failed.
+        """
+        from apps.geoip.tasks import resolve_whois
+
+        network = self.get_whois_network(ip_address)
+        redis = cache.client.get_client()
+
+        if redis.exists(f"{settings.GEOIP_WHOIS_FAILED_REDIS_KEY}:{network}"):
+            logger.debug(
+                "skipping whois for %s as it has recently failed for %s", ip_address, network
+            )
+            return
+
+        # the network is only marked pending once the lookup is actually queued,
+        # so that a rolled back transaction does not hold the other lookups back
+        def queue_lookup() -> None:
+            is_queued = redis.set(
+                f"{settings.GEOIP_WHOIS_PENDING_REDIS_KEY}:{network}",
+                str(ip_address),
+                nx=True,
+                ex=settings.GEOIP_WHOIS_PENDING_TTL,
+            )
+            if not is_queued:
+                logger.debug("whois for %s is already queued for %s", ip_address, network)
+                return
+
+            logger.info("queueing whois for %s", ip_address)
+            resolve_whois.delay(str(ip_address))
+
+        transaction.on_commit(queue_lookup)
+
+    def resolve_queued_whois(self, ip_address: str | IPv4Address) -> "ISP | None":
+        """
+        Perform the queued whois lookup for the ip address,
+        unless an acceptable ip range has been resolved for it in the meantime.
+
+        Failed lookups are remembered for the whole network,
+        so the addresses from it are not queued again for a while.
+        """
+        ip_address = IPv4Address(ip_address)
+        network = self.get_whois_network(ip_address)
+        redis = cache.client.get_client()
+
+        try:
+            isp, length = self.match(ip_address)
+        except ObjectDoesNotExist:
+            pass
+        else:
+            if length <= settings.GEOIP_ACCEPTED_IP_LENGTH:
+                logger.info("IP range for %s has been resolved in the meantime", ip_address)
+                redis.delete(f"{settings.GEOIP_WHOIS_PENDING_REDIS_KEY}:{network}")
+                queued_whois_resolved.send(sender=self.model, isp=isp, network=network)
+                return isp
+
+        try:
+            network_data = self._query_ip_address(ip_address)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(
+                "unable to query whois for %s due to %s(%s)",
+                ip_address,
+                type(exc).__name__,
+                exc,
+                exc_info=True,
+            )
+            with redis.pipeline() as pipe:
+                pipe.set(
+                    f"{settings.GEOIP_WHOIS_FAILED_REDIS_KEY}:{network}",
+                    str(ip_address),
+                    ex=settings.GEOIP_WHOIS_FAILED_TTL,
+                )
+                pipe.delete(f"{settings.GEOIP_WHOIS_PENDING_REDIS_KEY}:{network}")
+                pipe.execute()
+            return None
+
+        isp, _ = self._save_whois_result(network_data)
+        redis.delete(f"{settings.GEOIP_WHOIS_PENDING_REDIS_KEY}:{network}")
+        whois_resolved.send(sender=self.model, isp=isp, cidr=network_data.cidr)
+        queued_whois_resolved.send(sender=self.model, isp=isp, network=network)
+
+        return isp
+
+    def forget_queued_whois(self, ip_address: str | IPv4Address) -> None:
+        """
+        Forget the pending whois lookup for the network of the address,
+        so that it can be queued again.
+        """
+        network = self.get_whois_network(IPv4Address(ip_address))
+        redis = cache.client.get_client()
+        redis.delete(f"{settings.GEOIP_WHOIS_PENDING_REDIS_KEY}:{network}")
+
+    def acquire_whois_rate_limit(self) -> bool:
+        """
+        Count a whois lookup against the rate limit shared by all workers.
+        Return whether the lookup fits into the limit for the current second.
+        """
+        redis = cache.client.get_client()
+        key = f"{settings.GEOIP_WHOIS_RATE_LIMIT_REDIS_KEY}:{int(time.time())}"
+        with redis.pipeline() as pipe:
+            pipe.incr(key)
+            pipe.expire(key, 2)
+            count, _ = pipe.execute()
+        return count <= settings.GEOIP_WHOIS_RATE_LIMIT
+
+    def get_whois_network(self, ip_address: str | IPv4Address) -> IPv4Network:
+        """
+        Return the network the whois lookups for the address are queued for.
+        """
+        return IPv4Network(ip_address).supernet(new_prefix=settings.GEOIP_WHOIS_NETWORK_PREFIX)
+
+    def _save_whois_result(self, network_data: WhoisQueryResult) -> tuple["ISP", bool]:
+        from apps.geoip.models import IP
+
         loopkup_items = {}
         # ISP/Organization name
         if network_data.description:
@@ -121,6 +474,7 @@ class ISPManager(models.Manager):
                     network_data.cidr[-1],
                     ip_obj.isp,
                 )
+                self._add_to_ip_range_index(ip_obj.range_from, ip_obj.range_to, ip_obj.isp_id)
                 return ip_obj.isp, created
             # if isp name is empty, return a new entry without further lookup
             if "name" not in loopkup_items:
@@ -138,6 +492,7 @@ class ISPManager(models.Manager):
                 )
             # append the created ip range entry
             isp.ip_set.add(ip_obj)
+            self._add_to_ip_range_index(ip_obj.range_from, ip_obj.range_to, isp.pk)
             return isp, created
 
     def _query_ip_address(self, ip_address: IPv4Address) -> WhoisQueryResult:
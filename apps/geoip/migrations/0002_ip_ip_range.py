@@ -0,0 +1,32 @@
+# Generated by Django 6.1 on 2026-10-19 14:20
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+import apps.utils.db.func
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geoip", "0001_initial"),
+    ]
+
+    operations = [
+        # the stored column is computed for the existing rows while the table is rewritten
+        migrations.AddField(
+            model_name="ip",
+            name="ip_range",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=apps.utils.db.func.Int8Range("range_from", "range_to", bounds="[]"),
+                output_field=django.contrib.postgres.fields.ranges.BigIntegerRangeField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ip",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["ip_range"], name="tracker_ip_range"
+            ),
+        ),
+    ]
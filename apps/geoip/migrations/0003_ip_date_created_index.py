@@ -0,0 +1,16 @@
+# Generated by Django 6.1 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geoip", "0002_ip_ip_range"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ip",
+            index=models.Index(fields=["date_created", "id"], name="tracker_ip_date_created"),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.1 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("geoip", "0003_ip_date_created_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ip",
+            name="is_imported",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RemoveIndex(
+            model_name="ip",
+            name="tracker_ip_date_created",
+        ),
+        migrations.AddIndex(
+            model_name="ip",
+            index=models.Index(
+                condition=models.Q(("is_imported", False)),
+                fields=["date_created", "id"],
+                name="tracker_ip_date_created",
+            ),
+        ),
+    ]
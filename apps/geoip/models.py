@@ -2,19 +2,29 @@ from ipaddress import IPv4Address
 from typing import ClassVar
 
 from django.contrib import admin
+from django.contrib.postgres.fields import BigIntegerRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.db import models
-from django.db.models import F
+from django.db.models import F, Q
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from apps.geoip.managers import IPManager, ISPManager
+from apps.utils.db.func import Int8Range
 
 
 class IP(models.Model):
     isp = models.ForeignKey("ISP", null=True, on_delete=models.CASCADE)
     range_from = models.BigIntegerField()
     range_to = models.BigIntegerField()
+    ip_range = models.GeneratedField(
+        expression=Int8Range("range_from", "range_to", bounds="[]"),
+        output_field=BigIntegerRangeField(),
+        db_persist=True,
+    )
     date_created = models.DateTimeField(auto_now_add=True)
+    # bulk imported ranges are maintained by reimporting, they never expire
+    is_imported = models.BooleanField(default=False)
 
     objects = IPManager()
 
@@ -23,6 +33,12 @@ class IP(models.Model):
         unique_together = (("range_from", "range_to"),)
         indexes: ClassVar[list[models.Index]] = [
             models.Index(F("range_to") - F("range_from"), name="tracker_ip_length"),
+            GistIndex(fields=["ip_range"], name="tracker_ip_range"),
+            models.Index(
+                fields=["date_created", "id"],
+                name="tracker_ip_date_created",
+                condition=Q(is_imported=False),
+            ),
         ]
 
     def __str__(self) -> str:
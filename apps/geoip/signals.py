@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+whois_resolved = Signal()  # providing_args=['isp', 'cidr']
+queued_whois_resolved = Signal()  # providing_args=['isp', 'network']
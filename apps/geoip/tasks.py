@@ -1,18 +1,52 @@
 import logging
+import random
+import time
 
-from apps.geoip.models import IP
-from swat4stats.celery import app
+import celery
+from django.conf import settings
+
+from apps.geoip.models import IP, ISP
+from swat4stats.celery import Queue, app
 
 logger = logging.getLogger(__name__)
 
 
 @app.task(name="delete_expired_ips")
-def delete_expired_ips() -> None:
+def delete_expired_ips(chunk_size: int | None = None, budget: int | None = None) -> None:
     """
     Remove old expired IPs, so they can be renewed with fresh ones.
     """
-    deleted, _ = IP.objects.expired().delete()
+    started_at = time.monotonic()
+    deleted = IP.objects.delete_expired(
+        chunk_size=chunk_size or settings.GEOIP_IP_EXPIRY_CHUNK_SIZE,
+        budget=budget or settings.GEOIP_IP_EXPIRY_BUDGET,
+    )
+    elapsed = time.monotonic() - started_at
     if deleted:
-        logger.info("pruned %d expired ips", deleted)
+        # have the removed ranges renewed without waiting for the index to reload
+        ISP.objects.reset_ip_range_index()
+        logger.info(
+            "pruned %d expired ips in %.2fs (%.0f rows/s)",
+            deleted,
+            elapsed,
+            deleted / elapsed if elapsed else deleted,
+        )
     else:
         logger.info("no expired ips to prune")
+
+
+@app.task(name="resolve_whois", bind=True, max_retries=None, queue=Queue.whois.value)
+def resolve_whois(self: celery.Task, ip_address: str) -> None:
+    """
+    Resolve a queued ip address with whois, keeping within the global rate limit.
+
+    Rate limited lookups are retried with a growing random delay,
+    so that a backlog of lookups is spread over time rather than polling the limit every second.
+    """
+    if not ISP.objects.acquire_whois_rate_limit():
+        if self.request.retries >= settings.GEOIP_WHOIS_RATE_LIMIT_RETRIES:
+            logger.warning("giving up rate limited whois for %s", ip_address)
+            ISP.objects.forget_queued_whois(ip_address)
+            return
+        raise self.retry(countdown=random.randint(1, 2 ** min(self.request.retries + 1, 6)))
+    ISP.objects.resolve_queued_whois(ip_address)
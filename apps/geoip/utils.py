@@ -0,0 +1,152 @@
+import heapq
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterable
+from typing import Any
+
+NO_ISP = -1
+NO_RANGE = -1
+# add up to this number of ranges to the built segments in place, rebuild them otherwise
+MAX_INSERTED_RANGES = 100
+
+
+class IPRangeIndex:
+    """
+    In-memory index of ip ranges that resolves an ip address
+    to the narrowest of the ranges enclosing it.
+
+    The ranges are split into non-overlapping segments by their boundaries,
+    each segment pointing to the narrowest range covering it,
+    so a lookup is a binary search over the segment starts.
+    A few ranges added to the built segments are inserted in place,
+    whereas bulk loads have the segments rebuilt lazily on the next lookup.
+    """
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._range_from)
+
+    def clear(self) -> None:
+        self._range_from = array("q")
+        self._range_to = array("q")
+        self._isp_ids = array("q")
+        self._segment_starts = array("q")
+        self._segment_ranges = array("q")
+        self._is_dirty = False
+        self.last_pk = 0
+        self.version = 0
+        self.loaded_at: float | None = None
+        self.refreshed_at: float | None = None
+        # the isp rows resolved through the index, kept until the index is cleared
+        self.isps: dict[int, Any] = {}
+
+    def add(self, range_from: int, range_to: int, isp_id: int | None) -> None:
+        range_idx = self._append(range_from, range_to, isp_id)
+        self._insert_or_rebuild([range_idx])
+
+    def extend(self, rows: Iterable[tuple[int, int, int, int | None]]) -> int:
+        """
+        Add the ranges loaded from the database, keeping track of the latest seen pk.
+        Return the number of added ranges.
+        """
+        added = []
+        for pk, range_from, range_to, isp_id in rows:
+            added.append(self._append(range_from, range_to, isp_id))
+            self.last_pk = max(self.last_pk, pk)
+        if added:
+            self._insert_or_rebuild(added)
+        return len(added)
+
+    def lookup(self, ip_int: int) -> tuple[int | None, int] | None:
+        """
+        Return a tuple of the isp id and the length of the narrowest range
+        enclosing the ip address, or None if none of the known ranges contains it.
+        """
+        if self._is_dirty:
+            self._build_segments()
+
+        idx = bisect_right(self._segment_starts, ip_int) - 1
+        if idx < 0 or (range_idx := self._segment_ranges[idx]) == NO_RANGE:
+            return None
+
+        isp_id = self._isp_ids[range_idx]
+        length = self._range_to[range_idx] - self._range_from[range_idx]
+        return (None if isp_id == NO_ISP else isp_id), length
+
+    def _append(self, range_from: int, range_to: int, isp_id: int | None) -> int:
+        self._range_from.append(range_from)
+        self._range_to.append(range_to)
+        self._isp_ids.append(NO_ISP if isp_id is None else isp_id)
+        return len(self._range_from) - 1
+
+    def _insert_or_rebuild(self, range_indices: list[int]) -> None:
+        # the segments are yet to be built, or there are too many ranges to insert one by one
+        if self._is_dirty or not self._segment_starts or len(range_indices) > MAX_INSERTED_RANGES:
+            self._is_dirty = True
+            return
+        for range_idx in range_indices:
+            self._insert_segments(range_idx)
+
+    def _insert_segments(self, range_idx: int) -> None:
+        """
+        Split the segments at the boundaries of the range,
+        then point the segments it covers to the range, unless they have a narrower one already.
+        """
+        range_from, range_to = self._range_from[range_idx], self._range_to[range_idx]
+        length = range_to - range_from
+
+        first_idx = self._split_segment_at(range_from)
+        last_idx = self._split_segment_at(range_to + 1)
+
+        for idx in range(first_idx, last_idx):
+            current_idx = self._segment_ranges[idx]
+            if (
+                current_idx == NO_RANGE
+                or self._range_to[current_idx] - self._range_from[current_idx] > length
+            ):
+                self._segment_ranges[idx] = range_idx
+
+    def _split_segment_at(self, boundary: int) -> int:
+        """
+        Make sure a segment starts at the boundary and return its position.
+        """
+        idx = bisect_right(self._segment_starts, boundary) - 1
+        if idx >= 0 and self._segment_starts[idx] == boundary:
+            return idx
+        # the new segment inherits the range of the segment it is split from
+        range_idx = self._segment_ranges[idx] if idx >= 0 else NO_RANGE
+        self._segment_starts.insert(idx + 1, boundary)
+        self._segment_ranges.insert(idx + 1, range_idx)
+        return idx + 1
+
+    def _build_segments(self) -> None:
+        range_from, range_to = self._range_from, self._range_to
+        boundaries = sorted({*range_from, *(value + 1 for value in range_to)})
+        ranges_by_start = sorted(range(len(range_from)), key=range_from.__getitem__)
+
+        segment_starts = array("q")
+        segment_ranges = array("q")
+        # active ranges ordered by their length, the narrowest one on top.
+        # the ranges that have ended are only popped once they come up to the top
+        active = []
+        next_range = 0
+
+        for boundary in boundaries:
+            while next_range < len(ranges_by_start):
+                range_idx = ranges_by_start[next_range]
+                if range_from[range_idx] > boundary:
+                    break
+                heapq.heappush(active, (range_to[range_idx] - range_from[range_idx], range_idx))
+                next_range += 1
+
+            while active and range_to[active[0][1]] < boundary:
+                heapq.heappop(active)
+
+            segment_starts.append(boundary)
+            segment_ranges.append(active[0][1] if active else NO_RANGE)
+
+        self._segment_starts = segment_starts
+        self._segment_ranges = segment_ranges
+        self._is_dirty = False
@@ -13,6 +13,11 @@ class Team(StrEnum):
     suspects = "suspects"
 
 
+class ProfileUpdateQueue(StrEnum):
+    stats = auto()
+    preferences = auto()
+
+
 class GameType(StrEnum):
     barricaded_suspects = "Barricaded Suspects"
     vip_escort = "VIP Escort"
@@ -348,3 +353,9 @@ class GamePlayerHighlight:
 class GameNeighbors:
     prev: Game | None = None
     next: Game | None = None
+
+
+@dataclass
+class StreamServer:
+    id: int
+    enabled: bool
@@ -0,0 +1,37 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+
+from apps.tracker.models import Alias, Player
+from apps.utils.misc import iterate_list
+
+logger = logging.getLogger(__name__)
+
+
+def fill_alias_last_seen() -> None:
+    alias_ids = list(
+        Alias.objects.using("replica")
+        .filter(last_seen_at__isnull=True)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    logger.info("updating last_seen_at for %d aliases", len(alias_ids))
+
+    last_seen_at = (
+        Player.objects.filter(alias=OuterRef("pk"))
+        .order_by()
+        .values("alias")
+        .annotate(last_seen_at=Max("game__date_finished"))
+        .values("last_seen_at")
+    )
+    for chunk_ids in iterate_list(alias_ids, size=1000):
+        Alias.objects.filter(pk__in=chunk_ids).update(last_seen_at=Subquery(last_seen_at))
+        logger.info("updated last_seen_at for aliases up to %d", chunk_ids[-1])
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+        fill_alias_last_seen()
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.tracker.models import GametypeStats, PlayerStats, ServerStats
+from apps.utils.misc import iterate_queryset
+
+logger = logging.getLogger(__name__)
+
+
+def fill_leaderboards(*, year: int, chunk_size: int) -> None:
+    if not settings.TRACKER_LEADERBOARDS_REDIS_ENABLED:
+        logger.info("redis leaderboards are not enabled")
+        return
+
+    for model in [PlayerStats, GametypeStats, ServerStats]:
+        started_at = time.monotonic()
+        deleted = model.objects.clear_leaderboards(year)
+        logger.info("deleted %d %s leaderboard keys for %s", deleted, model.__name__, year)
+
+        fields = list(
+            dict.fromkeys(
+                ["pk", "year", "category", "profile_id", "points", *model.grouping_fields]
+            )
+        )
+        queryset = model.objects.using("replica").filter(year=year)
+        filled = 0
+        for chunk in iterate_queryset(queryset, fields=fields, chunk_size=chunk_size):
+            model.objects.mirror_leaderboards([model(**item) for item in chunk])
+            filled += len(chunk)
+        logger.info(
+            "filled %s leaderboards for %s with %d items in %.2fs",
+            model.__name__,
+            year,
+            filled,
+            time.monotonic() - started_at,
+        )
+
+
+class Command(BaseCommand):
+    help = "Mirror the annual stats into the redis leaderboards"
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--year",
+            type=int,
+            default=None,
+            help="Year to fill the leaderboards for, the current one by default",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of stats items to mirror at once",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+        fill_leaderboards(
+            year=options["year"] or timezone.now().year,
+            chunk_size=options["chunk_size"],
+        )
@@ -0,0 +1,47 @@
+import argparse
+import logging
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from apps.tracker.models import Player
+
+logger = logging.getLogger(__name__)
+
+
+def fill_player_weapon_summary(*, chunk_size: int) -> None:
+    pk_range = Player.objects.using("replica").aggregate(min_pk=Min("pk"), max_pk=Max("pk"))
+    if pk_range["min_pk"] is None:
+        return
+
+    started_at = time.monotonic()
+    updated = 0
+    for from_pk in range(pk_range["min_pk"], pk_range["max_pk"] + 1, chunk_size):
+        to_pk = min(from_pk + chunk_size - 1, pk_range["max_pk"])
+        updated += Player.objects.fill_weapon_summary(from_pk=from_pk, to_pk=to_pk)
+        logger.info(
+            "filled weapon summary for %d players up to %d of %d in %.2fs",
+            updated,
+            to_pk,
+            pk_range["max_pk"],
+            time.monotonic() - started_at,
+        )
+
+
+class Command(BaseCommand):
+    help = "Store the weapon summary of the players created before it was introduced"
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of player ids to fill the summary for at once",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+        fill_player_weapon_summary(chunk_size=options["chunk_size"])
@@ -1,26 +1,45 @@
+import argparse
 import logging
+import time
 from datetime import date
 from typing import Any
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 
+from apps.tracker.managers.stats import get_stats_period_for_year
 from apps.tracker.models import GametypeStats, PlayerStats, Profile, ServerStats
 from apps.tracker.utils.misc import iterate_years
+from apps.utils.misc import iterate_queryset
 
 logger = logging.getLogger(__name__)
 
 
-def fill_profile_stats(queryset: QuerySet[Profile]) -> None:
+def fill_profile_stats(queryset: QuerySet[Profile], *, cohort_size: int | None = None) -> None:
+    """
+    Recompute the annual stats of the profiles for every year they were seen in,
+    aggregating the stats of a cohort of profiles at once.
+    """
+    cohort_size = cohort_size or settings.TRACKER_STATS_COHORT_SIZE
     logger.info("updating stats for %s profiles", queryset.count())
 
     for year_date in iterate_years(date(2007, 1, 1), timezone.now().date()):
         year = year_date.year
-        for profile in queryset.iterator():
-            Profile.objects.update_annual_stats_for_profile(profile=profile, year=year)
+        started_at = time.monotonic()
+        period_from, period_till = get_stats_period_for_year(year)
+        year_queryset = queryset.filter(
+            Q(first_seen_at__isnull=True) | Q(first_seen_at__lte=period_till),
+            Q(last_seen_at__isnull=True) | Q(last_seen_at__gte=period_from),
+        )
+        for chunk in iterate_queryset(year_queryset, fields=["pk"], chunk_size=cohort_size):
+            profiles = list(Profile.objects.filter(pk__in=[item["pk"] for item in chunk]))
+            Profile.objects.update_annual_stats_for_profiles(profiles=profiles, year=year)
+        logger.info("updated %s stats in %.2fs", year, time.monotonic() - started_at)
 
-    queryset.update(stats_updated_at=timezone.now())
+    # the recomputed stats must not have any games folded into them on top
+    queryset.update(stats_updated_at=timezone.now(), stats_last_game_id=None)
 
 
 def calculate_positions() -> None:
@@ -32,10 +51,18 @@ def calculate_positions() -> None:
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "--cohort-size",
+            type=int,
+            default=None,
+            help="Number of profiles to aggregate the stats for at once",
+        )
+
     def handle(self, *args: Any, **options: Any) -> None:
         console = logging.StreamHandler()
         logger.addHandler(console)
 
         queryset = Profile.objects.all()
-        fill_profile_stats(queryset)
+        fill_profile_stats(queryset, cohort_size=options["cohort_size"])
         calculate_positions()
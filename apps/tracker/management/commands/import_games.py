@@ -1,28 +1,156 @@
 import argparse
+import logging
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.test import RequestFactory
-from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
 
-from apps.tracker.views import DataStreamView
+from apps.tracker.tasks.stream import save_game_batch
+from apps.tracker.utils.importer import decode_game_line_at
+
+logger = logging.getLogger(__name__)
+
+# number of lines handed over to a worker at once
+DECODE_CHUNK_SIZE = 100
+
+
+def iterate_lines_at(f: IO[bytes], offset: int) -> Iterator[tuple[int, int, bytes]]:
+    """
+    Yield the non-empty lines of a file along with their start and end byte offsets.
+    """
+    f.seek(offset)
+    for line in f:
+        end = offset + len(line)
+        if line.strip():
+            yield offset, end, line
+        offset = end
+
+
+def import_games(
+    path: str,
+    *,
+    offset: int,
+    workers: int,
+    batch_size: int,
+    server_ip: str,
+) -> None:
+    """
+    Import games from a file of json or julia encoded game data, one game per line.
+
+    The lines are decoded and validated in a pool of processes,
+    whereas the games are saved in batches by the current process.
+    The offset logged after each saved batch can be used to resume the import.
+    The games that fail to save are not retried, but reported along with the decoding errors.
+    """
+    started_at = time.monotonic()
+    line_count = saved_count = error_count = 0
+    batch: list[dict[str, Any]] = []
+    failed_tags: list[str] = []
+    resume_offset = offset
+
+    def save_batch() -> None:
+        nonlocal saved_count, error_count
+        # historical games must not alter the current server details either
+        batch_saved_count, failed = save_game_batch(batch, replay=True, retry_failed=False)
+        saved_count += batch_saved_count
+        for item in failed:
+            error_count += 1
+            failed_tags.append(item["data"]["tag"])
+            logger.error("failed to save game %s", item["data"]["tag"])
+        batch.clear()
+        elapsed = time.monotonic() - started_at
+        logger.info(
+            "saved %d games out of %d lines (%.1f lines/s), resume from offset %d",
+            saved_count,
+            line_count,
+            line_count / elapsed if elapsed else 0,
+            resume_offset,
+        )
+
+    with ExitStack() as stack, Path(path).open("rb") as f:
+        lines = iterate_lines_at(f, offset)
+        if workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = executor.map(
+                decode_game_line_at, lines, chunksize=DECODE_CHUNK_SIZE, buffersize=workers * 2
+            )
+        else:
+            results = map(decode_game_line_at, lines)
+
+        for start, end, data, error in results:
+            line_count += 1
+            resume_offset = end
+
+            if data is None:
+                error_count += 1
+                logger.error("failed to decode game at offset %d: %s", start, error)
+                continue
+
+            batch.append(
+                {
+                    "server_id": None,
+                    "server_ip": server_ip,
+                    "data": data,
+                    "data_received_ts": timezone.now().timestamp(),
+                }
+            )
+            if len(batch) >= batch_size:
+                save_batch()
+
+        if batch:
+            save_batch()
+
+    elapsed = time.monotonic() - started_at
+    logger.info(
+        "imported %d games out of %d lines with %d errors in %.1fs (%.1f lines/s), end offset %d",
+        saved_count,
+        line_count,
+        error_count,
+        elapsed,
+        line_count / elapsed if elapsed else 0,
+        resume_offset,
+    )
+    if failed_tags:
+        logger.error("failed to save %d games: %s", len(failed_tags), ", ".join(failed_tags))
 
 
 class Command(BaseCommand):
     def add_arguments(self, parser: argparse.ArgumentParser) -> None:
-        parser.add_argument("path", help="Path to file with urlencoded games")
+        parser.add_argument("path", help="Path to file with json or urlencoded games, one per line")
+        parser.add_argument(
+            "--offset", type=int, default=0, help="Byte offset to resume the import from"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.process_cpu_count(),
+            help="Number of processes decoding the games",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.TRACKER_GAME_BATCH_SIZE,
+            help="Number of games saved per transaction",
+        )
+        parser.add_argument(
+            "--server-ip", default="127.0.0.1", help="IP address the games are attributed to"
+        )
 
     def handle(self, *args: Any, **options: Any) -> None:
-        path = options["path"]
-        factory = RequestFactory()
-        with Path.open(path) as f:
-            for line in f:
-                if normalized_line := line.strip():
-                    request = factory.post(
-                        "/stream/",
-                        data=normalized_line,
-                        content_type="application/x-www-form-urlencoded",
-                        REAL_REMOTE_ADDR="127.0.0.1",
-                    )
-                    csrf_exempt(DataStreamView.as_view())(request)
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+
+        import_games(
+            options["path"],
+            offset=options["offset"],
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            server_ip=options["server_ip"],
+        )
@@ -0,0 +1,54 @@
+import argparse
+import logging
+from datetime import datetime
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+from pytz import UTC
+
+from apps.tracker.models import GameReport
+from apps.tracker.tasks import replay_game_reports
+from apps.utils.misc import iterate_list
+
+logger = logging.getLogger(__name__)
+
+
+def parse_utc_datetime(value: str) -> datetime:
+    if not (parsed := parse_datetime(value)):
+        msg = f"invalid date: {value}"
+        raise argparse.ArgumentTypeError(msg)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Re-ingest the archived game reports received within the given time range"
+
+    def add_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument("since", type=parse_utc_datetime, help="Received at or after")
+        parser.add_argument("until", type=parse_utc_datetime, help="Received before")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of reports replayed by a single task",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        console = logging.StreamHandler()
+        logger.addHandler(console)
+
+        report_ids = GameReport.objects.get_report_ids(
+            since=options["since"], until=options["until"]
+        )
+        logger.info("replaying %d archived game reports", len(report_ids))
+
+        # the chunks are replayed in parallel by the workers of the heavy queue
+        chunk_count = 0
+        for chunk_ids in iterate_list(report_ids, size=options["chunk_size"]):
+            replay_game_reports.delay(chunk_ids)
+            chunk_count += 1
+
+        logger.info("queued %d chunks of game reports for replay", chunk_count)
@@ -0,0 +1,48 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.db.models.functions import Length
+
+from apps.tracker.models import Alias
+
+
+def count_popular_aliases() -> tuple[int, int, dict[str, int]]:
+    """
+    Count the aliases caught by each of the popular name rules in a single scan.
+
+    Return the total number of aliases,
+    the number of aliases with a name that is too short
+    and the number of aliases caught by each pattern.
+    """
+    pattern_aggregates = {
+        f"pattern_{idx}": Count("pk", filter=Q(name__iregex=pattern))
+        for idx, pattern in enumerate(settings.TRACKER_POPULAR_NAMES)
+    }
+    counts = (
+        Alias.objects.using("replica")
+        .annotate(name_len=Length("name"))
+        .aggregate(
+            total=Count("pk"),
+            short=Count("pk", filter=Q(name_len__lt=settings.TRACKER_MIN_NAME_LEN)),
+            **pattern_aggregates,
+        )
+    )
+    pattern_counts = {
+        pattern: counts[f"pattern_{idx}"]
+        for idx, pattern in enumerate(settings.TRACKER_POPULAR_NAMES)
+    }
+    return counts["total"], counts["short"], pattern_counts
+
+
+class Command(BaseCommand):
+    help = "Report the number of existing aliases caught by each popular name pattern"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        total, short, pattern_counts = count_popular_aliases()
+
+        self.stdout.write(f"{total} aliases")
+        self.stdout.write(f"{short}\tshorter than {settings.TRACKER_MIN_NAME_LEN} characters")
+        for pattern, count in sorted(pattern_counts.items(), key=lambda item: -item[1]):
+            self.stdout.write(f"{count}\t{pattern}")
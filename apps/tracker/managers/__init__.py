@@ -4,12 +4,14 @@ from .loadout import LoadoutManager
 from .map import MapManager
 from .player import PlayerManager, PlayerQuerySet
 from .profile import ProfileManager, ProfileQuerySet
+from .report import GameReportManager
 from .server import ServerManager, ServerQuerySet
 from .stats import ServerStatsManager, StatsManager
 
 __all__ = [
     "AliasManager",
     "GameManager",
+    "GameReportManager",
     "LoadoutManager",
     "MapManager",
     "PlayerManager",
@@ -1,8 +1,11 @@
 import logging
-from ipaddress import IPv4Address
+from datetime import datetime
+from ipaddress import IPv4Address, IPv4Network
 from typing import TYPE_CHECKING
 
+from django.conf import settings
 from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
 from django.db.models import F, Q
@@ -36,7 +39,7 @@ class AliasManager(models.Manager):
         if not name:
             raise ValueError("Empty name")
 
-        isp, _ = ISP.objects.match_or_create(ip_address)
+        isp = ISP.objects.match_or_queue(ip_address)
 
         # attempt to match an existing alias by name+isp pair
         match_kwargs = {
@@ -80,6 +83,19 @@ class AliasManager(models.Manager):
         )
 
         new_alias = self.create(name=name, profile=profile, isp=isp)
+
+        # the new alias may change the outcome of the cached profile matches.
+        # invalidate them straight away for the current transaction and once again on commit
+        def forget_profile_matches() -> None:
+            Profile.objects.forget_match_smart_results(name=name, ip_address=ip_address)
+
+        forget_profile_matches()
+        transaction.on_commit(forget_profile_matches)
+
+        # the isp is assigned to the alias once the pending whois lookup is resolved.
+        # the alias is remembered before the lookup is queued on commit
+        if isp is None and settings.GEOIP_WHOIS_ASYNC_ENABLED:
+            self.add_pending_isp(new_alias.pk, ip_address)
         # fmt: off
         logger.info(
             "created alias %s (%d) for profile %s (%d)",
@@ -110,6 +126,61 @@ class AliasManager(models.Manager):
 
         return new_alias
 
+    def update_last_seen(self, *alias_ids: int, seen_at: datetime) -> int:
+        """
+        Move the last seen date of the aliases forward to the given date.
+        """
+        return self.filter(
+            Q(pk__in=alias_ids),
+            Q(last_seen_at__isnull=True) | Q(last_seen_at__lt=seen_at),
+        ).update(last_seen_at=seen_at)
+
+    def add_pending_isp(self, alias_id: int, ip_address: str | IPv4Address) -> None:
+        """
+        Remember the alias created without an isp,
+        so it's assigned one once the whois lookup for its network is resolved.
+        """
+        key = self._get_pending_isp_key(ISP.objects.get_whois_network(ip_address))
+        redis = cache.client.get_client()
+        with redis.pipeline() as pipe:
+            pipe.sadd(key, alias_id)
+            pipe.expire(key, settings.GEOIP_WHOIS_PENDING_TTL)
+            pipe.execute()
+
+    def update_resolved_isp(self, isp: ISP, network: IPv4Network) -> int:
+        """
+        Assign the resolved isp to the aliases created without one
+        while the whois lookup for the network was pending.
+        """
+        from apps.tracker.models import Profile
+
+        key = self._get_pending_isp_key(network)
+        redis = cache.client.get_client()
+        with redis.pipeline() as pipe:
+            pipe.smembers(key)
+            pipe.delete(key)
+            alias_ids, _ = pipe.execute()
+        if not alias_ids:
+            return 0
+
+        aliases = list(
+            self.filter(pk__in=[int(pk) for pk in alias_ids], isp__isnull=True).values_list(
+                "pk", "name"
+            )
+        )
+        if not aliases:
+            return 0
+
+        updated = self.filter(pk__in=[pk for pk, _ in aliases], isp__isnull=True).update(isp=isp)
+        # the new isp changes the outcome of the name+isp profile matches
+        for name in {name for _, name in aliases}:
+            Profile.objects.forget_match_smart_results(name=name)
+
+        return updated
+
+    def _get_pending_isp_key(self, network: IPv4Network) -> str:
+        return f"{settings.TRACKER_ALIAS_PENDING_ISP_REDIS_KEY}:{network}"
+
     @transaction.atomic
     def update_search_vector(self, *alias_ids: int) -> None:
         logger.info("updating search vector for %d aliases", len(alias_ids))
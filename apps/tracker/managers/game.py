@@ -1,9 +1,14 @@
+import json
 import logging
 import math
 from datetime import datetime
 from typing import TYPE_CHECKING, Any, ClassVar
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, Expression, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils.translation import gettext_lazy as _
 
 from apps.tracker.entities import (
@@ -26,14 +31,74 @@ from apps.tracker.schema import (
     weapon_reversed,
 )
 from apps.tracker.utils.misc import force_name
+from apps.utils.misc import dumps
 
 if TYPE_CHECKING:
+    from redis.lock import Lock
+
     from apps.tracker.models import Game, Player, Server  # noqa: F401
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_game_stats_updates_for_games(
+    game_ids: list[int], *, ref_field: str
+) -> dict[str, Expression]:
+    """
+    Prepare the update expressions for the denormalized game count, first and latest game
+    of the objects (servers, maps) the given games have been played on.
+
+    Every given game is counted, unless it is already the latest game of the object,
+    so the rest of the games must not be applied more than once.
+    The first and the latest games are picked by the time they have finished at,
+    so that the games applied out of order do not move them the wrong way.
+
+    :param game_ids: Ids of the games to apply
+    :param ref_field: Game field referring to the updated object, e.g. server_id
+    """
+    from apps.tracker.models import Game
+
+    new_games = Game.objects.filter(pk__in=game_ids, **{ref_field: OuterRef("pk")}).exclude(
+        pk=Coalesce(OuterRef("latest_game_id"), Value(0), output_field=models.IntegerField())
+    )
+    first_game = new_games.order_by("date_finished", "pk")[:1]
+    latest_game = new_games.order_by("-date_finished", "-pk")[:1]
+    new_game_count = new_games.order_by().values(ref_field).annotate(cnt=Count("pk")).values("cnt")
+
+    first_game_played_at = Subquery(first_game.values("date_finished"))
+    latest_game_played_at = Subquery(latest_game.values("date_finished"))
+
+    return {
+        "game_count": F("game_count") + Coalesce(Subquery(new_game_count), Value(0)),
+        "first_game": Case(
+            When(
+                Q(first_game__isnull=True) | Q(first_game_played_at__gt=first_game_played_at),
+                then=Coalesce(
+                    Subquery(first_game.values("pk")),
+                    F("first_game_id"),
+                    output_field=models.IntegerField(),
+                ),
+            ),
+            default=F("first_game_id"),
+        ),
+        # postgres ignores nulls in least() and greatest()
+        "first_game_played_at": Least(F("first_game_played_at"), first_game_played_at),
+        "latest_game": Case(
+            When(
+                Q(latest_game__isnull=True) | Q(latest_game_played_at__lte=latest_game_played_at),
+                then=Coalesce(
+                    Subquery(latest_game.values("pk")),
+                    F("latest_game_id"),
+                    output_field=models.IntegerField(),
+                ),
+            ),
+            default=F("latest_game_id"),
+        ),
+        "latest_game_played_at": Greatest(F("latest_game_played_at"), latest_game_played_at),
+    }
+
+
 class GameManager(models.Manager):
     highlights: ClassVar[list[str, str]] = [
         (_("Hostage Crisis"), _("%(points)s VIP rescues"), "vip_rescues", 2),
@@ -75,6 +140,142 @@ class GameManager(models.Manager):
         (-math.inf, CoopRank.menace),
     ]
 
+    def enqueue_game_data(
+        self,
+        *,
+        server_id: int | None,
+        server_ip: str,
+        data: dict[str, Any],
+        data_received_ts: float,
+    ) -> None:
+        """
+        Queue validated game data for batched saving.
+
+        The queued items mirror the arguments of the process_game_data task.
+        """
+        redis = cache.client.get_client()
+        item = {
+            "server_id": server_id,
+            "server_ip": server_ip,
+            "data": data,
+            "data_received_ts": data_received_ts,
+        }
+        redis.rpush(settings.TRACKER_GAME_BATCH_REDIS_KEY, dumps(item).encode())
+
+    def pop_queued_game_data(self, count: int) -> list[dict[str, Any]]:
+        """
+        Move up to `count` items from the head of the game data queue
+        to the processing list and return them.
+
+        The items stay in the processing list until acknowledged with ack_queued_game_data,
+        so the items left behind by a worker that has died are returned again on the next call.
+        """
+        redis = cache.client.get_client()
+        processing_key = self._get_processing_game_data_key()
+
+        if items := redis.lrange(processing_key, 0, -1):
+            logger.info("picking up %d unacknowledged queued games", len(items))
+        else:
+            with redis.pipeline() as pipe:
+                for _ in range(count):
+                    pipe.lmove(
+                        settings.TRACKER_GAME_BATCH_REDIS_KEY, processing_key, "LEFT", "RIGHT"
+                    )
+                items = [item for item in pipe.execute() if item is not None]
+
+        return [json.loads(item.decode()) for item in items]
+
+    def ack_queued_game_data(self) -> None:
+        """
+        Acknowledge the game data items returned by pop_queued_game_data,
+        once they have been saved or handed over for a retry.
+        """
+        redis = cache.client.get_client()
+        redis.delete(self._get_processing_game_data_key())
+
+    def get_game_queue_lock(self) -> "Lock":
+        """
+        Return the lock guarding the game data queue against concurrent consumers.
+        """
+        redis = cache.client.get_client()
+        return redis.lock(
+            f"{settings.TRACKER_GAME_BATCH_REDIS_KEY}:lock",
+            timeout=settings.TRACKER_GAME_BATCH_LOCK_TTL,
+        )
+
+    def _get_processing_game_data_key(self) -> str:
+        return f"{settings.TRACKER_GAME_BATCH_REDIS_KEY}:processing"
+
+    def get_saved_game_tags(self, *tags: str) -> set[str]:
+        """
+        Return the tags of the recently saved games among the given tags.
+
+        The tags are looked up in redis only,
+        so the games that have been saved long ago are not detected.
+        """
+        redis = cache.client.get_client()
+
+        with redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.exists(f"{settings.TRACKER_GAME_TAG_REDIS_KEY}:{tag}")
+            exist = pipe.execute()
+
+        return {tag for tag, tag_exists in zip(tags, exist, strict=True) if tag_exists}
+
+    def is_game_tag_saved(self, tag: str) -> bool:
+        return bool(self.get_saved_game_tags(tag))
+
+    def remember_saved_game_tags(self, *tags: str) -> None:
+        """
+        Remember the tags of saved games, so that repeated reports can be told apart.
+        """
+        redis = cache.client.get_client()
+
+        with redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.set(
+                    f"{settings.TRACKER_GAME_TAG_REDIS_KEY}:{tag}",
+                    1,
+                    ex=settings.TRACKER_GAME_TAG_TTL,
+                )
+            pipe.execute()
+
+    def add_pending_games(self, *game_ids: int) -> None:
+        """
+        Mark saved games as pending the update of their related servers, maps and profiles.
+        """
+        redis = cache.client.get_client()
+        redis.zadd(
+            settings.TRACKER_PENDING_GAMES_REDIS_KEY, {game_id: game_id for game_id in game_ids}
+        )
+
+    def get_pending_games(self, count: int) -> list[int]:
+        """
+        Return the ids of up to `count` pending games, oldest first.
+
+        The games remain pending until acknowledged with ack_pending_games.
+        """
+        redis = cache.client.get_client()
+        items = redis.zrange(settings.TRACKER_PENDING_GAMES_REDIS_KEY, 0, count - 1)
+        return [int(game_id) for game_id in items]
+
+    def ack_pending_games(self, *game_ids: int) -> None:
+        """
+        Remove the games that their servers, maps and profiles have been updated with.
+        """
+        redis = cache.client.get_client()
+        redis.zrem(settings.TRACKER_PENDING_GAMES_REDIS_KEY, *game_ids)
+
+    def get_pending_games_lock(self) -> "Lock":
+        """
+        Return the lock guarding the pending games against concurrent consumers.
+        """
+        redis = cache.client.get_client()
+        return redis.lock(
+            f"{settings.TRACKER_PENDING_GAMES_REDIS_KEY}:lock",
+            timeout=settings.TRACKER_PENDING_GAMES_LOCK_TTL,
+        )
+
     @transaction.atomic
     def create_game(
         self,
@@ -188,7 +389,7 @@ class GameManager(models.Manager):
 
     def _create_game_players(self, game: "Game", players: list[dict[str, Any]]) -> None:
         """Process round players"""
-        from apps.tracker.models import Alias, Loadout, Player, Weapon
+        from apps.tracker.models import Alias, Loadout, Player, Profile, Weapon
 
         fields = [
             "team",
@@ -227,10 +428,17 @@ class GameManager(models.Manager):
             "coop_toc_reports",
         ]
 
+        alias_ids = []
+        alias_names = set()
+        ip_addresses = set()
+
         for player_item in players:
             # handle empty and coloured names
             alias_name = force_name(player_item["name"], player_item["ip"])
             alias, _ = Alias.objects.match_or_create(name=alias_name, ip_address=player_item["ip"])
+            alias_ids.append(alias.pk)
+            alias_names.add(alias.name)
+            ip_addresses.add(player_item["ip"])
             player_obj = Player(
                 game=game,
                 alias=alias,
@@ -250,29 +458,47 @@ class GameManager(models.Manager):
                 if "coop_status" in player_item
                 else 0
             )
-            player_obj.save()
 
             # don't create weapons for coop games
+            weapons = []
             if not game.is_coop_game and player_item.get("weapons"):
-                Weapon.objects.bulk_create(
-                    [
-                        Weapon(
-                            player=player_obj,
-                            name=weapon["name"],
-                            name_legacy=weapon_reversed[weapon["name"]],
-                            time=weapon["time"],
-                            shots=weapon["shots"],
-                            hits=weapon["hits"],
-                            teamhits=weapon["teamhits"],
-                            kills=weapon["kills"],
-                            teamkills=weapon["teamkills"],
-                            # convert cm to meters
-                            distance=weapon["distance"] / 100,
-                        )
-                        for weapon in player_item["weapons"]
-                        if weapon["name"] != -1
-                    ]
+                weapons = [
+                    Weapon(
+                        name=weapon["name"],
+                        name_legacy=weapon_reversed[weapon["name"]],
+                        time=weapon["time"],
+                        shots=weapon["shots"],
+                        hits=weapon["hits"],
+                        teamhits=weapon["teamhits"],
+                        kills=weapon["kills"],
+                        teamkills=weapon["teamkills"],
+                        # convert cm to meters
+                        distance=weapon["distance"] / 100,
+                    )
+                    for weapon in player_item["weapons"]
+                    if weapon["name"] != -1
+                ]
+            for field, value in Player.objects.summarize_weapons(weapons).items():
+                setattr(player_obj, field, value)
+            player_obj.save()
+
+            if weapons:
+                for weapon in weapons:
+                    weapon.player = player_obj
+                Weapon.objects.bulk_create(weapons)
+
+        # keep the recent profile lookups aware of the players of the current game
+        if alias_ids:
+            Alias.objects.update_last_seen(*alias_ids, seen_at=game.date_finished)
+
+        # the players make their aliases recent and their ips known to the aliases,
+        # which may change the outcome of the cached profile matches
+        if alias_names or ip_addresses:
+            transaction.on_commit(
+                lambda: Profile.objects.forget_many_match_smart_results(
+                    names=alias_names, ip_addresses=ip_addresses
                 )
+            )
 
     @classmethod
     def get_player_with_max_points(cls, game: "Game", field: str) -> GameTopFieldPlayer | None:
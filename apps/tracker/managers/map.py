@@ -6,16 +6,17 @@ from django.conf import settings
 from django.contrib.staticfiles.finders import find as find_static_file
 from django.contrib.staticfiles.storage import staticfiles_storage
 from django.db import models, transaction
-from django.db.models import Count, F, Q
+from django.db.models import Count, Q, Subquery
 from django.template.exceptions import TemplateDoesNotExist
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.text import slugify
 
+from apps.tracker.managers.game import get_game_stats_updates_for_games
 from apps.utils.misc import iterate_list
 
 if TYPE_CHECKING:
-    from apps.tracker.models import Game, Map
+    from apps.tracker.models import Map
 
 
 logger = logging.getLogger(__name__)
@@ -26,19 +27,17 @@ class MapManager(models.Manager):
         obj, _ = self.get_or_create(name=name, defaults={"slug": slugify(name)})
         return obj
 
-    def update_game_stats_with_game(self, game: "Game") -> None:
-        update_qs = self.filter(pk=game.map_id)
+    def update_game_stats_with_games(self, *game_ids: int) -> int:
+        """
+        Update the denormalized game stats of the maps the games have been played on
+        with a single set-based update.
+        """
+        from apps.tracker.models import Game
 
-        first_game_update_qs = update_qs.filter(first_game__isnull=True)
-        last_game_update_qs = update_qs.filter(~Q(latest_game=game.pk))
+        map_ids = Game.objects.filter(pk__in=game_ids).values("map_id")
+        updates = get_game_stats_updates_for_games(list(game_ids), ref_field="map_id")
 
-        with transaction.atomic():
-            first_game_update_qs.update(first_game=game, first_game_played_at=game.date_finished)
-            last_game_update_qs.update(
-                game_count=F("game_count") + 1,
-                latest_game=game,
-                latest_game_played_at=game.date_finished,
-            )
+        return self.filter(pk__in=Subquery(map_ids)).update(**updates)
 
     def update_details(self, *, version: str, chunk_size: int = 1000) -> None:
         map_ids_to_update = list(
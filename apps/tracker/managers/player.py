@@ -2,45 +2,48 @@
 import logging
 from collections import defaultdict
 from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
 from functools import partial
-from typing import TYPE_CHECKING, ClassVar
+from typing import TYPE_CHECKING, Any, ClassVar
 
 from django.conf import settings
-from django.db import models
-from django.db.models import Case, Count, Expression, Max, Min, Q, QuerySet, Sum, Value, When
+from django.db import connection, connections, models
+from django.db.models import Case, Count, Expression, F, Max, Min, Q, QuerySet, Sum, Value, When
 from django.db.models.functions import Cast, NullIf, Round
 
 from apps.tracker.entities import Equipment, GameOutcome, GameType, Team
+from apps.utils.db.compiler import GroupingSetsCompiler
+from apps.utils.db.func import Grouping
 
 if TYPE_CHECKING:
-    from apps.tracker.models import Player, Profile, Server
+    from apps.tracker.models import Player, Profile, Server, Weapon
 
 logger = logging.getLogger(__name__)
 
-q_qualified_weapons = Q(
-    weapon__name__in=[
-        Equipment.m4_super90,
-        Equipment.nova_pump,
-        Equipment.shotgun,
-        Equipment.colt_m4a1_carbine,
-        Equipment.ak_47_machinegun,
-        Equipment.gb36s_assault_rifle,
-        Equipment.gal_sub_machinegun,
-        Equipment._9mm_smg,
-        Equipment.suppressed_9mm_smg,
-        Equipment._45_smg,
-        Equipment.m1911_handgun,
-        Equipment._9mm_handgun,
-        Equipment.colt_python,
-        Equipment.vip_colt_m1911_handgun,
-        Equipment.colt_accurized_rifle,
-        Equipment._5_56mm_light_machine_gun,
-        Equipment._5_7x28mm_submachine_gun,
-        Equipment.mark_19_semi_automatic_pistol,
-        Equipment._9mm_machine_pistol,
-    ]
-)
-q_qualified_grenades = Q(weapon__name__in=Equipment.grenades())
+RATIO_PRECISION = Decimal("0.0001")
+
+# weapons qualified for accuracy related stats
+qualified_weapon_names = [
+    Equipment.m4_super90,
+    Equipment.nova_pump,
+    Equipment.shotgun,
+    Equipment.colt_m4a1_carbine,
+    Equipment.ak_47_machinegun,
+    Equipment.gb36s_assault_rifle,
+    Equipment.gal_sub_machinegun,
+    Equipment._9mm_smg,
+    Equipment.suppressed_9mm_smg,
+    Equipment._45_smg,
+    Equipment.m1911_handgun,
+    Equipment._9mm_handgun,
+    Equipment.colt_python,
+    Equipment.vip_colt_m1911_handgun,
+    Equipment.colt_accurized_rifle,
+    Equipment._5_56mm_light_machine_gun,
+    Equipment._5_7x28mm_submachine_gun,
+    Equipment.mark_19_semi_automatic_pistol,
+    Equipment._9mm_machine_pistol,
+]
 
 q_versus_modes = Q(game__gametype__in=GameType.versus_modes())
 q_coop_modes = Q(game__gametype=GameType.co_op)
@@ -63,14 +66,15 @@ class PlayerQuerySet(models.QuerySet):
     _agg_player_games = Count(Case(When(q_versus_modes, then="game")), distinct=True)
     _agg_player_kills = Sum(Case(When(q_versus_modes, then="kills")))
     _agg_player_deaths = Sum(Case(When(q_versus_modes, then="deaths")))
-    _agg_player_weapon_shots = Sum(Case(When(q_qualified_weapons, then="weapon__shots")))
-    _agg_player_weapon_hits = Sum(Case(When(q_qualified_weapons, then="weapon__hits")))
-    _agg_player_weapon_kills = Sum(Case(When(q_qualified_weapons, then="weapon__kills")))
-    _agg_player_weapon_teamhits = Sum(Case(When(q_qualified_weapons, then="weapon__teamhits")))
-    _agg_player_grenade_shots = Sum(Case(When(q_qualified_grenades, then="weapon__shots")))
-    _agg_player_grenade_hits = Sum(Case(When(q_qualified_grenades, then="weapon__hits")))
-    _agg_player_grenade_kills = Sum(Case(When(q_qualified_grenades, then="weapon__kills")))
-    _agg_player_grenade_teamhits = Sum(Case(When(q_qualified_grenades, then="weapon__teamhits")))
+    # the weapon stats are summarized per player, so the weapons need not be joined
+    _agg_player_weapon_shots = Sum("weapon_shots")
+    _agg_player_weapon_hits = Sum("weapon_hits")
+    _agg_player_weapon_kills = Sum("weapon_kills")
+    _agg_player_weapon_teamhits = Sum("weapon_teamhits")
+    _agg_player_grenade_shots = Sum("grenade_shots")
+    _agg_player_grenade_hits = Sum("grenade_hits")
+    _agg_player_grenade_kills = Sum("grenade_kills")
+    _agg_player_grenade_teamhits = Sum("grenade_teamhits")
 
     # main player stats - no grouping
     player_aggregates: ClassVar[list[dict[str, Expression]]] = [
@@ -257,6 +261,88 @@ class PlayerQuerySet(models.QuerySet):
         },
     ]
 
+    # ratios mapped to the stats they are derived from, along with the multiplier
+    ratio_components: ClassVar[dict[str, tuple[str, str, int]]] = {
+        "spm_ratio": ("score", "time", 60),
+        "spr_ratio": ("score", "games", 1),
+        "kd_ratio": ("kills", "deaths", 1),
+        "weapon_hit_ratio": ("weapon_hits", "weapon_shots", 1),
+        "weapon_kill_ratio": ("weapon_kills", "weapon_shots", 1),
+        "weapon_teamhit_ratio": ("weapon_teamhits", "weapon_shots", 1),
+        "grenade_hit_ratio": ("grenade_hits", "grenade_shots", 1),
+        "grenade_teamhit_ratio": ("grenade_teamhits", "grenade_shots", 1),
+        "hit_ratio": ("hits", "shots", 1),
+        "kill_ratio": ("kills", "shots", 1),
+        "teamhit_ratio": ("teamhits", "shots", 1),
+    }
+
+    # stats that may add up to zero or less, in which case they are not stored at all
+    signed_stats: ClassVar[set[str]] = {"score", "coop_score"}
+
+    @classmethod
+    def can_fold_stats(
+        cls,
+        stored: dict[str, int | float],
+        delta: dict[str, int | float],
+    ) -> bool:
+        """
+        Tell whether the stats aggregated over a number of new games
+        can be folded into the previously stored stats.
+
+        Zero or negative points are never stored, so a missing signed stat
+        is not necessarily zero, and a signed stat dropping to zero or below
+        would leave its outdated points behind.
+        """
+        for key in cls.signed_stats & delta.keys():
+            if not (delta_value := delta[key]):
+                continue
+            if (stored_value := stored.get(key)) is None or stored_value + delta_value <= 0:
+                return False
+        return True
+
+    @classmethod
+    def fold_stats(
+        cls,
+        aggregate_groups: list[dict[str, models.Aggregate]],
+        stored: dict[str, int | float],
+        delta: dict[str, int | float],
+    ) -> dict[str, int | float]:
+        """
+        Fold the stats aggregated over a number of new games into the previously stored stats.
+
+        Sums and counts are added up, maxima and minima are compared,
+        whereas ratios are recalculated from the folded stats they are derived from.
+        """
+        folded = {}
+
+        for group in aggregate_groups:
+            for key, aggregate in group.items():
+                if key in cls.ratio_components:
+                    continue
+                stored_value, delta_value = stored.get(key), delta.get(key)
+                if stored_value is None or delta_value is None:
+                    folded[key] = delta_value if stored_value is None else stored_value
+                elif isinstance(aggregate, Max):
+                    folded[key] = max(stored_value, delta_value)
+                elif isinstance(aggregate, Min):
+                    folded[key] = min(stored_value, delta_value)
+                else:
+                    folded[key] = stored_value + delta_value
+
+        for group in aggregate_groups:
+            for key in group.keys() & cls.ratio_components.keys():
+                numerator, denominator, multiplier = cls.ratio_components[key]
+                if not folded.get(denominator):
+                    folded[key] = None
+                    continue
+                ratio = (folded.get(numerator) or 0) / folded[denominator] * multiplier
+                # mimic the rounding of float values in postgres
+                folded[key] = float(
+                    Decimal(format(ratio, ".15g")).quantize(RATIO_PRECISION, ROUND_HALF_UP)
+                )
+
+        return folded
+
     def with_qualified_games(self) -> QuerySet["Player"]:
         """
         Include game rounds that have enough players to be qualified (except for CO-OP games)
@@ -294,6 +380,136 @@ class PlayerQuerySet(models.QuerySet):
     def aggregate_stats_by_gametype(self) -> dict[str, dict[str, int | float]]:
         return self.aggregate_stats_groups_by(self.gametype_aggregates, group_by="game__gametype")
 
+    def aggregate_annual_stats(self) -> dict[str, dict]:
+        """
+        Aggregate the player stats along with the stats by map, gametype, server and weapon.
+
+        Instead of a scan per breakdown, the stats are aggregated with GROUPING SETS
+        in a statement over the games and another one over the weapons,
+        as joining the weapons would multiply the player rows.
+        The player weapon stats come from the summary stored with every player.
+        The stats are split back into the shapes of the respective aggregate_* methods.
+        """
+        return self.aggregate_annual_stats_by(partition_by=None).get(
+            None, self._empty_annual_stats()
+        )
+
+    def aggregate_annual_stats_by(self, *, partition_by: str | None) -> dict[Any, dict[str, dict]]:
+        """
+        Same as aggregate_annual_stats, but aggregate the stats
+        for every value of the partition field, e.g. a profile id.
+        """
+        queryset = self.annotate(
+            _versus=Case(
+                When(q_versus_modes, then=Value(True)),  # noqa: FBT003
+                default=Value(False),  # noqa: FBT003
+                output_field=models.BooleanField(),
+            )
+        )
+        per_game_stats = queryset.aggregate_grouping_sets(
+            {
+                "player": ("_versus", self.player_aggregates),
+                "map": ("game__map_id", self.map_aggregates),
+                "gametype": ("game__gametype", self.gametype_aggregates),
+                "server": ("game__server_id", self.server_aggregates),
+            },
+            partition_by=partition_by,
+        )
+        per_weapon_stats = queryset.filter(q_versus_modes).aggregate_grouping_sets(
+            {
+                "weapon": ("weapon__name", self.weapon_aggregates),
+            },
+            partition_by=partition_by,
+        )
+
+        result = defaultdict(self._empty_annual_stats)
+        for partition_value, grouped_stats in per_game_stats.items():
+            annual_stats = result[partition_value]
+            annual_stats["player"] = grouped_stats["player"].get(True, {})
+            annual_stats["map"] = grouped_stats["map"]
+            annual_stats["gametype"] = grouped_stats["gametype"]
+            annual_stats["server"] = grouped_stats["server"]
+        for partition_value, grouped_stats in per_weapon_stats.items():
+            result[partition_value]["weapon"] = grouped_stats["weapon"]
+        return dict(result)
+
+    def aggregate_grouping_sets(
+        self,
+        grouping_sets: dict[str, tuple[str, list[dict[str, models.Aggregate]]]],
+        *,
+        partition_by: str | None = None,
+    ) -> dict[Any, dict[str, dict[Any, dict[str, int | float]]]]:
+        """
+        Aggregate the stats for a number of grouping sets in a single statement.
+
+        Each named grouping set consists of a single grouping field
+        and the aggregate groups to aggregate it with.
+        Every grouping set is additionally grouped by the partition field, if any.
+        Return the stats per grouping value for every grouping set per partition value.
+        """
+        grouping_fields = [field for field, _ in grouping_sets.values()]
+        # the grouping values are selected under the names of their grouping sets
+        selected = {f"_{name}": F(field) for name, (field, _) in grouping_sets.items()}
+        if partition_by:
+            selected["_partition"] = F(partition_by)
+        annotations = {
+            f"_{name}_{key}": aggregate
+            for name, (_, aggregate_groups) in grouping_sets.items()
+            for group in aggregate_groups
+            for key, aggregate in group.items()
+        }
+        queryset = (
+            self.order_by()
+            .values(**selected)
+            .annotate(_grouping=Grouping(*grouping_fields), **annotations)
+        )
+        query = queryset.query
+
+        # one grouping set per grouping field, additionally grouped by the partition field
+        partition_exprs = [query.resolve_ref("_partition")] if partition_by else []
+        compiler = GroupingSetsCompiler(
+            query,
+            connections[queryset.db],
+            queryset.db,
+            grouping_sets=[
+                [*partition_exprs, query.resolve_ref(f"_{name}")] for name in grouping_sets
+            ],
+        )
+        sql, params = compiler.as_sql()
+
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            names = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+
+        if converters := compiler.get_converters([expr for expr, _, _ in compiler.select]):
+            rows = compiler.apply_converters(rows, converters)
+
+        # a row aggregated over a grouping set is grouped by its field only
+        all_fields_mask = (1 << len(grouping_fields)) - 1
+        set_for_mask = {
+            all_fields_mask ^ (1 << (len(grouping_fields) - 1 - idx)): name
+            for idx, name in enumerate(grouping_sets)
+        }
+
+        result = defaultdict(lambda: {name: {} for name in grouping_sets})
+        for row in rows:
+            item = dict(zip(names, row, strict=True))
+            name = set_for_mask[item["_grouping"]]
+            partition_value = item["_partition"] if partition_by else None
+            prefix = f"_{name}_"
+            result[partition_value][name][item[f"_{name}"]] = {
+                key.removeprefix(prefix): value
+                for key, value in item.items()
+                if key.startswith(prefix)
+            }
+
+        return dict(result)
+
+    @classmethod
+    def _empty_annual_stats(cls) -> dict[str, dict]:
+        return {"player": {}, "map": {}, "gametype": {}, "server": {}, "weapon": {}}
+
     def aggregate_stats_groups(
         self, aggregate_groups: list[dict[str, models.Aggregate]]
     ) -> dict[str, int | float]:
@@ -359,3 +575,70 @@ class PlayerManager(models.Manager):
             .get_queryset()
             .select_related("loadout", "alias", "alias__isp", "alias__profile")
         )
+
+    @classmethod
+    def summarize_weapons(cls, weapons: list["Weapon"]) -> dict[str, int | None]:
+        """
+        Sum up the stats of the qualified weapons and the grenades used by a player.
+
+        The sums are left empty if none of the weapons qualify,
+        same as aggregating over the weapons would.
+        """
+        summary = {}
+        for prefix, names in [
+            ("weapon", set(qualified_weapon_names)),
+            ("grenade", set(Equipment.grenades())),
+        ]:
+            matching_weapons = [weapon for weapon in weapons if weapon.name in names]
+            for field in ("shots", "hits", "kills", "teamhits"):
+                summary[f"{prefix}_{field}"] = (
+                    sum(getattr(weapon, field) for weapon in matching_weapons)
+                    if matching_weapons
+                    else None
+                )
+        return summary
+
+    def fill_weapon_summary(self, *, from_pk: int, to_pk: int) -> int:
+        """
+        Store the weapon summary of the players within the range of ids.
+        Return the number of updated players.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE tracker_player p
+                SET weapon_shots = s.weapon_shots,
+                    weapon_hits = s.weapon_hits,
+                    weapon_kills = s.weapon_kills,
+                    weapon_teamhits = s.weapon_teamhits,
+                    grenade_shots = s.grenade_shots,
+                    grenade_hits = s.grenade_hits,
+                    grenade_kills = s.grenade_kills,
+                    grenade_teamhits = s.grenade_teamhits
+                FROM (
+                    SELECT
+                        player_id,
+                        SUM(shots) FILTER (WHERE name_enum::text = ANY(%(weapons)s)) weapon_shots,
+                        SUM(hits) FILTER (WHERE name_enum::text = ANY(%(weapons)s)) weapon_hits,
+                        SUM(kills) FILTER (WHERE name_enum::text = ANY(%(weapons)s)) weapon_kills,
+                        SUM(teamhits) FILTER (WHERE name_enum::text = ANY(%(weapons)s))
+                            weapon_teamhits,
+                        SUM(shots) FILTER (WHERE name_enum::text = ANY(%(grenades)s)) grenade_shots,
+                        SUM(hits) FILTER (WHERE name_enum::text = ANY(%(grenades)s)) grenade_hits,
+                        SUM(kills) FILTER (WHERE name_enum::text = ANY(%(grenades)s)) grenade_kills,
+                        SUM(teamhits) FILTER (WHERE name_enum::text = ANY(%(grenades)s))
+                            grenade_teamhits
+                    FROM tracker_weapon
+                    WHERE player_id BETWEEN %(from_pk)s AND %(to_pk)s
+                    GROUP BY player_id
+                ) s
+                WHERE p.id = s.player_id
+                """,
+                {
+                    "weapons": [str(name) for name in qualified_weapon_names],
+                    "grenades": [str(name) for name in Equipment.grenades()],
+                    "from_pk": from_pk,
+                    "to_pk": to_pk,
+                },
+            )
+            return cursor.rowcount
@@ -1,26 +1,45 @@
 import logging
 import re
+import time
+from collections import defaultdict
+from collections.abc import Iterable
 from datetime import datetime, timedelta
+from functools import lru_cache
 from ipaddress import IPv4Address
 from typing import TYPE_CHECKING, Any
 
 from django.conf import settings
 from django.contrib.postgres.expressions import ArraySubquery
 from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
-from django.db.models import Case, Count, Expression, F, OuterRef, Q, Subquery, When
+from django.db.models import (
+    Case,
+    Count,
+    Expression,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils import timezone
 
 from apps.geoip.models import ISP
+from apps.tracker.entities import ProfileUpdateQueue
 from apps.tracker.exceptions import NoProfileMatchError
+from apps.tracker.managers.player import PlayerQuerySet
 from apps.tracker.managers.stats import get_stats_period_for_year
 from apps.tracker.schema import teams_reversed
 from apps.utils.db.func import ArrayToString, normalized_names_search_vector
 from apps.utils.misc import concat_it
 
 if TYPE_CHECKING:
-    from apps.tracker.managers import PlayerQuerySet
     from apps.tracker.models import Alias, Game, Profile, Server  # noqa: F401
 
 
@@ -40,12 +59,22 @@ def is_name_popular(name: str) -> bool:
     Args:
         name - subject string
     """
-    if len(name) < settings.TRACKER_MIN_NAME_LEN:
+    return _is_name_popular(name, settings.TRACKER_MIN_NAME_LEN, settings.TRACKER_POPULAR_NAMES)
+
+
+@lru_cache(maxsize=4096)
+def _is_name_popular(name: str, min_name_len: int, patterns: tuple[str, ...]) -> bool:
+    if len(name) < min_name_len:
         return True
+    return bool(compile_popular_names(patterns).search(name))
 
-    return any(
-        re.search(pattern, name, re.IGNORECASE) for pattern in settings.TRACKER_POPULAR_NAMES
-    )
+
+@lru_cache(maxsize=8)
+def compile_popular_names(patterns: tuple[str, ...]) -> re.Pattern:
+    """
+    Compile the popular name patterns into a single case-insensitive alternation.
+    """
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
 
 
 class ProfileQuerySet(models.QuerySet):
@@ -95,12 +124,9 @@ class ProfileManager(models.Manager):
     ) -> "Profile":
         from apps.tracker.models import Alias
 
-        # filter players by recentness
-        if recent:
-            min_date = timezone.now() - timedelta(seconds=settings.TRACKER_RECENT_TIME)
-            match_kwargs["player__game__date_finished__gte"] = min_date
-
-        alias_qs = Alias.objects.select_related("profile").filter(**match_kwargs)
+        alias_qs = Alias.objects.select_related("profile").filter(
+            **cls._prepare_alias_match_filters(recent=recent, **match_kwargs)
+        )
 
         try:
             # limit query in case of a lookup different from name+ip pair
@@ -110,6 +136,26 @@ class ProfileManager(models.Manager):
 
         return alias.profile
 
+    @classmethod
+    def _prepare_alias_match_filters(
+        cls,
+        *,
+        recent: bool = False,
+        **match_kwargs: Any,
+    ) -> dict[str, Any]:
+        if not recent:
+            return match_kwargs
+
+        min_date = timezone.now() - timedelta(seconds=settings.TRACKER_RECENT_TIME)
+        # the ip must have been used recently, so check the game of the same player
+        if "player__ip" in match_kwargs:
+            match_kwargs["player__game__date_finished__gte"] = min_date
+        # otherwise, filter aliases by recentness
+        else:
+            match_kwargs["last_seen_at__gte"] = min_date
+
+        return match_kwargs
+
     @classmethod
     def _prepare_match_smart_steps(
         cls,
@@ -173,26 +219,165 @@ class ProfileManager(models.Manager):
                 but only for the players that have been created recently
             4.  do an ip lookup for the players that have been created recently
 
+        The steps are evaluated in a single query.
+        The recentness of a name lookup is determined by the last seen date of the alias,
+        whereas the recentness of an ip lookup is checked against the game of the same player.
+        The results, including the failed matches, are cached in redis.
+
         If neither of the steps return an object, raise NoProfileMatch
         """
-        steps = cls._prepare_match_smart_steps(name=name, ip_address=ip_address, isp=isp)
+        from apps.tracker.models import Profile
 
-        for match_attrs in steps:
+        cache_key = cls._get_match_smart_cache_key(name=name, ip_address=ip_address, isp=isp)
+        redis = cache.client.get_client()
+
+        if (cached_value := redis.get(cache_key)) is not None:
+            if not (profile_id := int(cached_value or 0)):
+                logger.debug("cached no profile match for %s", cache_key)
+                raise NoProfileMatchError
             try:
-                profile = cls.match(**match_attrs)
-            except NoProfileMatchError:
-                logger.debug("no profile match with %s", match_attrs)
-                continue
-            else:
-                logger.debug("matched profile %s (%s) with %s", profile, profile.pk, match_attrs)
-                return profile
+                return Profile.objects.get(pk=profile_id)
+            except ObjectDoesNotExist:
+                logger.info("cached profile %s for %s no longer exists", profile_id, cache_key)
+
+        steps = cls._prepare_match_smart_steps(name=name, ip_address=ip_address, isp=isp)
+
+        if profiles := list(cls._prepare_match_smart_queryset(steps)):
+            profile = profiles[0]
+            # fmt: off
+            logger.debug(
+                "matched profile %s (%s) with %s",
+                profile, profile.pk, steps[profile.match_step],
+            )
+            # fmt: on
+            cls._cache_match_smart_result(cache_key, profile.pk, name=name, ip_address=ip_address)
+            return profile
 
         logger.debug(
             "unable to match any profile by name=%s ip_address=%s isp=%s", name, ip_address, isp
         )
+        cls._cache_match_smart_result(cache_key, None, name=name, ip_address=ip_address)
 
         raise NoProfileMatchError
 
+    @classmethod
+    def _get_match_smart_cache_key(
+        cls,
+        *,
+        name: str,
+        ip_address: str | IPv4Address,
+        isp: ISP | None,
+    ) -> str:
+        isp_id = isp.pk if isp else ""
+        return f"{settings.TRACKER_PROFILE_MATCH_REDIS_KEY}:{ip_address}:{isp_id}:{name.lower()}"
+
+    @classmethod
+    def _get_match_smart_index_keys(
+        cls,
+        *,
+        name: str | None = None,
+        ip_address: str | IPv4Address | None = None,
+    ) -> list[str]:
+        keys = []
+        if name is not None:
+            keys.append(f"{settings.TRACKER_PROFILE_MATCH_REDIS_KEY}:by_name:{name.lower()}")
+        if ip_address is not None:
+            keys.append(f"{settings.TRACKER_PROFILE_MATCH_REDIS_KEY}:by_ip:{ip_address}")
+        return keys
+
+    @classmethod
+    def _cache_match_smart_result(
+        cls,
+        cache_key: str,
+        profile_id: int | None,
+        *,
+        name: str,
+        ip_address: str | IPv4Address,
+    ) -> None:
+        ttl = (
+            settings.TRACKER_PROFILE_MATCH_TTL
+            if profile_id
+            else settings.TRACKER_PROFILE_MATCH_NEGATIVE_TTL
+        )
+        redis = cache.client.get_client()
+
+        # index the cached results by name and ip, so that they can be invalidated
+        with redis.pipeline(transaction=False) as pipe:
+            pipe.set(cache_key, profile_id or "", ex=ttl)
+            for index_key in cls._get_match_smart_index_keys(name=name, ip_address=ip_address):
+                pipe.sadd(index_key, cache_key)
+                pipe.expire(index_key, settings.TRACKER_PROFILE_MATCH_TTL)
+            pipe.execute()
+
+    @classmethod
+    def forget_match_smart_results(
+        cls,
+        *,
+        name: str | None = None,
+        ip_address: str | IPv4Address | None = None,
+    ) -> None:
+        """
+        Invalidate the cached profile matches that involve the given name or the ip address.
+        """
+        cls.forget_many_match_smart_results(
+            names=[name] if name is not None else [],
+            ip_addresses=[ip_address] if ip_address is not None else [],
+        )
+
+    @classmethod
+    def forget_many_match_smart_results(
+        cls,
+        *,
+        names: Iterable[str],
+        ip_addresses: Iterable[str | IPv4Address],
+    ) -> None:
+        """
+        Invalidate the cached profile matches that involve any of the names or the ip addresses.
+        """
+        index_keys = [
+            *(key for name in names for key in cls._get_match_smart_index_keys(name=name)),
+            *(
+                key
+                for ip_address in ip_addresses
+                for key in cls._get_match_smart_index_keys(ip_address=ip_address)
+            ),
+        ]
+        if not index_keys:
+            return
+
+        redis = cache.client.get_client()
+        cache_keys = redis.sunion(index_keys)
+        redis.delete(*cache_keys, *index_keys)
+
+    @classmethod
+    def _prepare_match_smart_queryset(
+        cls,
+        steps: list[dict[str, Any]],
+    ) -> models.QuerySet["Profile"]:
+        """
+        Combine the match steps into a single query,
+        so that the profile matched by the earliest step wins.
+        """
+        from apps.tracker.models import Profile
+
+        step_querysets = []
+        for step_idx, match_attrs in enumerate(steps):
+            alias_filters = cls._prepare_alias_match_filters(**match_attrs)
+            step_qs = (
+                Profile.objects.filter(
+                    **{f"alias__{lookup}": value for lookup, value in alias_filters.items()}
+                )
+                .annotate(match_step=Value(step_idx, output_field=IntegerField()))
+                .order_by()
+            )[:1]
+            step_querysets.append(step_qs)
+
+        first_qs, *other_qs = step_querysets
+        if not other_qs:
+            return first_qs
+
+        return first_qs.union(*other_qs, all=True).order_by("match_step")[:1]
+
     def match_smart_or_create(
         self,
         *,
@@ -358,23 +543,288 @@ class ProfileManager(models.Manager):
 
     @classmethod
     def update_stats_for_profile(cls, profile: "Profile") -> None:
+        """
+        Update the stats of the profile for the year it was last seen.
+
+        The games played since the previous update are folded into the stored stats,
+        unless the stats are due for a full recompute.
+        """
         if profile.last_seen_at:
-            cls.update_annual_stats_for_profile(profile=profile, year=profile.last_seen_at.year)
+            year = profile.last_seen_at.year
+            last_game_id = cls._get_last_game_id_for_profile(profile)
+            if not (
+                cls._can_fold_stats_for_profile(profile)
+                and cls.fold_annual_stats_for_profile(
+                    profile=profile, year=year, until_game_id=last_game_id
+                )
+            ):
+                cls.update_annual_stats_for_profile(
+                    profile=profile, year=year, until_game_id=last_game_id
+                )
+                profile.stats_recomputed_at = timezone.now()
+                profile.stats_last_game_id = last_game_id
         profile.stats_updated_at = timezone.now()
-        profile.save(update_fields=["stats_updated_at"])
+        profile.save(
+            update_fields=["stats_updated_at", "stats_recomputed_at", "stats_last_game_id"]
+        )
 
-    def update_with_game(self, game: "Game") -> None:
-        update_qs = self.filter(alias__player__game=game)
+    @classmethod
+    def update_stats_for_profiles(cls, *profile_ids: int) -> None:
+        """
+        Recompute the stats of a cohort of profiles for the year they were last seen.
 
-        first_game_update_qs = update_qs.filter(game_first__isnull=True)
-        last_game_update_qs = update_qs.filter(~Q(game_last=game.pk))
+        Instead of a number of queries per profile, the stats of the profiles
+        last seen in the same year are aggregated with GROUP BY profile id
+        and upserted in bulk.
+        """
+        from apps.tracker.models import Player, Profile
 
-        with transaction.atomic():
-            first_game_update_qs.update(game_first=game, first_seen_at=game.date_finished)
-            last_game_update_qs.update(game_last=game, last_seen_at=game.date_finished)
+        profiles = list(Profile.objects.filter(pk__in=profile_ids).order_by("pk"))
+        last_game_ids = dict(
+            Player.objects.using("replica")
+            .filter(alias__profile_id__in=[profile.pk for profile in profiles])
+            .order_by()
+            .values("alias__profile_id")
+            .annotate(last_game_id=Max("game_id"))
+            .values_list("alias__profile_id", "last_game_id")
+        )
+
+        profiles_per_year = defaultdict(list)
+        for profile in profiles:
+            if profile.last_seen_at:
+                profiles_per_year[profile.last_seen_at.year].append(profile)
+
+        # the games of the cohort up to this one are aggregated,
+        # so the later ones are folded in with the next update
+        until_game_id = max(last_game_ids.values(), default=None)
+        batches = defaultdict(list)
+        for year, year_profiles in profiles_per_year.items():
+            for model, batch in cls._build_annual_stats_for_profiles(
+                profiles=year_profiles, year=year, until_game_id=until_game_id or 0
+            ).items():
+                batches[model].extend(batch)
+
+        now = timezone.now()
+        for profile in profiles:
+            if profile.last_seen_at:
+                profile.stats_recomputed_at = now
+                profile.stats_last_game_id = until_game_id if profile.pk in last_game_ids else None
+            profile.stats_updated_at = now
+
+        with transaction.atomic(durable=True):
+            # take the same lock as the fold does, so that the games folded in the meantime
+            # are overwritten along with the id of the last folded game
+            list(
+                Profile.objects.select_for_update()
+                .filter(pk__in=[profile.pk for profile in profiles])
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            for model, batch in batches.items():
+                model.objects.save_stats_batch(batch)
+            Profile.objects.bulk_update(
+                profiles, ["stats_updated_at", "stats_recomputed_at", "stats_last_game_id"]
+            )
+
+    @classmethod
+    def update_annual_stats_for_profiles(
+        cls,
+        *,
+        profiles: list["Profile"],
+        year: int,
+        until_game_id: int | None = None,
+    ) -> None:
+        batches = cls._build_annual_stats_for_profiles(
+            profiles=profiles, year=year, until_game_id=until_game_id
+        )
+        with transaction.atomic(durable=True):
+            for model, batch in batches.items():
+                model.objects.save_stats_batch(batch)
+
+    @classmethod
+    def _build_annual_stats_for_profiles(
+        cls,
+        *,
+        profiles: list["Profile"],
+        year: int,
+        until_game_id: int | None = None,
+    ) -> dict[type[models.Model], list[models.Model]]:
+        from apps.tracker.models import (
+            GametypeStats,
+            MapStats,
+            Player,
+            PlayerStats,
+            ServerStats,
+            WeaponStats,
+        )
+
+        profiles = [
+            profile
+            for profile in profiles
+            if cls._get_annual_period_for_profile(profile=profile, year=year)
+        ]
+        if not profiles:
+            return {}
+
+        logger.info("updating annual %s stats for %d profiles", year, len(profiles))
+
+        period_from, period_till = get_stats_period_for_year(year)
+        queryset = (
+            Player.objects.using("replica")
+            .filter(alias__profile__in=profiles)
+            .with_qualified_games()
+            .for_period(period_from, period_till)
+        )
+        if until_game_id is not None:
+            queryset = queryset.filter(game_id__lte=until_game_id)
+        annual_stats_per_profile = queryset.aggregate_annual_stats_by(
+            partition_by="alias__profile_id"
+        )
+
+        batches = defaultdict(list)
+        for profile in profiles:
+            if not (annual_stats := annual_stats_per_profile.get(profile.pk)):
+                continue
+            batches[PlayerStats].extend(
+                PlayerStats.objects.build_stats(annual_stats["player"], profile=profile, year=year)
+            )
+            for model, grouping_key, grouped_stats in [
+                (MapStats, "map_id", annual_stats["map"]),
+                (GametypeStats, "gametype", annual_stats["gametype"]),
+                (ServerStats, "server_id", annual_stats["server"]),
+                (WeaponStats, "weapon", annual_stats["weapon"]),
+            ]:
+                batches[model].extend(
+                    model.objects.build_grouped_stats(
+                        grouped_stats, grouping_key=grouping_key, profile=profile, year=year
+                    )
+                )
+
+        return batches
+
+    @classmethod
+    def _get_last_game_id_for_profile(cls, profile: "Profile") -> int | None:
+        from apps.tracker.models import Player
+
+        return (
+            Player.objects.using("replica")
+            .for_profile(profile)
+            .aggregate(last_game_id=Max("game_id"))["last_game_id"]
+        )
+
+    @classmethod
+    def _can_fold_stats_for_profile(cls, profile: "Profile") -> bool:
+        if profile.stats_last_game_id is None or profile.stats_recomputed_at is None:
+            return False
+        recompute_due_at = profile.stats_recomputed_at + timedelta(
+            seconds=settings.TRACKER_STATS_RECOMPUTE_INTERVAL
+        )
+        return timezone.now() < recompute_due_at
+
+    def queue_for_update(self, queue: ProfileUpdateQueue, *profile_ids: int) -> int:
+        """
+        Add the profiles to the update queue, unless they are pending in the queue already.
+
+        The profiles are scored with the time they were first queued at,
+        so the oldest ones are drained first.
+        Return the number of newly queued profiles.
+        """
+        if not profile_ids:
+            return 0
+        redis = cache.client.get_client()
+        queued_at = time.time()
+        return redis.zadd(
+            f"{settings.TRACKER_PROFILE_QUEUE_REDIS_KEY}:{queue}",
+            dict.fromkeys(profile_ids, queued_at),
+            nx=True,
+        )
+
+    def get_queued_for_update(self, queue: ProfileUpdateQueue, count: int) -> list[int]:
+        """
+        Return the ids of up to `count` profiles pending in the update queue, oldest first.
+
+        The profiles are left in the queue until they are acknowledged,
+        so the ones that have failed to update are picked up again.
+        """
+        redis = cache.client.get_client()
+        items = redis.zrange(f"{settings.TRACKER_PROFILE_QUEUE_REDIS_KEY}:{queue}", 0, count - 1)
+        return [int(profile_id) for profile_id in items]
+
+    def ack_queued_for_update(self, queue: ProfileUpdateQueue, *profile_ids: int) -> int:
+        """
+        Remove the updated profiles from the update queue.
+        Return the number of removed profiles.
+        """
+        if not profile_ids:
+            return 0
+        redis = cache.client.get_client()
+        return redis.zrem(f"{settings.TRACKER_PROFILE_QUEUE_REDIS_KEY}:{queue}", *profile_ids)
+
+    def get_update_queue_metrics(self, queue: ProfileUpdateQueue) -> dict[str, int | float]:
+        """
+        Return the number of the profiles pending in the update queue
+        and the number of seconds the oldest of them has been waiting for.
+        """
+        redis = cache.client.get_client()
+        key = f"{settings.TRACKER_PROFILE_QUEUE_REDIS_KEY}:{queue}"
+        with redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(key)
+            pipe.zrange(key, 0, 0, withscores=True)
+            depth, oldest = pipe.execute()
+        lag = max(time.time() - oldest[0][1], 0) if oldest else 0
+        return {"depth": depth, "lag": round(lag, 3)}
+
+    def update_with_games(self, *game_ids: int) -> int:
+        """
+        Update the first and the latest games of the profiles
+        that have played the given games with a single set-based update.
+
+        The games are compared by the time they have finished at,
+        so that the replayed games, which get higher ids, do not move the latest game backwards.
+        """
+        from apps.tracker.models import Game
+
+        profile_games = Game.objects.filter(pk__in=game_ids, player__alias__profile=OuterRef("pk"))
+        first_game = profile_games.order_by("date_finished", "pk")[:1]
+        latest_game = profile_games.order_by("-date_finished", "-pk")[:1]
+        first_game_played_at = Subquery(first_game.values("date_finished"))
+        latest_game_played_at = Subquery(latest_game.values("date_finished"))
+
+        return self.filter(alias__player__game__in=game_ids).update(
+            game_first=Case(
+                When(
+                    Q(game_first__isnull=True) | Q(first_seen_at__gt=first_game_played_at),
+                    then=Coalesce(
+                        Subquery(first_game.values("pk")),
+                        F("game_first_id"),
+                        output_field=IntegerField(),
+                    ),
+                ),
+                default=F("game_first_id"),
+            ),
+            first_seen_at=Least(F("first_seen_at"), first_game_played_at),
+            game_last=Case(
+                When(
+                    Q(game_last__isnull=True) | Q(last_seen_at__lte=latest_game_played_at),
+                    then=Coalesce(
+                        Subquery(latest_game.values("pk")),
+                        F("game_last_id"),
+                        output_field=IntegerField(),
+                    ),
+                ),
+                default=F("game_last_id"),
+            ),
+            last_seen_at=Greatest(F("last_seen_at"), latest_game_played_at),
+        )
 
     @classmethod
-    def update_annual_stats_for_profile(cls, *, profile: "Profile", year: int) -> None:
+    def update_annual_stats_for_profile(
+        cls,
+        *,
+        profile: "Profile",
+        year: int,
+        until_game_id: int | None = None,
+    ) -> None:
         from apps.tracker.models import (
             GametypeStats,
             MapStats,
@@ -391,12 +841,15 @@ class ProfileManager(models.Manager):
         queryset = cls._get_qualified_player_queryset_for_profile(
             profile=profile, period_from=period[0], period_till=period[1]
         )
+        if until_game_id is not None:
+            queryset = queryset.filter(game_id__lte=until_game_id)
 
-        player_stats = queryset.aggregate_player_stats()
-        per_map_stats = queryset.aggregate_stats_by_map()
-        per_gametype_stats = queryset.aggregate_stats_by_gametype()
-        per_server_stats = queryset.aggregate_stats_by_server()
-        per_weapon_stats = queryset.aggregate_stats_by_weapon()
+        annual_stats = queryset.aggregate_annual_stats()
+        player_stats = annual_stats["player"]
+        per_map_stats = annual_stats["map"]
+        per_gametype_stats = annual_stats["gametype"]
+        per_server_stats = annual_stats["server"]
+        per_weapon_stats = annual_stats["weapon"]
 
         with transaction.atomic(durable=True):
             PlayerStats.objects.save_stats(player_stats, profile=profile, year=year)
@@ -416,6 +869,133 @@ class ProfileManager(models.Manager):
                 per_weapon_stats, grouping_key="weapon", profile=profile, year=year
             )
 
+    @classmethod
+    def fold_annual_stats_for_profile(
+        cls,
+        *,
+        profile: "Profile",
+        year: int,
+        until_game_id: int | None,
+    ) -> bool:
+        """
+        Fold the games played by the profile since the previous stats update
+        into the stored annual stats, along with the id of the last folded game.
+
+        The games are not folded if another update has moved the id of the last folded game
+        in the meantime, so that the same games are never folded twice.
+        Return False if the stored stats cannot be folded into and must be recomputed instead.
+        """
+        from apps.tracker.models import PlayerStats, Profile
+
+        if not (period := cls._get_annual_period_for_profile(profile=profile, year=year)):
+            return True
+
+        logger.info(
+            "folding games %s-%s into annual %s stats for profile %s (%d)",
+            profile.stats_last_game_id,
+            until_game_id,
+            year,
+            profile,
+            profile.pk,
+        )
+
+        queryset = cls._get_qualified_player_queryset_for_profile(
+            profile=profile, period_from=period[0], period_till=period[1]
+        ).filter(game_id__gt=profile.stats_last_game_id, game_id__lte=until_game_id or 0)
+
+        annual_stats = queryset.aggregate_annual_stats()
+        player_stats = annual_stats["player"]
+
+        with transaction.atomic(durable=True):
+            stats_last_game_id = (
+                Profile.objects.select_for_update()
+                .filter(pk=profile.pk)
+                .values_list("stats_last_game_id", flat=True)
+                .get()
+            )
+            if stats_last_game_id != profile.stats_last_game_id:
+                logger.info(
+                    "games of profile %s (%d) have been folded up to %s in the meantime",
+                    profile,
+                    profile.pk,
+                    stats_last_game_id,
+                )
+                profile.stats_last_game_id = stats_last_game_id
+                return True
+
+            folded_player_stats = None
+            if any(value is not None for value in player_stats.values()):
+                stored_player_stats = PlayerStats.objects.get_stats(profile=profile, year=year)
+                if not PlayerQuerySet.can_fold_stats(stored_player_stats, player_stats):
+                    return False
+                folded_player_stats = PlayerQuerySet.fold_stats(
+                    PlayerQuerySet.player_aggregates, stored_player_stats, player_stats
+                )
+
+            folded_grouped_stats = cls._fold_grouped_stats_for_profile(
+                profile=profile, year=year, annual_stats=annual_stats
+            )
+            if folded_grouped_stats is None:
+                return False
+
+            if folded_player_stats is not None:
+                PlayerStats.objects.save_stats(folded_player_stats, profile=profile, year=year)
+            for model, folded_groups, grouping_key in folded_grouped_stats:
+                model.objects.save_grouped_stats(
+                    folded_groups,
+                    grouping_key=grouping_key,
+                    profile=profile,
+                    year=year,
+                )
+            # the folded games must never be folded again
+            Profile.objects.filter(pk=profile.pk).update(stats_last_game_id=until_game_id)
+
+        profile.stats_last_game_id = until_game_id
+        return True
+
+    @classmethod
+    def _fold_grouped_stats_for_profile(
+        cls,
+        *,
+        profile: "Profile",
+        year: int,
+        annual_stats: dict[str, Any],
+    ) -> list[tuple[type[models.Model], dict[Any, dict[str, Any]], str]] | None:
+        """
+        Fold the grouped stats aggregated over the new games into the stored ones.
+
+        Return None if any of the groups cannot be folded into.
+        """
+        from apps.tracker.models import GametypeStats, MapStats, ServerStats, WeaponStats
+
+        folded_grouped_stats = []
+        for model, grouped_stats, grouping_key, aggregate_groups in [
+            (MapStats, annual_stats["map"], "map_id", PlayerQuerySet.map_aggregates),
+            (
+                GametypeStats,
+                annual_stats["gametype"],
+                "gametype",
+                PlayerQuerySet.gametype_aggregates,
+            ),
+            (ServerStats, annual_stats["server"], "server_id", PlayerQuerySet.server_aggregates),
+            (WeaponStats, annual_stats["weapon"], "weapon", PlayerQuerySet.weapon_aggregates),
+        ]:
+            if not grouped_stats:
+                continue
+            stored_stats = model.objects.get_grouped_stats(
+                grouping_key=grouping_key, profile=profile, year=year
+            )
+            folded_groups = {}
+            for grouping_value, stats in grouped_stats.items():
+                stored_group_stats = stored_stats.get(grouping_value, {})
+                if not PlayerQuerySet.can_fold_stats(stored_group_stats, stats):
+                    return None
+                folded_groups[grouping_value] = PlayerQuerySet.fold_stats(
+                    aggregate_groups, stored_group_stats, stats
+                )
+            folded_grouped_stats.append((model, folded_groups, grouping_key))
+        return folded_grouped_stats
+
     @classmethod
     def update_annual_server_stats_for_profile(
         cls,
@@ -502,58 +1082,52 @@ class ProfileManager(models.Manager):
         return period_from, period_till
 
     @classmethod
-    def update_player_positions_for_year(cls, year: int) -> None:
-        from apps.tracker.models import GametypeStats, PlayerStats
+    def update_player_positions_for_year(cls, year: int, *, incremental: bool = False) -> None:
+        """
+        Update the leaderboard positions for the year.
+
+        In the incremental mode only the partitions
+        that have had their stats changed since the previous run are ranked.
+        """
+        from apps.tracker.models import GametypeStats, PlayerStats, ServerStats
 
         logger.info("updating player positions for year %s", year)
 
-        # global player stats
-        PlayerStats.objects.rank(
-            year=year, cats=["spm_ratio"], qualify={"time": settings.TRACKER_MIN_TIME}
-        )
-        PlayerStats.objects.rank(
-            year=year, cats=["spr_ratio"], qualify={"games": settings.TRACKER_MIN_GAMES}
-        )
-        PlayerStats.objects.rank(
-            year=year, cats=["kd_ratio"], qualify={"kills": settings.TRACKER_MIN_KILLS}
-        )
-        PlayerStats.objects.rank(
-            year=year,
-            cats=["weapon_hit_ratio", "weapon_kill_ratio"],
-            qualify={"weapon_shots": settings.TRACKER_MIN_WEAPON_SHOTS},
-        )
-        PlayerStats.objects.rank(
-            year=year,
-            cats=["grenade_hit_ratio"],
-            qualify={"grenade_shots": settings.TRACKER_MIN_GRENADE_SHOTS},
-        )
-        PlayerStats.objects.rank(
-            year=year,
-            exclude_cats=[
-                "spm_ratio",
-                "spr_ratio",
-                "kd_ratio",
-                "weapon_hit_ratio",
-                "weapon_kill_ratio",
-                "grenade_hit_ratio",
-                "weapon_teamhit_ratio",
-                "grenade_teamhit_ratio",
-            ],
-        )
+        rankings = [
+            (model, ranking)
+            # global, per gametype and per server player stats
+            for model in [PlayerStats, GametypeStats, ServerStats]
+            for ranking in model.objects.get_rankings()
+        ]
+
+        if not incremental:
+            for model, ranking in rankings:
+                model.objects.rank(year=year, **ranking)
+            logger.info("finished updating player positions for year %s", year)
+            return
 
-        # per gametype player stats
-        GametypeStats.objects.rank(
-            year=year, cats=["spm_ratio"], qualify={"time": settings.TRACKER_MIN_TIME}
-        )
-        GametypeStats.objects.rank(
-            year=year, cats=["spr_ratio"], qualify={"games": settings.TRACKER_MIN_GAMES}
-        )
-        GametypeStats.objects.rank(year=year, exclude_cats=["spm_ratio", "spr_ratio"])
+        # take a snapshot of the changed partitions,
+        # so the changes made while ranking are picked up by the next run
+        snapshot_at = timezone.now().timestamp()
+        changed_per_model = {
+            model: model.objects.get_changed_partitions(year, until=snapshot_at)
+            for model, _ in rankings
+        }
+
+        touched = 0
+        for model, ranking in rankings:
+            touched += model.objects.rank_changed(
+                year=year, changed=changed_per_model[model], **ranking
+            )
 
-        # per server player stats
-        cls.update_per_server_positions_for_year(year)
+        for model in changed_per_model:
+            model.objects.forget_changed_partitions(year, until=snapshot_at)
 
-        logger.info("finished updating player positions for year %s", year)
+        logger.info(
+            "finished updating player positions for year %s; touched %d partitions",
+            year,
+            touched,
+        )
 
     @classmethod
     def update_per_server_positions_for_year(
@@ -563,29 +1137,8 @@ class ProfileManager(models.Manager):
     ) -> None:
         from apps.tracker.models import ServerStats
 
-        ServerStats.objects.rank(
-            cats=["spm_ratio"],
-            qualify={"time": settings.TRACKER_MIN_TIME},
-            year=year,
-            filters=filters,
-        )
-        ServerStats.objects.rank(
-            cats=["spr_ratio"],
-            qualify={"games": settings.TRACKER_MIN_GAMES},
-            year=year,
-            filters=filters,
-        )
-        ServerStats.objects.rank(
-            cats=["kd_ratio"],
-            qualify={"kills": settings.TRACKER_MIN_KILLS},
-            year=year,
-            filters=filters,
-        )
-        ServerStats.objects.rank(
-            exclude_cats=["spm_ratio", "spr_ratio", "kd_ratio"],
-            year=year,
-            filters=filters,
-        )
+        for ranking in ServerStats.objects.get_rankings():
+            ServerStats.objects.rank(year=year, filters=filters, **ranking)
 
     def denorm_alias_names(self, *profile_ids: int) -> None:
         from apps.tracker.models import Alias
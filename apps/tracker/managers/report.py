@@ -0,0 +1,75 @@
+import json
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from django.db import models
+from pytz import UTC
+
+from apps.utils.misc import dumps
+
+if TYPE_CHECKING:
+    from apps.tracker.models import GameReport
+
+
+class GameReportManager(models.Manager):
+    def archive(self, *items: dict[str, Any]) -> list["GameReport"]:
+        """
+        Append accepted game data to the archive.
+
+        The items that have already been archived, as told by their tag and the time received,
+        are skipped, so a batch that is picked up again is not archived twice.
+
+        :param items: Items bearing the arguments of the process_game_data task
+        """
+        archived = set(
+            self.filter(tag__in={item["data"]["tag"] for item in items}).values_list(
+                "tag", "received_at"
+            )
+        )
+
+        reports = []
+        for item in items:
+            tag = item["data"]["tag"]
+            received_at = datetime.fromtimestamp(item["data_received_ts"], tz=UTC)
+            if (tag, received_at) in archived:
+                continue
+            archived.add((tag, received_at))
+            reports.append(
+                self.model(
+                    tag=tag,
+                    server_ip=item["server_ip"],
+                    received_at=received_at,
+                    data=zlib.compress(dumps(item["data"]).encode()),
+                )
+            )
+
+        return self.bulk_create(reports)
+
+    def get_report_ids(self, *, since: datetime, until: datetime) -> list[int]:
+        """
+        Return the ids of the reports received within the given time range, oldest first.
+        """
+        return list(
+            self.using("replica")
+            .filter(received_at__gte=since, received_at__lt=until)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    def iterate_queued_items(self, *report_ids: int) -> Iterator[dict[str, Any]]:
+        """
+        Restore the archived reports to the form accepted by the process_game_data task.
+        """
+        for server_ip, received_at, data in (
+            self.filter(pk__in=report_ids)
+            .order_by("pk")
+            .values_list("server_ip", "received_at", "data")
+        ):
+            yield {
+                "server_id": None,
+                "server_ip": server_ip,
+                "data": json.loads(zlib.decompress(data)),
+                "data_received_ts": received_at.timestamp(),
+            }
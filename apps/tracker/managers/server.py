@@ -3,6 +3,7 @@ import logging
 import operator as op
 import random
 from collections import OrderedDict
+from dataclasses import asdict
 from datetime import timedelta
 from typing import TYPE_CHECKING, Any
 
@@ -10,9 +11,9 @@ import voluptuous
 from django.conf import settings
 from django.contrib.postgres.search import SearchVector
 from django.core.cache import cache
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models, transaction
-from django.db.models import Count, F, Q, QuerySet
+from django.db.models import Count, F, Q, QuerySet, Subquery
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
@@ -20,7 +21,9 @@ from voluptuous import Invalid
 
 from apps.tracker.aio_tasks.discovery import ServerDiscoveryTask
 from apps.tracker.aio_tasks.serverquery import ServerInfo, ServerStatusTask
+from apps.tracker.entities import StreamServer
 from apps.tracker.exceptions import MergeServersError
+from apps.tracker.managers.game import get_game_stats_updates_for_games
 from apps.tracker.schema import serverquery_schema
 from apps.tracker.utils import aio
 from apps.tracker.utils.misc import force_clean_name
@@ -28,7 +31,7 @@ from apps.utils.db.func import normalized_names_search_vector
 from apps.utils.misc import concat_it, dumps
 
 if TYPE_CHECKING:
-    from apps.tracker.models import Game, Server
+    from apps.tracker.models import Server
 
 
 logger = logging.getLogger(__name__)
@@ -111,19 +114,117 @@ class ServerManager(models.Manager):
 
         return self.filter(pk__in=server_pks)
 
-    def update_game_stats_with_game(self, game: "Game") -> None:
-        update_qs = self.filter(pk=game.server_id)
+    def get_stream_server(self, ip: str, port: int) -> StreamServer | None:
+        """
+        Obtain the id and status of the server streaming from given address.
 
-        first_game_update_qs = update_qs.filter(first_game__isnull=True)
-        last_game_update_qs = update_qs.filter(~Q(latest_game=game.pk))
+        The details are looked up in redis first,
+        so that the database is only queried on a cache miss.
+        Cached details expire after a while, in case the server has been changed
+        without the cache invalidation signal being sent (e.g. with a queryset update).
+        Return None if there is no server registered with the address yet.
+        """
+        redis = cache.client.get_client()
+        redis_key = self._get_stream_server_key(ip, port)
+
+        if cached := redis.get(redis_key):
+            logger.debug("obtained cached server details for %s:%s", ip, port)
+            return StreamServer(**json.loads(cached.decode()))
+
+        try:
+            server = self.only("pk", "enabled").get(ip=ip, port=port)
+        except ObjectDoesNotExist:
+            logger.debug("no server is registered for %s:%s", ip, port)
+            return None
+
+        stream_server = StreamServer(id=server.pk, enabled=server.enabled)
+        logger.debug("caching server details for %s:%s: %s", ip, port, stream_server)
+        redis.set(
+            redis_key,
+            dumps(asdict(stream_server)).encode(),
+            ex=settings.TRACKER_STREAM_SERVERS_TTL,
+        )
 
-        with transaction.atomic():
-            first_game_update_qs.update(first_game=game, first_game_played_at=game.date_finished)
-            last_game_update_qs.update(
-                game_count=F("game_count") + 1,
-                latest_game=game,
-                latest_game_played_at=game.date_finished,
+        return stream_server
+
+    def forget_stream_servers(self, *servers: "Server") -> int:
+        """
+        Remove cached stream details for the servers,
+        so they are fetched from the database next time.
+        """
+        redis = cache.client.get_client()
+        keys_to_delete = [self._get_stream_server_key(server.ip, server.port) for server in servers]
+        return redis.delete(*keys_to_delete)
+
+    def obtain_stream_server(self, *, ip: str, port: int, server_id: int | None = None) -> "Server":
+        """
+        Obtain the server a game has been streamed from.
+
+        Prefer the server id resolved at the time the data was accepted,
+        unless the server has since changed its address.
+        Otherwise, look the server up by its address or register a new one.
+        """
+        if server_id:
+            try:
+                server = self.get(pk=server_id)
+            except ObjectDoesNotExist:
+                logger.info("streaming server %s no longer exists", server_id)
+            else:
+                if (server.ip, server.port) == (ip, port):
+                    return server
+                logger.info(
+                    "streaming server %s has changed address from %s:%s", server_id, ip, port
+                )
+
+        try:
+            server = self.create_server(ip=ip, port=port)
+        except ValidationError:
+            server = self.get(ip=ip, port=port)
+            logger.debug("obtained streaming server %s for %s:%s", server.pk, ip, port)
+        else:
+            logger.info("created streaming server %s for %s:%s", server.pk, ip, port)
+
+        return server
+
+    def _get_stream_server_key(self, ip: str, port: int) -> str:
+        return f"{settings.TRACKER_STREAM_SERVERS_REDIS_KEY}:{ip}:{port}"
+
+    def update_mod_version(self, server: "Server", version: str) -> bool:
+        """
+        Update the server mod version if it has changed
+        """
+        if server.version == version:
+            logger.debug(
+                "mod version for %s (%d) is up to date (%s)",
+                server.address,
+                server.pk,
+                server.version,
             )
+            return False
+
+        logger.info(
+            "updating mod version for %s (%d) from %s to %s",
+            server.address,
+            server.pk,
+            server.version,
+            version,
+        )
+        server.version = version
+        server.save(update_fields=["version"])
+
+        return True
+
+    def update_game_stats_with_games(self, *game_ids: int) -> int:
+        """
+        Update the denormalized game stats of the servers the games have been played on
+        with a single set-based update.
+        """
+        from apps.tracker.models import Game
+
+        server_ids = Game.objects.filter(pk__in=game_ids).values("server_id")
+        updates = get_game_stats_updates_for_games(list(game_ids), ref_field="server_id")
+
+        return self.filter(pk__in=Subquery(server_ids)).update(**updates)
 
     @transaction.atomic
     def denorm_game_stats(self, *servers) -> None:
@@ -300,6 +401,9 @@ class ServerManager(models.Manager):
             self._merge_servers(main_id, merged_ids)
             self.denorm_game_stats(main, *merged)
 
+        # merged servers are now disabled
+        self.forget_stream_servers(*merged)
+
     def _merge_servers(self, main_id: int, merged_ids: list[int]) -> None:
         from apps.tracker.models import Game
 
@@ -1,17 +1,23 @@
 # ruff: noqa: SLF001
 import logging
 from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
 from datetime import datetime, time
+from time import monotonic
 from typing import TYPE_CHECKING, Any
 
-from django.db import models, transaction
-from django.db.models import Exists, F, OuterRef, Q
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, models, router, transaction
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
 from django.db.models.functions import window
 from django.utils import timezone
 from pytz import UTC
 
 from apps.tracker.entities import LegacyStatCategory
-from apps.utils.misc import concat_it, iterate_list
+from apps.utils.misc import concat_it
 
 if TYPE_CHECKING:
     from apps.tracker.models import Profile
@@ -38,6 +44,16 @@ class StatsManager(models.Manager):
         year: int,
         **save_kwargs: Any,
     ) -> None:
+        self.save_stats_batch(self.build_stats(items, profile=profile, year=year, **save_kwargs))
+
+    def build_stats(
+        self,
+        items: dict[str, int | float],
+        *,
+        profile: "Profile",
+        year: int,
+        **save_kwargs: Any,
+    ) -> list[models.Model]:
         from apps.tracker.models import PlayerStats
 
         batch = []
@@ -56,16 +72,47 @@ class StatsManager(models.Manager):
                 )
             )
 
+        return batch
+
+    def build_grouped_stats(
+        self,
+        grouped_items: dict[str, dict[str, int | float]],
+        *,
+        grouping_key: str,
+        profile: "Profile",
+        year: int,
+    ) -> list[models.Model]:
+        batch = []
+        for grouping_value, items in grouped_items.items():
+            batch.extend(
+                self.build_stats(
+                    items, profile=profile, year=year, **{grouping_key: grouping_value}
+                )
+            )
+        return batch
+
+    def save_stats_batch(self, batch: list[models.Model]) -> None:
+        """
+        Upsert the stats rows, possibly of a number of profiles, in batches.
+
+        Large batches are copied into the stats table instead.
+        """
         if not batch:
             return
 
-        self.model.objects.bulk_create(
-            batch,
-            batch_size=500,
-            update_conflicts=True,
-            update_fields=["points"],
-            unique_fields=self.model.unique_db_fields,
-        )
+        if len(batch) >= settings.TRACKER_STATS_COPY_MIN_ROWS:
+            self.copy_stats_batch(batch)
+        else:
+            self.model.objects.bulk_create(
+                batch,
+                batch_size=500,
+                update_conflicts=True,
+                update_fields=["points"],
+                unique_fields=self.model.unique_db_fields,
+            )
+
+        self.mark_changed_partitions(batch)
+        self.mirror_leaderboards(batch)
 
     def save_grouped_stats(
         self,
@@ -78,7 +125,98 @@ class StatsManager(models.Manager):
         for grouping_value, items in grouped_items.items():
             self.save_stats(items, profile=profile, year=year, **{grouping_key: grouping_value})
 
-    def rank(
+    def copy_stats_batch(self, batch: list[models.Model]) -> int:
+        """
+        Upsert the stats rows by copying them into a temporary table
+        and merging it into the stats table with a single statement.
+
+        Return the number of upserted rows.
+        """
+        if not batch:
+            return 0
+
+        started_at = monotonic()
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        opts = self.model._meta
+        quote_name = connection.ops.quote_name
+
+        fields = [
+            field
+            for field in opts.concrete_fields
+            if not field.primary_key and field.attname != "position"
+        ]
+        table = quote_name(opts.db_table)
+        temp_table = quote_name(f"{opts.db_table}_copy")
+        columns = ", ".join(quote_name(field.column) for field in fields)
+        unique_columns = ", ".join(
+            quote_name(opts.get_field(name).column) for name in self.model.unique_db_fields
+        )
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {temp_table} ON COMMIT DROP "  # noqa: S608
+                f"AS SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            with cursor.copy(f"COPY {temp_table} ({columns}) FROM STDIN") as copy:
+                for obj in batch:
+                    copy.write_row(
+                        [
+                            field.get_db_prep_save(getattr(obj, field.attname), connection)
+                            for field in fields
+                        ]
+                    )
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "  # noqa: S608
+                f"SELECT {columns} FROM {temp_table} "
+                f"ON CONFLICT ({unique_columns}) DO UPDATE SET points = EXCLUDED.points"
+            )
+            upserted_rows = cursor.rowcount
+            cursor.execute(f"DROP TABLE {temp_table}")
+
+        elapsed = monotonic() - started_at
+        logger.info(
+            "copied %d %s rows in %.2fs (%.0f rows/s)",
+            upserted_rows,
+            self.model.__name__,
+            elapsed,
+            upserted_rows / elapsed if elapsed else upserted_rows,
+        )
+
+        return upserted_rows
+
+    def get_stats(self, *, profile: "Profile", year: int) -> dict[str, int | float]:
+        return dict(self.filter(profile=profile, year=year).values_list("category", "points"))
+
+    def get_grouped_stats(
+        self,
+        *,
+        grouping_key: str,
+        profile: "Profile",
+        year: int,
+    ) -> dict[Any, dict[str, int | float]]:
+        grouped_items = defaultdict(dict)
+        stats_qs = self.filter(profile=profile, year=year).values_list(
+            grouping_key, "category", "points"
+        )
+        for grouping_value, category, points in stats_qs:
+            grouped_items[grouping_value][category] = points
+        return grouped_items
+
+    def get_rankings(self) -> list[dict[str, Any]]:
+        """
+        Return the arguments of the rank() calls that rank every category of the model,
+        the qualified categories going first.
+        """
+        return [
+            *(
+                {"cats": cats, "qualify": {ref_category: min_points}}
+                for (ref_category, min_points), cats in self._get_qualifications().items()
+            ),
+            {"exclude_cats": [*self.model.qualified_categories, *self.model.unranked_categories]},
+        ]
+
+    def rank(  # noqa: PLR0913
         self,
         *,
         year: int,
@@ -86,94 +224,403 @@ class StatsManager(models.Manager):
         exclude_cats: list[str] | None = None,
         qualify: dict[str, int | float] | None = None,
         filters: dict[str, Any] | None = None,
-    ) -> None:
-        filters = Q(**filters) if filters else Q()
+        clear_unqualified: bool = True,
+    ) -> int:
+        """
+        Update the positions of the stats items with a single statement per category.
+
+        Only the items that have changed their position are updated.
+        The positions of the items that are not qualified are cleared, unless told otherwise.
+        Return the number of updated items.
+        """
+        scope = Q(**filters) if filters else Q()
+        filters = scope
 
         if cats:
             filters &= Q(category__in=cats)
         elif exclude_cats:
             filters &= ~Q(category__in=exclude_cats)
 
-        # only rank those players that are qualified for it
-        # i.e. that have enough time and games played
-        if qualify is not None:
-            extra_ref_fields = [
-                f
-                for f in self.model.grouping_fields  # map_id, gametype, server_id, etc
-                if f not in ("category", "category_legacy")
-            ]
-            filters &= Q(
-                *(
-                    Exists(
-                        self.model.objects.using("replica").filter(
-                            profile_id=OuterRef("profile_id"),
-                            year=year,
-                            category=ref_category,
-                            points__gte=min_points,
-                            **{field: OuterRef(field) for field in extra_ref_fields},
-                        )
-                    )
-                    for ref_category, min_points in qualify.items()
-                )
-            )
-
-        positions_qs = (
+        categories = cats or list(
             self.model.objects.using("replica")
             .filter(filters, year=year)
-            .annotate(
-                _position=models.Window(
-                    expression=window.RowNumber(),
-                    partition_by=[models.F(field) for field in self.model.grouping_fields],
-                    order_by=[models.F("points").desc(), models.F("id").asc()],
-                )
-            )
-            .values("pk", "category", "_position")
+            .order_by()
+            .values_list("category", flat=True)
+            .distinct()
         )
 
-        positions_per_cat = defaultdict(list)
-        cnt = 0
-        for item in positions_qs:
-            cnt += 1
-            positions_per_cat[item["category"]].append((item["pk"], item["_position"]))
+        updated = 0
+        if qualify and categories:
+            # only rank those players that are qualified for it
+            # i.e. that have enough time and games played,
+            # the categories sharing the qualification are ranked in one transaction
+            with (
+                transaction.atomic(durable=True),
+                self._qualified_profiles(year=year, qualify=qualify, scope=scope) as qualified,
+            ):
+                for category in categories:
+                    updated += self._rank_category(
+                        year=year,
+                        category=category,
+                        filters=filters,
+                        qualified=qualified,
+                        clear_unqualified=clear_unqualified,
+                    )
+        else:
+            for category in categories:
+                with transaction.atomic(durable=True):
+                    updated += self._rank_category(year=year, category=category, filters=filters)
 
         logger.info(
-            "have %s %s items to update positions for year %s",
-            cnt,
+            "updated %s %s positions for year %s",
+            updated,
             self.model._meta.model_name,
             year,
         )
 
-        for category, positions in positions_per_cat.items():
-            logger.debug(
-                "updating year %s positions for %s - %s",
-                year,
-                self.model._meta.model_name,
-                category,
-            )
-            with transaction.atomic(durable=True):
-                # clear positions prior to updating when qualifications are specified
-                if qualify:
-                    logger.debug(
-                        "clearing year %s positions for %s - %s",
-                        year,
-                        self.model._meta.model_name,
-                        category,
-                    )
-                    (
-                        self.model.objects.filter(
-                            year=year, category=category, position__isnull=False
-                        ).update(position=None)
+        return updated
+
+    def _rank_category(
+        self,
+        *,
+        year: int,
+        category: str,
+        filters: Q,
+        qualified: RawSQL | None = None,
+        clear_unqualified: bool = True,
+    ) -> int:
+        logger.debug(
+            "updating year %s positions for %s - %s",
+            year,
+            self.model._meta.model_name,
+            category,
+        )
+        updated = 0
+        ranked_qs = self.model.objects.filter(filters, year=year, category=category)
+        if qualified is not None:
+            ranked_qs = ranked_qs.filter(qualified)
+            # clear positions of the items that are no longer qualified
+            if clear_unqualified:
+                updated += (
+                    self.model.objects.filter(
+                        filters, year=year, category=category, position__isnull=False
                     )
-                for chunk in iterate_list(positions, size=1000):
-                    position_for = dict(chunk)
-                    chunk_qs = (
-                        self.model.objects.select_related(None)
-                        .filter(pk__in=position_for)
-                        .only("pk", "position")
+                    .exclude(pk__in=ranked_qs.values("pk"))
+                    .update(position=None)
+                )
+        return updated + self._update_positions(ranked_qs)
+
+    def rank_changed(
+        self,
+        *,
+        year: int,
+        changed: dict[str, set[str]],
+        cats: list[str] | None = None,
+        exclude_cats: list[str] | None = None,
+        qualify: dict[str, int | float] | None = None,
+    ) -> int:
+        """
+        Update the positions of the changed leaderboard partitions only,
+        i.e. the categories per gametype, server, etc that have had their stats saved.
+
+        A partition of a qualified category is also ranked once its qualifying category
+        has changed, but the positions of the unqualified items are only cleared in that case.
+        Return the number of the touched partitions.
+        """
+        partition_fields = self._get_partition_fields()
+
+        if cats:
+            categories = cats
+        else:
+            exclude_cats = exclude_cats or []
+            categories = [category for category in changed if category not in exclude_cats]
+
+        requalified = set()
+        for ref_category in qualify or {}:
+            requalified |= changed.get(ref_category, set())
+
+        touched = 0
+        for category in categories:
+            partitions = changed.get(category, set()) | requalified
+            if not partitions:
+                continue
+            touched += len(partitions)
+            for clear_unqualified, groups in [
+                (True, requalified),
+                (False, partitions - requalified),
+            ]:
+                if not groups:
+                    continue
+                self.rank(
+                    year=year,
+                    cats=[category],
+                    qualify=qualify,
+                    filters={f"{partition_fields[0]}__in": groups} if partition_fields else None,
+                    clear_unqualified=clear_unqualified,
+                )
+
+        logger.info(
+            "touched %d %s partitions for year %s",
+            touched,
+            self.model._meta.model_name,
+            year,
+        )
+
+        return touched
+
+    def mark_changed_partitions(self, batch: list[models.Model]) -> None:
+        """
+        Remember the leaderboard partitions the saved stats items belong to,
+        once the stats are committed, so they are picked up by the next incremental ranking.
+        """
+        if not (settings.TRACKER_RANK_INCREMENTAL_ENABLED and self.model.has_positions and batch):
+            return
+
+        changed_per_year = defaultdict(set)
+        for item in batch:
+            group = ":".join(str(value) for value in self._get_partition(item).values())
+            changed_per_year[item.year].add(f"{item.category}:{group}")
+
+        def mark_changed() -> None:
+            # the partitions are scored with the time they have last changed at
+            changed_at = timezone.now().timestamp()
+            redis = cache.client.get_client()
+            with redis.pipeline(transaction=False) as pipe:
+                for year, members in changed_per_year.items():
+                    pipe.zadd(
+                        self._get_changed_partitions_key(year),
+                        dict.fromkeys(members, changed_at),
+                        gt=True,
                     )
-                    for item in chunk_qs:
-                        item.position = position_for[item.pk]
-                    self.model.objects.bulk_update(chunk_qs, ["position"])
+                pipe.execute()
+
+        # the partitions must not be ranked before the stats are visible
+        transaction.on_commit(mark_changed)
+
+    def get_changed_partitions(self, year: int, until: float | None = None) -> dict[str, set[str]]:
+        """
+        Return the groups of the leaderboard partitions changed up to the given timestamp,
+        mapped by category.
+        """
+        redis = cache.client.get_client()
+        changed = defaultdict(set)
+        for member in redis.zrangebyscore(
+            self._get_changed_partitions_key(year), "-inf", "+inf" if until is None else until
+        ):
+            category, _, group = member.decode().partition(":")
+            changed[category].add(group)
+        return changed
+
+    def forget_changed_partitions(self, year: int, until: float) -> None:
+        """
+        Forget the partitions changed up to the given timestamp,
+        keeping those that have changed again since.
+        """
+        redis = cache.client.get_client()
+        redis.zremrangebyscore(self._get_changed_partitions_key(year), "-inf", until)
+
+    def mirror_leaderboards(self, batch: list[models.Model]) -> None:
+        """
+        Mirror the points of the saved stats items into redis sorted sets,
+        one per year, category and gametype, server, etc, once the items are committed.
+
+        The points of a qualified category are kept aside,
+        along with a companion set of the profiles qualified for the category,
+        and only the points of the qualified profiles make it to the leaderboard.
+        """
+        if not (settings.TRACKER_LEADERBOARDS_REDIS_ENABLED and self.model.has_redis_leaderboards):
+            return
+        # the leaderboards must not get ahead of the stats, should they be rolled back
+        transaction.on_commit(lambda: self._mirror_leaderboards(batch))
+
+    def _mirror_leaderboards(self, batch: list[models.Model]) -> None:
+        qualifications = defaultdict(list)
+        for (ref_category, min_points), cats in self._get_qualifications().items():
+            qualifications[ref_category].extend((category, min_points) for category in cats)
+
+        # qualified leaderboards to check the membership of the profiles in
+        pending = set()
+        redis = cache.client.get_client()
+
+        with redis.pipeline(transaction=False) as pipe:
+            for item in batch:
+                if item.category in self.model.unranked_categories:
+                    continue
+                partition = self._get_partition(item)
+                key = self._get_leaderboard_key(item.year, item.category, **partition)
+                if item.category in self.model.qualified_categories:
+                    pipe.zadd(f"{key}:points", {item.profile_id: item.points})
+                    pending.add((key, item.profile_id))
+                else:
+                    pipe.zadd(key, {item.profile_id: item.points})
+
+                for category, min_points in qualifications[item.category]:
+                    qualified_key = self._get_leaderboard_key(item.year, category, **partition)
+                    if item.points >= min_points:
+                        pipe.sadd(f"{qualified_key}:qualified", item.profile_id)
+                    else:
+                        pipe.srem(f"{qualified_key}:qualified", item.profile_id)
+                    pending.add((qualified_key, item.profile_id))
+            pipe.execute()
+
+        if pending:
+            self._sync_qualified_leaderboards(pending)
+
+    def _sync_qualified_leaderboards(self, pending: set[tuple[str, int]]) -> None:
+        """
+        Put the profiles on the qualified leaderboards, or take them off,
+        depending on their presence in the companion set of qualified profiles.
+        """
+        redis = cache.client.get_client()
+        pending_items = list(pending)
+
+        with redis.pipeline(transaction=False) as pipe:
+            for key, profile_id in pending_items:
+                pipe.zscore(f"{key}:points", profile_id)
+                pipe.sismember(f"{key}:qualified", profile_id)
+            results = pipe.execute()
+
+        with redis.pipeline(transaction=False) as pipe:
+            for (key, profile_id), points, is_qualified in zip(
+                pending_items, results[::2], results[1::2], strict=True
+            ):
+                if points is not None and is_qualified:
+                    pipe.zadd(key, {profile_id: points})
+                else:
+                    pipe.zrem(key, profile_id)
+            pipe.execute()
+
+    def get_leaderboard(
+        self, *, year: int, category: str, limit: int, **partition: Any
+    ) -> list[tuple[int, float]]:
+        """
+        Return the ids and the points of the top profiles of the redis leaderboard.
+        """
+        redis = cache.client.get_client()
+        key = self._get_leaderboard_key(year, category, **partition)
+        items = redis.zrevrange(key, 0, limit - 1, withscores=True)
+        return [(int(profile_id), points) for profile_id, points in items]
+
+    def get_leaderboard_position(
+        self, *, profile_id: int, year: int, category: str, **partition: Any
+    ) -> int | None:
+        """
+        Return the position of the profile in the redis leaderboard, if it's on the leaderboard.
+        """
+        redis = cache.client.get_client()
+        key = self._get_leaderboard_key(year, category, **partition)
+        if (rank := redis.zrevrank(key, profile_id)) is None:
+            return None
+        return rank + 1
+
+    def clear_leaderboards(self, year: int) -> int:
+        """
+        Delete the redis leaderboards of the year.
+        Return the number of deleted keys.
+        """
+        redis = cache.client.get_client()
+        pattern = (
+            f"{settings.TRACKER_LEADERBOARDS_REDIS_KEY}:{self.model._meta.model_name}:{year}:*"
+        )
+        if keys := list(redis.scan_iter(match=pattern, count=1000)):
+            return redis.delete(*keys)
+        return 0
+
+    def _get_leaderboard_key(self, year: int, category: str, **partition: Any) -> str:
+        key = f"{settings.TRACKER_LEADERBOARDS_REDIS_KEY}:{self.model._meta.model_name}:{year}"
+        return ":".join([key, category, *(str(partition[f]) for f in self._get_partition_fields())])
+
+    def _get_qualifications(self) -> dict[tuple[str, int | float], list[str]]:
+        qualifications = defaultdict(list)
+        for category, (ref_category, setting) in self.model.qualified_categories.items():
+            qualifications[(ref_category, getattr(settings, setting))].append(category)
+        return qualifications
+
+    def _get_partition(self, item: models.Model) -> dict[str, Any]:
+        return {field: getattr(item, field) for field in self._get_partition_fields()}
+
+    def _get_changed_partitions_key(self, year: int) -> str:
+        return f"{settings.TRACKER_RANK_CHANGES_REDIS_KEY}:{self.model._meta.model_name}:{year}"
+
+    def _get_partition_fields(self) -> list[str]:
+        # map_id, gametype, server_id, etc
+        return [
+            field
+            for field in self.model.grouping_fields
+            if field not in ("category", "category_legacy")
+        ]
+
+    @contextmanager
+    def _qualified_profiles(
+        self, *, year: int, qualify: dict[str, int | float], scope: Q
+    ) -> Iterator[RawSQL]:
+        """
+        Store the profiles qualified for ranking, along with their gametype, server, etc,
+        in a temporary table for the time of ranking the categories sharing the qualification.
+
+        The table lives within the transaction ranking the categories,
+        so it never outlives the connection a pooler has handed over for the transaction.
+
+        Yield the condition the ranked items are filtered with,
+        so the qualification is checked with a single join rather than item by item.
+        """
+        columns = ["profile_id", *self._get_partition_fields()]
+        qualified_qs = None
+        for ref_category, min_points in qualify.items():
+            ref_qs = (
+                self.model.objects.filter(
+                    scope, year=year, category=ref_category, points__gte=min_points
+                )
+                .order_by()
+                .values(*columns)
+            )
+            qualified_qs = ref_qs if qualified_qs is None else qualified_qs.intersection(ref_qs)
+        qualified_sql, qualified_params = qualified_qs.query.sql_with_params()
+
+        quote_name = connection.ops.quote_name
+        temp_table = quote_name(f"{self.model._meta.db_table}_qualified")
+        column_names = ", ".join(
+            quote_name(self.model._meta.get_field(field).column) for field in columns
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {temp_table} ON COMMIT DROP AS {qualified_sql}",
+                qualified_params,
+            )
+            cursor.execute(f"ANALYZE {temp_table}")
+
+        yield RawSQL(  # noqa: S611
+            f"({column_names}) IN (SELECT {column_names} FROM {temp_table})",  # noqa: S608
+            [],
+            output_field=models.BooleanField(),
+        )
+
+        # the table would go away on commit anyway,
+        # but the transaction may be nested in another one, e.g. in tests
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {temp_table}")
+
+    def _update_positions(self, queryset: models.QuerySet) -> int:
+        positions_qs = queryset.annotate(
+            _position=models.Window(
+                expression=window.RowNumber(),
+                partition_by=[models.F(field) for field in self.model.grouping_fields],
+                order_by=[models.F("points").desc(), models.F("id").asc()],
+            )
+        ).values("pk", "_position")
+        positions_sql, positions_params = positions_qs.query.sql_with_params()
+        table = connection.ops.quote_name(self.model._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET position = positions._position "  # noqa: S608
+                f"FROM ({positions_sql}) positions "
+                f"WHERE {table}.id = positions.id "
+                f"AND {table}.position IS DISTINCT FROM positions._position",
+                positions_params,
+            )
+            return cursor.rowcount
 
 
 class ServerStatsManager(StatsManager):
@@ -287,3 +734,24 @@ class ServerStatsManager(StatsManager):
             deleted_rows_cnt,
             merged_server_ids_str,
         )
+
+        if settings.TRACKER_LEADERBOARDS_REDIS_ENABLED:
+            transaction.on_commit(lambda: self.clear_server_leaderboards(*merged_server_ids))
+
+    def clear_server_leaderboards(self, *server_ids: int) -> int:
+        """
+        Delete the redis leaderboards of the servers for all years.
+        Return the number of deleted keys.
+        """
+        redis = cache.client.get_client()
+        prefix = f"{settings.TRACKER_LEADERBOARDS_REDIS_KEY}:{self.model._meta.model_name}"
+        keys = [
+            key
+            for server_id in server_ids
+            # the leaderboards along with their points and qualified profiles
+            for pattern in [f"{prefix}:*:*:{server_id}", f"{prefix}:*:*:{server_id}:*"]
+            for key in redis.scan_iter(match=pattern, count=1000)
+        ]
+        if keys:
+            return redis.delete(*keys)
+        return 0
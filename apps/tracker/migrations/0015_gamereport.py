@@ -0,0 +1,31 @@
+# Generated by Django 6.1 on 2026-10-19 12:04
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0014_alter_map_slug_alter_server_status_port"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameReport",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=8)),
+                ("server_ip", models.GenericIPAddressField(protocol="IPv4")),
+                ("received_at", models.DateTimeField()),
+                ("data", models.BinaryField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["tag"], name="tracker_gamereport_tag"),
+                    django.contrib.postgres.indexes.BrinIndex(
+                        fields=["received_at"], name="tracker_gamereport_received_at"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.1 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0015_gamereport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alias",
+            name="last_seen_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
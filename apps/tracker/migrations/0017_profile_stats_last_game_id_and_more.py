@@ -0,0 +1,22 @@
+# Generated by Django 6.1 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0016_alias_last_seen_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="stats_last_game_id",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="stats_recomputed_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
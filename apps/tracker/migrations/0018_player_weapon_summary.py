@@ -0,0 +1,52 @@
+# Generated by Django 6.1 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0017_profile_stats_last_game_id_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="weapon_shots",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="weapon_hits",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="weapon_kills",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="weapon_teamhits",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="grenade_shots",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="grenade_hits",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="grenade_kills",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="grenade_teamhits",
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.1 on 2026-10-19 18:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tracker", "0018_player_weapon_summary"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alias",
+            index=models.Index(
+                django.db.models.functions.text.Upper("name"),
+                models.F("last_seen_at"),
+                name="tracker_alias_upper_name_last_seen_at",
+            ),
+        ),
+    ]
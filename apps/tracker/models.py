@@ -3,6 +3,7 @@ from typing import Any, ClassVar
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -16,6 +17,7 @@ from apps.tracker.entities import Equipment, GameNeighbors, GameType
 from apps.tracker.managers import (
     AliasManager,
     GameManager,
+    GameReportManager,
     LoadoutManager,
     MapManager,
     PlayerManager,
@@ -195,6 +197,30 @@ class Game(models.Model):
         return Game.objects.get_neighbors_for_game(self)
 
 
+class GameReport(models.Model):
+    """
+    Append-only archive of the game data accepted by the stream api.
+    """
+
+    id = models.BigAutoField("ID", primary_key=True)
+    tag = models.CharField(max_length=8)
+    server_ip = models.GenericIPAddressField(protocol="IPv4")
+    received_at = models.DateTimeField()
+    # zlib compressed json of the validated game data
+    data = models.BinaryField()
+
+    objects = GameReportManager()
+
+    class Meta:
+        indexes: ClassVar[list[models.Index]] = [
+            models.Index(fields=["tag"], name="tracker_gamereport_tag"),
+            BrinIndex(fields=["received_at"], name="tracker_gamereport_received_at"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.tag} - {self.received_at}"
+
+
 class Loadout(models.Model):
     primary = EnumField(db_column="primary_enum", enum_type="equipment_enum")
     primary_legacy = models.SmallIntegerField(db_column="primary", default=0)
@@ -298,6 +324,9 @@ class Alias(models.Model):
     search = SearchVectorField(null=True, help_text=_("TSV field for full text search."))
     search_updated_at = models.DateTimeField(null=True)
 
+    # date of the latest game played with the alias
+    last_seen_at = models.DateTimeField(null=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -307,6 +336,9 @@ class Alias(models.Model):
         indexes: ClassVar[list[models.Index]] = [
             models.Index(fields=["name", "isp"]),
             models.Index(Upper("name"), F("isp_id"), name="tracker_alias_upper_name_isp_id"),
+            models.Index(
+                Upper("name"), F("last_seen_at"), name="tracker_alias_upper_name_last_seen_at"
+            ),
         ]
 
     def __str__(self) -> str:
@@ -357,6 +389,16 @@ class Player(models.Model):
     coop_enemy_kills_invalid = models.SmallIntegerField(default=0)
     coop_toc_reports = models.SmallIntegerField(default=0)
 
+    # summary of the qualified weapons and grenades stats, see PlayerManager.summarize_weapons
+    weapon_shots = models.IntegerField(null=True)
+    weapon_hits = models.IntegerField(null=True)
+    weapon_kills = models.IntegerField(null=True)
+    weapon_teamhits = models.IntegerField(null=True)
+    grenade_shots = models.IntegerField(null=True)
+    grenade_hits = models.IntegerField(null=True)
+    grenade_kills = models.IntegerField(null=True)
+    grenade_teamhits = models.IntegerField(null=True)
+
     objects = PlayerManager.from_queryset(PlayerQuerySet)()
 
     _gun_weapon_names: ClassVar[set[str]] = set(
@@ -495,6 +537,9 @@ class Profile(models.Model):
     first_seen_at = models.DateTimeField(null=True)
     last_seen_at = models.DateTimeField(null=True)
     stats_updated_at = models.DateTimeField(null=True)
+    # the last game folded into the stats and the time of the last full stats recompute
+    stats_last_game_id = models.IntegerField(null=True)
+    stats_recomputed_at = models.DateTimeField(null=True)
     preferences_updated_at = models.DateTimeField(null=True)
 
     names = ArrayField(
@@ -537,6 +582,16 @@ class Stats(models.Model):
     class Meta:
         abstract = True
 
+    # categories that are only ranked for the profiles with enough points of another category,
+    # mapped to that category and the setting holding the min points
+    qualified_categories: ClassVar[dict[str, tuple[str, str]]] = {}
+    # categories that are not ranked at all
+    unranked_categories: ClassVar[list[str]] = []
+    # whether the positions are ranked for the year leaderboards
+    has_positions: ClassVar[bool] = False
+    # whether the points are mirrored into redis leaderboards
+    has_redis_leaderboards: ClassVar[bool] = False
+
 
 class PlayerStats(Stats):  # noqa: DJ008
     # FIXME: set not null
@@ -561,6 +616,17 @@ class PlayerStats(Stats):  # noqa: DJ008
 
     grouping_fields: ClassVar[list[str]] = ["category_legacy"]
     unique_db_fields: ClassVar[list[str]] = ["year", "category_legacy", "profile_id"]
+    qualified_categories: ClassVar[dict[str, tuple[str, str]]] = {
+        "spm_ratio": ("time", "TRACKER_MIN_TIME"),
+        "spr_ratio": ("games", "TRACKER_MIN_GAMES"),
+        "kd_ratio": ("kills", "TRACKER_MIN_KILLS"),
+        "weapon_hit_ratio": ("weapon_shots", "TRACKER_MIN_WEAPON_SHOTS"),
+        "weapon_kill_ratio": ("weapon_shots", "TRACKER_MIN_WEAPON_SHOTS"),
+        "grenade_hit_ratio": ("grenade_shots", "TRACKER_MIN_GRENADE_SHOTS"),
+    }
+    unranked_categories: ClassVar[list[str]] = ["weapon_teamhit_ratio", "grenade_teamhit_ratio"]
+    has_positions: ClassVar[bool] = True
+    has_redis_leaderboards: ClassVar[bool] = True
 
 
 class MapStats(Stats):  # noqa: DJ008
@@ -591,6 +657,12 @@ class GametypeStats(Stats):  # noqa: DJ008
 
     grouping_fields: ClassVar[list[str]] = ["category", "gametype"]
     unique_db_fields: ClassVar[list[str]] = ["year", "category", "profile_id", "gametype"]
+    qualified_categories: ClassVar[dict[str, tuple[str, str]]] = {
+        "spm_ratio": ("time", "TRACKER_MIN_TIME"),
+        "spr_ratio": ("games", "TRACKER_MIN_GAMES"),
+    }
+    has_positions: ClassVar[bool] = True
+    has_redis_leaderboards: ClassVar[bool] = True
 
 
 class ServerStats(Stats):  # noqa: DJ008
@@ -608,6 +680,13 @@ class ServerStats(Stats):  # noqa: DJ008
 
     grouping_fields: ClassVar[list[str]] = ["category", "server_id"]
     unique_db_fields: ClassVar[list[str]] = ["year", "category", "profile_id", "server_id"]
+    qualified_categories: ClassVar[dict[str, tuple[str, str]]] = {
+        "spm_ratio": ("time", "TRACKER_MIN_TIME"),
+        "spr_ratio": ("games", "TRACKER_MIN_GAMES"),
+        "kd_ratio": ("kills", "TRACKER_MIN_KILLS"),
+    }
+    has_positions: ClassVar[bool] = True
+    has_redis_leaderboards: ClassVar[bool] = True
 
 
 class WeaponStats(Stats):  # noqa: DJ008
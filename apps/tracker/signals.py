@@ -1,16 +1,20 @@
 import logging
+from ipaddress import IPv4Network
 from typing import Any
 
+from django.conf import settings
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import Signal, receiver
 
-from apps.tracker.models import Game, Server
+from apps.geoip.models import ISP
+from apps.geoip.signals import queued_whois_resolved, whois_resolved
+from apps.tracker.models import Alias, Game, Profile, Server
 
 logger = logging.getLogger(__name__)
 
 game_data_received = Signal()  # providing_args=['data', 'server', 'request']
-game_data_saved = Signal()  # providing_args=['data', 'server', 'game']
+game_data_saved = Signal()  # providing_args=['data', 'server', 'game', 'batched']
 live_servers_detected = Signal()  # providing_args=['servers']
 failed_servers_detected = Signal()  # providing_args=['servers']
 
@@ -27,6 +31,77 @@ def delay_update_server_country(
     transaction.on_commit(lambda: update_server_country.delay(instance.pk))
 
 
+@receiver(post_save, sender=Server)
+def forget_stream_server(
+    sender: Any,  # noqa: ARG001
+    instance: Server,
+    **_: Any,
+) -> None:
+    Server.objects.forget_stream_servers(instance)
+
+
+@receiver(post_save, sender=Alias)
+def forget_alias_profile_matches(
+    sender: Any,  # noqa: ARG001
+    instance: Alias,
+    *,
+    created: bool,
+    **_: Any,
+) -> None:
+    # new aliases are taken care of by create_alias
+    if created:
+        return
+    Profile.objects.forget_match_smart_results(name=instance.name)
+
+
+@receiver(post_save, sender=ISP)
+@receiver(post_delete, sender=ISP)
+def reset_changed_isp_ip_range_index(
+    sender: Any,  # noqa: ARG001
+    instance: ISP,  # noqa: ARG001
+    *,
+    created: bool = False,
+    **_: Any,
+) -> None:
+    # the isp rows resolved through the index are cached along with it
+    if created or not settings.GEOIP_IP_INDEX_ENABLED:
+        return
+    transaction.on_commit(ISP.objects.reset_ip_range_index)
+
+
+@receiver(whois_resolved)
+def update_resolved_servers_country(
+    sender: Any,  # noqa: ARG001
+    isp: ISP,
+    cidr: IPv4Network,
+    **_: Any,
+) -> None:
+    if not (isp and isp.country):
+        return
+
+    updated = (
+        Server.objects.extra(where=["ip <<= %s::cidr"], params=[str(cidr)])
+        .exclude(country=isp.country)
+        .update(country=isp.country)
+    )
+    if updated:
+        logger.info("updated country to %s for %d servers in %s", isp.country, updated, cidr)
+
+
+@receiver(queued_whois_resolved)
+def update_resolved_aliases_isp(
+    sender: Any,  # noqa: ARG001
+    isp: ISP,
+    network: IPv4Network,
+    **_: Any,
+) -> None:
+    if not isp:
+        return
+
+    if updated := Alias.objects.update_resolved_isp(isp, network):
+        logger.info("updated isp to %s for %d aliases in %s", isp.pk, updated, network)
+
+
 @receiver(live_servers_detected)
 def update_live_servers_hostnames(
     sender: Any,  # noqa: ARG001
@@ -144,9 +219,16 @@ def change_hostname_for_streaming_server(
 
 @receiver(game_data_saved)
 @transaction.atomic(savepoint=False)
-def delay_game_related_stats_tasks(sender: Any, game: Game, **kwargs: Any) -> None:  # noqa: ARG001
-    from apps.tracker.tasks import update_map_games, update_profile_games, update_server_games
+def queue_game_related_stats_update(
+    sender: Any,  # noqa: ARG001
+    game: Game,
+    *,
+    batched: bool = False,
+    **kwargs: Any,
+) -> None:
+    # batched games have their related stats updated along with the batch
+    if batched:
+        return
 
-    transaction.on_commit(lambda: update_profile_games.delay(game.pk))
-    transaction.on_commit(lambda: update_server_games.delay(game.pk))
-    transaction.on_commit(lambda: update_map_games.delay(game.pk))
+    # the pending games are picked up by the periodic update_pending_games task
+    transaction.on_commit(lambda: Game.objects.add_pending_games(game.pk))
@@ -1,12 +1,16 @@
 import logging
 import random
 
+from django.conf import settings
+
+from apps.tracker.entities import ProfileUpdateQueue
 from apps.tracker.models import Profile
 from apps.utils.misc import iterate_queryset
 from swat4stats.celery import Queue, app
 
 __all__ = [
     "denorm_profile_names",
+    "drain_player_preferences_queue",
     "update_player_preferences",
     "update_player_preferences_for_profile",
 ]
@@ -22,6 +26,13 @@ def update_player_preferences() -> None:
     for players recently seen playing.
     """
     queryset = Profile.objects.require_preference_update()
+
+    if settings.TRACKER_PROFILE_QUEUE_ENABLED:
+        profile_ids = list(queryset.values_list("pk", flat=True))
+        queued = Profile.objects.queue_for_update(ProfileUpdateQueue.preferences, *profile_ids)
+        logger.info("queued %d of %d profiles for preference update", queued, len(profile_ids))
+        return
+
     for profile in queryset.only("pk"):
         logger.info("profile %s requires preference update", profile.pk)
         update_player_preferences_for_profile.apply_async(
@@ -37,6 +48,32 @@ def update_player_preferences_for_profile(profile_pk: int) -> None:
     Profile.objects.update_preferences_for_profile(profile)
 
 
+@app.task(name="drain_player_preferences_queue", queue=Queue.default.value)
+def drain_player_preferences_queue() -> None:
+    """
+    Update preferences for the next chunk of the profiles pending in the preferences queue.
+    """
+    profile_ids = Profile.objects.get_queued_for_update(
+        ProfileUpdateQueue.preferences, settings.TRACKER_PREFERENCES_QUEUE_CHUNK_SIZE
+    )
+    if not profile_ids:
+        return
+
+    for profile in Profile.objects.filter(pk__in=profile_ids):
+        Profile.objects.update_preferences_for_profile(profile)
+        Profile.objects.ack_queued_for_update(ProfileUpdateQueue.preferences, profile.pk)
+    # the profiles that have been merged in the meantime
+    Profile.objects.ack_queued_for_update(ProfileUpdateQueue.preferences, *profile_ids)
+
+    metrics = Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.preferences)
+    logger.info(
+        "updated preferences for %d queued profiles; %d pending, lag %.1fs",
+        len(profile_ids),
+        metrics["depth"],
+        metrics["lag"],
+    )
+
+
 @app.task(name="denorm_profile_names", queue=Queue.default.value)
 def denorm_profile_names(chunk_size: int = 1000) -> None:
     profiles_with_ids = Profile.objects.require_denorm_names().using("replica")
@@ -91,7 +91,7 @@ def update_server_country(server_id: int) -> None:
     Detect and update the server's country.
     """
     obj = Server.objects.get(pk=server_id)
-    isp, _ = ISP.objects.match_or_create(obj.ip)
+    isp = ISP.objects.match_or_queue(obj.ip)
 
     if not (isp and isp.country):
         logger.info("wont update country for server %s due to empty isp/country", server_id)
@@ -1,16 +1,21 @@
 import logging
 import random
 
+from django.conf import settings
 from django.utils import timezone
 
+from apps.tracker.entities import ProfileUpdateQueue
 from apps.tracker.models import Profile
+from apps.utils.misc import iterate_list
 from swat4stats.celery import Queue, app
 
 __all__ = [
+    "drain_player_stats_queue",
     "settle_annual_player_positions",
     "update_player_positions",
     "update_player_stats",
     "update_player_stats_for_profile",
+    "update_player_stats_for_profiles",
 ]
 
 logger = logging.getLogger(__name__)
@@ -23,6 +28,23 @@ def update_player_stats() -> None:
     """
     cnt = 0
     queryset = Profile.objects.require_stats_update()
+
+    if settings.TRACKER_PROFILE_QUEUE_ENABLED:
+        profile_ids = list(queryset.values_list("pk", flat=True))
+        queued = Profile.objects.queue_for_update(ProfileUpdateQueue.stats, *profile_ids)
+        logger.info("queued %d of %d profiles for stats update", queued, len(profile_ids))
+        return
+
+    if settings.TRACKER_STATS_COHORT_ENABLED:
+        profile_ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+        for cohort in iterate_list(profile_ids, size=settings.TRACKER_STATS_COHORT_SIZE):
+            update_player_stats_for_profiles.apply_async(
+                args=(cohort,), countdown=random.randint(5, 60)
+            )
+        if profile_ids:
+            logger.info("updating stats for %s profiles in cohorts", len(profile_ids))
+        return
+
     for profile in queryset.only("pk"):
         cnt += 1
         update_player_stats_for_profile.apply_async(
@@ -40,13 +62,53 @@ def update_player_stats_for_profile(profile_id: int) -> None:
     logger.info("finished updating stats for profile %s (%s)", profile_id, profile)
 
 
+@app.task(name="drain_player_stats_queue", queue=Queue.default.value)
+def drain_player_stats_queue() -> None:
+    """
+    Update the stats of the next chunk of the profiles pending in the stats queue.
+    """
+    profile_ids = Profile.objects.get_queued_for_update(
+        ProfileUpdateQueue.stats, settings.TRACKER_STATS_QUEUE_CHUNK_SIZE
+    )
+    if not profile_ids:
+        return
+
+    if settings.TRACKER_STATS_COHORT_ENABLED:
+        for cohort in iterate_list(profile_ids, size=settings.TRACKER_STATS_COHORT_SIZE):
+            Profile.objects.update_stats_for_profiles(*cohort)
+            Profile.objects.ack_queued_for_update(ProfileUpdateQueue.stats, *cohort)
+    else:
+        for profile in Profile.objects.filter(pk__in=profile_ids):
+            Profile.objects.update_stats_for_profile(profile)
+            Profile.objects.ack_queued_for_update(ProfileUpdateQueue.stats, profile.pk)
+        # the profiles that have been merged in the meantime
+        Profile.objects.ack_queued_for_update(ProfileUpdateQueue.stats, *profile_ids)
+
+    metrics = Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)
+    logger.info(
+        "updated stats for %d queued profiles; %d pending, lag %.1fs",
+        len(profile_ids),
+        metrics["depth"],
+        metrics["lag"],
+    )
+
+
+@app.task(queue=Queue.default.value)
+def update_player_stats_for_profiles(profile_ids: list[int]) -> None:
+    logger.info("updating stats for cohort of %d profiles", len(profile_ids))
+    Profile.objects.update_stats_for_profiles(*profile_ids)
+    logger.info("finished updating stats for cohort of %d profiles", len(profile_ids))
+
+
 @app.task(name="update_player_positions", queue=Queue.default.value)
 def update_player_positions() -> None:
     """
     Update leaderboards' positions for a period of the current year
     """
     now = timezone.now()
-    Profile.objects.update_player_positions_for_year(now.year)
+    Profile.objects.update_player_positions_for_year(
+        now.year, incremental=settings.TRACKER_RANK_INCREMENTAL_ENABLED
+    )
 
 
 @app.task(name="settle_annual_player_positions", queue=Queue.default.value)
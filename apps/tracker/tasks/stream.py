@@ -3,16 +3,22 @@ from datetime import datetime
 from typing import Any
 
 import celery
+from django.conf import settings
+from django.db import transaction
 from pytz import utc
 
 from apps.tracker.exceptions import GameAlreadySavedError
-from apps.tracker.models import Game, Map, Profile, Server
+from apps.tracker.models import Game, GameReport, Map, Profile, Server
 from apps.tracker.signals import game_data_saved
+from apps.utils.misc import iterate_list
 from swat4stats.celery import Queue, app
 
 __all__ = [
     "process_game_data",
+    "process_queued_games",
+    "replay_game_reports",
     "update_map_games",
+    "update_pending_games",
     "update_profile_games",
     "update_server_games",
 ]
@@ -21,46 +27,290 @@ logger = logging.getLogger(__name__)
 
 
 @app.task(bind=True, default_retry_delay=60, max_retries=5, queue=Queue.default.value)
-def process_game_data(
+def process_game_data(  # noqa: PLR0913
     self: celery.Task,
-    server_id: int,
+    server_id: int | None,
     data: dict[str, Any],
     data_received_ts: float,
+    server_ip: str | None = None,
+    *,
+    archive: bool = True,
+    replay: bool = False,
 ) -> None:
     """
     Attempt to save a game with given server
 
-    :param server_id: Server instance id
+    :param server_id: Server instance id, if the server was known at the time the data was received
     :param data: Validated game data
     :param data_received_at: Time the data was received at
+    :param server_ip: IP address the data was received from
+    :param archive: Whether to append the data to the game report archive
+    :param replay: Whether the data is replayed from the archive or imported from elsewhere
     """
     data_received_at = datetime.fromtimestamp(data_received_ts, tz=utc)
-    server = Server.objects.get(pk=server_id)
+
+    if Game.objects.is_game_tag_saved(data["tag"]):
+        logger.info("game with tag %s has recently been saved", data["tag"])
+        return
+
+    if server_ip is None:
+        server = Server.objects.get(pk=server_id)
+    else:
+        server = Server.objects.obtain_stream_server(
+            ip=server_ip, port=data["port"], server_id=server_id
+        )
+
+    # retried tasks have already archived their data
+    if archive and not self.request.retries:
+        GameReport.objects.archive(
+            {"server_ip": server.ip, "data": data, "data_received_ts": data_received_ts}
+        )
+
+    if not server.enabled:
+        logger.info(
+            "wont save game %s from disabled server %s (%s)", data["tag"], server, server.pk
+        )
+        return
+
+    if not replay:
+        Server.objects.update_mod_version(server, data["version"])
 
     try:
         game = Game.objects.create_game(server=server, data=data, date_finished=data_received_at)
     except GameAlreadySavedError:
-        pass
+        Game.objects.remember_saved_game_tags(data["tag"])
     except Exception as exc:
         logger.exception("failed to create game", extra={"data": {"data": data}})
         self.retry(exc=exc)
     else:
-        game_data_saved.send_robust(sender=None, data=data, server=server, game=game)
+        Game.objects.remember_saved_game_tags(data["tag"])
+        # replayed games must not bring back the outdated server details
+        if replay:
+            Game.objects.add_pending_games(game.pk)
+        else:
+            game_data_saved.send_robust(sender=None, data=data, server=server, game=game)
+
+
+@app.task(name="process_queued_games", queue=Queue.default.value)
+def process_queued_games(batch_size: int | None = None) -> None:
+    """
+    Drain the queue of streamed games, saving the games in batches.
+
+    Only one worker drains the queue at a time,
+    and a batch is acknowledged only once it has been handled,
+    so the batch of a worker that has died is picked up by the next run.
+    """
+    batch_size = batch_size or settings.TRACKER_GAME_BATCH_SIZE
+
+    lock = Game.objects.get_game_queue_lock()
+    if not lock.acquire(blocking=False):
+        logger.info("queued games are being saved by another worker")
+        return
+
+    try:
+        while queued_items := Game.objects.pop_queued_game_data(batch_size):
+            logger.info("saving batch of %d queued games", len(queued_items))
+            save_game_batch(queued_items)
+            Game.objects.ack_queued_game_data()
+            if len(queued_items) < batch_size:
+                break
+    finally:
+        lock.release()
+
+
+def save_game_batch(
+    items: list[dict[str, Any]],
+    *,
+    replay: bool = False,
+    retry_failed: bool = True,
+) -> tuple[int, list[dict[str, Any]]]:
+    """
+    Save queued games in a single transaction,
+    then update the related servers, maps and profiles with one update per table.
+
+    Every game is saved within its own savepoint,
+    so a failing game does not affect the rest of the batch.
+    Unless told otherwise, the failed games are handed over to process_game_data
+    to be retried individually, in the same replay mode as the batch.
+
+    Unless replayed, the games are appended to the game report archive beforehand.
+
+    :param items: Queued items, each bearing the arguments of process_game_data
+    :param replay: Whether the items are replayed from the archive or imported from elsewhere
+    :param retry_failed: Whether to retry the failed games with process_game_data
+    :return: Number of saved games and the items that have failed to save
+    """
+    if not replay:
+        items = _archive_unsaved_games(items)
+
+    try:
+        saved, failed = _save_batched_games(items, replay=replay)
+    except Exception:
+        logger.exception("failed to save batch of %d games", len(items))
+        saved, failed = [], items
+
+    if saved:
+        Game.objects.remember_saved_game_tags(*(data["tag"] for data, _, _ in saved))
+
+    if retry_failed:
+        for item in failed:
+            process_game_data.delay(**item, archive=False, replay=replay)
+
+    # replayed games must not bring back the outdated server details
+    if not replay:
+        _send_batched_games_saved(saved)
+
+    return len(saved), failed
+
+
+@app.task(name="replay_game_reports", queue=Queue.heavy.value)
+def replay_game_reports(report_ids: list[int], batch_size: int | None = None) -> None:
+    """
+    Save the games from the archived reports, skipping the games that have already been saved.
+
+    :param report_ids: Ids of the archived game reports
+    :param batch_size: Number of games to save per transaction
+    """
+    batch_size = batch_size or settings.TRACKER_GAME_BATCH_SIZE
+    items = list(GameReport.objects.iterate_queued_items(*report_ids))
+
+    logger.info("replaying %d archived games", len(items))
+    for batch in iterate_list(items, size=batch_size):
+        save_game_batch(batch, replay=True)
+
+
+@transaction.atomic(durable=True)
+def _save_batched_games(
+    items: list[dict[str, Any]],
+    *,
+    replay: bool,
+) -> tuple[list[tuple[dict[str, Any], Server, Game]], list[dict[str, Any]]]:
+    saved: list[tuple[dict[str, Any], Server, Game]] = []
+    failed: list[dict[str, Any]] = []
+    servers: dict[tuple[str, int], Server] = {}
+
+    for item in items:
+        try:
+            if result := _save_batched_game(item, servers, replay=replay):
+                saved.append(result)
+        except Exception:
+            logger.exception("failed to create batched game", extra={"data": item})
+            failed.append(item)
+
+    if saved:
+        game_ids = [game.pk for _, _, game in saved]
+        Server.objects.update_game_stats_with_games(*game_ids)
+        Map.objects.update_game_stats_with_games(*game_ids)
+        Profile.objects.update_with_games(*game_ids)
+
+    return saved, failed
+
+
+def _send_batched_games_saved(saved: list[tuple[dict[str, Any], Server, Game]]) -> None:
+    for data, server, game in saved:
+        game_data_saved.send_robust(sender=None, data=data, server=server, game=game, batched=True)
+
+
+def _archive_unsaved_games(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    if saved_tags := Game.objects.get_saved_game_tags(*(item["data"]["tag"] for item in items)):
+        logger.info("skipping %d recently saved games", len(saved_tags))
+        items = [item for item in items if item["data"]["tag"] not in saved_tags]
+
+    if items:
+        GameReport.objects.archive(*items)
+
+    return items
+
+
+def _save_batched_game(
+    item: dict[str, Any],
+    servers: dict[tuple[str, int], Server],
+    *,
+    replay: bool,
+) -> tuple[dict[str, Any], Server, Game] | None:
+    data = item["data"]
+    server_addr = (item["server_ip"], data["port"])
+    data_received_at = datetime.fromtimestamp(item["data_received_ts"], tz=utc)
+
+    with transaction.atomic():
+        # servers often stream more than one game per batch
+        if not (server := servers.get(server_addr)):
+            server = Server.objects.obtain_stream_server(
+                ip=server_addr[0], port=server_addr[1], server_id=item["server_id"]
+            )
+
+        if not server.enabled:
+            logger.info(
+                "wont save game %s from disabled server %s (%s)", data["tag"], server, server.pk
+            )
+            return None
+
+        if not replay:
+            Server.objects.update_mod_version(server, data["version"])
+
+        try:
+            game = Game.objects.create_game(
+                server=server, data=data, date_finished=data_received_at
+            )
+        except GameAlreadySavedError:
+            return None
+
+    # only share the server once its savepoint has been released
+    servers[server_addr] = server
+
+    return data, server, game
+
+
+@app.task(name="update_pending_games", queue=Queue.default.value)
+def update_pending_games(chunk_size: int | None = None) -> None:
+    """
+    Update the servers, maps and profiles with the games saved since the last run,
+    using a single update per table for every chunk of pending games.
+
+    Only one worker updates the pending games at a time,
+    and a chunk is acknowledged only once its updates have been committed,
+    so the chunk of a worker that has died is picked up by the next run.
+    """
+    chunk_size = chunk_size or settings.TRACKER_PENDING_GAMES_CHUNK_SIZE
+
+    lock = Game.objects.get_pending_games_lock()
+    if not lock.acquire(blocking=False):
+        logger.info("pending games are being updated by another worker")
+        return
+
+    try:
+        while game_ids := Game.objects.get_pending_games(chunk_size):
+            logger.info("updating related stats for %d games", len(game_ids))
+            with transaction.atomic():
+                Server.objects.update_game_stats_with_games(*game_ids)
+                Map.objects.update_game_stats_with_games(*game_ids)
+                Profile.objects.update_with_games(*game_ids)
+            Game.objects.ack_pending_games(*game_ids)
+            if len(game_ids) < chunk_size:
+                break
+    finally:
+        lock.release()
 
 
 @app.task(queue=Queue.default.value)
 def update_profile_games(game_id: int) -> None:
-    game = Game.objects.get(pk=game_id)
-    Profile.objects.update_with_game(game)
+    """
+    Deprecated, kept for the tasks queued before the upgrade. Remove in the next release.
+    """
+    Game.objects.add_pending_games(game_id)
 
 
 @app.task(queue=Queue.default.value)
 def update_server_games(game_id: int) -> None:
-    game = Game.objects.get(pk=game_id)
-    Server.objects.update_game_stats_with_game(game)
+    """
+    Deprecated, kept for the tasks queued before the upgrade. Remove in the next release.
+    """
+    Game.objects.add_pending_games(game_id)
 
 
 @app.task(queue=Queue.default.value)
 def update_map_games(game_id: int) -> None:
-    game = Game.objects.get(pk=game_id)
-    Map.objects.update_game_stats_with_game(game)
+    """
+    Deprecated, kept for the tasks queued before the upgrade. Remove in the next release.
+    """
+    Game.objects.add_pending_games(game_id)
@@ -0,0 +1,35 @@
+import json
+from typing import Any
+
+from voluptuous import Invalid
+
+from apps.tracker.schema import game_schema
+from apps.tracker.utils.parser import JuliaQueryString
+
+
+def decode_game_line(line: bytes) -> dict[str, Any]:
+    """
+    Decode a line of json or julia encoded game data and validate it with the game schema.
+
+    The function does not touch the django machinery,
+    so that it can be run in a process pool.
+    """
+    body = line.decode().strip()
+    decoded_body = json.loads(body) if body.startswith("{") else JuliaQueryString.decode(body)
+    return game_schema(decoded_body)
+
+
+def decode_game_line_at(
+    line_at: tuple[int, int, bytes],
+) -> tuple[int, int, dict[str, Any] | None, str | None]:
+    """
+    Decode a game line located between the given byte offsets of a file.
+
+    Return the offsets along with either the validated game data or the decoding error.
+    """
+    start, end, line = line_at
+    try:
+        data = decode_game_line(line)
+    except (Invalid, TypeError, ValueError) as exc:
+        return start, end, None, str(exc)
+    return start, end, data, None
@@ -4,6 +4,18 @@ from urllib.parse import unquote_plus
 
 
 class JuliaQueryString(dict):
+    @classmethod
+    def decode(cls, query_string: str) -> "JuliaQueryString":
+        """
+        Parse a julia querystring and expand it with the method matching its format,
+        i.e. dot delimited keys (julia v2) or php's array like keys (julia v1).
+        """
+        julia_parser = cls()
+        julia_parser.parse(query_string)
+        julia_dotted = any("." in key for key in julia_parser)
+        expand_func = cls.expand_dots if julia_dotted else cls.expand_array
+        return expand_func(julia_parser)
+
     def parse(self, query_string: str) -> "JuliaQueryString":
         """
         Parse a raw querystring and set the parsed items as members of the instance.
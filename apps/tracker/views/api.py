@@ -96,16 +96,7 @@ def require_julia_schema(schema: Callable, schema_error_message: str | None = No
                         return APIResponse.from_error(schema_error_message)
                 # legacy formats
                 case _:
-                    julia_parser = JuliaQueryString()
-                    julia_parser.parse(request_body)
-                    julia_dotted = any("." in key for key in julia_parser)
-                    expand_func = (
-                        JuliaQueryString.expand_dots
-                        if julia_dotted
-                        else JuliaQueryString.expand_array
-                    )
-                    # expand data with either method
-                    decoded_body = expand_func(julia_parser)
+                    decoded_body = JuliaQueryString.decode(request_body)
 
             try:
                 # validate the request data with the specified schema
@@ -2,11 +2,12 @@ from random import choice
 from typing import Any, ClassVar
 
 from django import forms
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import TemplateView
 
-from apps.tracker.models import GametypeStats, PlayerStats
+from apps.tracker.models import GametypeStats, PlayerStats, Profile
 from apps.tracker.utils.misc import get_current_stat_year
 
 
@@ -155,6 +156,11 @@ class APIMotdLeaderboardView(TemplateView):
     ) -> list[PlayerStats | GametypeStats]:
         effective_year = get_current_stat_year()
 
+        if settings.TRACKER_LEADERBOARDS_REDIS_ENABLED:
+            return self._get_players_from_redis_leaderboard(
+                category, gametype, limit, year=effective_year
+            )
+
         if gametype:
             qs = GametypeStats.objects.filter(
                 category=category, gametype=gametype, year=effective_year
@@ -170,6 +176,32 @@ class APIMotdLeaderboardView(TemplateView):
 
         return list(qs)
 
+    def _get_players_from_redis_leaderboard(
+        self, category: str, gametype: str | None, limit: int, *, year: int
+    ) -> list[PlayerStats | GametypeStats]:
+        if gametype:
+            model, partition = GametypeStats, {"gametype": gametype}
+        else:
+            model, partition = PlayerStats, {}
+
+        leaders = model.objects.get_leaderboard(
+            year=year, category=category, limit=limit, **partition
+        )
+        profiles = Profile.objects.in_bulk([profile_id for profile_id, _ in leaders])
+
+        return [
+            model(
+                profile=profiles[profile_id],
+                category=category,
+                year=year,
+                points=points,
+                position=position,
+                **partition,
+            )
+            for position, (profile_id, points) in enumerate(leaders, start=1)
+            if profile_id in profiles
+        ]
+
 
 class APILegacySummaryView(TemplateView):
     template_name = "tracker/api/motd/summary.html"
@@ -0,0 +1,16 @@
+from django.http import HttpRequest, JsonResponse
+
+from apps.tracker.entities import ProfileUpdateQueue
+from apps.tracker.models import Profile
+
+
+def profile_queues(_: HttpRequest) -> JsonResponse:
+    """
+    Report the depth and the lag of the profile update queues.
+    """
+    return JsonResponse(
+        {
+            queue.value: Profile.objects.get_update_queue_metrics(queue)
+            for queue in ProfileUpdateQueue
+        }
+    )
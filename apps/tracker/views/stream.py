@@ -1,7 +1,7 @@
 import logging
 from typing import Any
 
-from django.db import transaction
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -9,7 +9,8 @@ from django.utils.translation import gettext_lazy as _
 from django.views import generic
 
 from apps.tracker import schema
-from apps.tracker.models import Server
+from apps.tracker.entities import StreamServer
+from apps.tracker.models import Game, Server
 from apps.tracker.tasks import process_game_data
 from apps.tracker.views.api import APIError, APIResponse, require_julia_schema
 
@@ -33,70 +34,66 @@ class DataStreamView(generic.View):
         except APIError as exc:
             return APIResponse.from_error(exc.message)
 
-    @transaction.atomic
     def handle(self, request: HttpRequest, game_data: dict[str, Any]) -> HttpResponse:
-        server = self._get_or_create_server(
-            ip=request.META["REAL_REMOTE_ADDR"], port=game_data["port"]
-        )
+        """
+        Accept the game data and queue it for processing.
+
+        The streaming server is resolved with the help of a cache,
+        so that accepting a round normally costs no database queries.
+        The rounds that have recently been saved are acknowledged without being queued.
+        Registering new servers and updating the mod version is left to the worker.
+        """
+        server_ip = request.META["REAL_REMOTE_ADDR"]
+        server_port = game_data["port"]
+
+        # servers keep reporting the same round until they get a response
+        if Game.objects.is_game_tag_saved(game_data["tag"]):
+            logger.info(
+                "game %s from %s:%s is already saved", game_data["tag"], server_ip, server_port
+            )
+            return APIResponse.from_success()
+
+        server = self._get_stream_server(ip=server_ip, port=server_port)
         received_at = timezone.now()
 
         logger.info(
-            "process data for game %s from %s at %s", game_data["tag"], server.address, received_at
+            "process data for game %s from %s:%s at %s",
+            game_data["tag"],
+            server_ip,
+            server_port,
+            received_at,
         )
-        transaction.on_commit(
-            lambda: process_game_data.delay(
-                server_id=server.pk, data=game_data, data_received_ts=received_at.timestamp()
-            )
-        )
-
-        self._update_server_mod_version(server, game_data["version"])
+        queue_kwargs = {
+            "server_id": server.id if server else None,
+            "server_ip": server_ip,
+            "data": game_data,
+            "data_received_ts": received_at.timestamp(),
+        }
+
+        if settings.TRACKER_GAME_BATCH_ENABLED:
+            Game.objects.enqueue_game_data(**queue_kwargs)
+        else:
+            process_game_data.delay(**queue_kwargs)
 
         return APIResponse.from_success()
 
-    def _get_or_create_server(self, ip: str, port: int) -> Server:
+    def _get_stream_server(self, ip: str, port: int) -> StreamServer | None:
         """
         Attempt to find an existing server for the client IP
         and the port reported in the request data.
 
-        If none found, create a new instance.
+        Return None if the server is yet to be registered.
 
         Raise APIError if the found server is disabled
         """
         logger.debug("looking for server with ip %s port %s", ip, port)
 
-        attrs = {"ip": ip, "port": port}
-
-        try:
-            server = Server.objects.get(**attrs)
-            logger.debug("obtained server %s for %s", server.pk, server.address)
-        except Server.DoesNotExist:
-            server = Server.objects.create_server(**attrs)
-            logger.debug("created server %s for %s", server.pk, server.address)
+        if not (server := Server.objects.get_stream_server(ip=ip, port=port)):
+            logger.debug("server with ip %s port %s is not registered yet", ip, port)
+            return None
 
         if not server.enabled:
-            logger.debug("server %s (%s) is disabled", server.pk, server.address)
+            logger.debug("server %s (%s:%s) is disabled", server.id, ip, port)
             raise APIError(_("The server is not registered."))
 
         return server
-
-    def _update_server_mod_version(self, server: Server, version: str) -> None:
-        """
-        Update the server mod version if it has changed
-        """
-        if server.version != version:
-            logger.info(
-                "updating mod version for %s (%d) from %s to %s",
-                server.address,
-                server.pk,
-                server.version,
-                version,
-            )
-            server.version = version
-            server.save(update_fields=["version"])
-        else:
-            logger.debug(
-                "mod version for %s (%d) is up to date (%s)",
-                server.address,
-                server.pk,
-                server.version,
-            )
@@ -75,7 +75,7 @@ class APIWhoisView(generic.View):
 
         # get info for the ip addr
         try:
-            isp = ISP.objects.match_or_create(ip)[0]
+            isp = ISP.objects.match_or_queue(ip)
         except ObjectDoesNotExist:
             isp = None
         except ValueError:
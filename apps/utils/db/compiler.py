@@ -0,0 +1,36 @@
+from typing import Any
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import Expression
+from django.db.models.sql import Query
+from django.db.models.sql.compiler import SQLCompiler
+
+
+class GroupingSetsCompiler(SQLCompiler):
+    """
+    Compiler of an aggregate query grouped by GROUPING SETS
+    rather than by the expressions the rows are selected with.
+    """
+
+    def __init__(
+        self,
+        query: Query,
+        connection: BaseDatabaseWrapper,
+        using: str,
+        *,
+        grouping_sets: list[list[Expression]],
+        elide_empty: bool = True,
+    ):
+        super().__init__(query, connection, using, elide_empty)
+        self.grouping_sets = grouping_sets
+
+    def get_group_by(self, select: list, order_by: list) -> list[tuple[str, list[Any]]]:  # noqa: ARG002
+        sets_sql, sets_params = [], []
+        for expressions in self.grouping_sets:
+            expressions_sql = []
+            for expression in expressions:
+                sql, params = self.compile(expression)
+                expressions_sql.append(sql)
+                sets_params.extend(params)
+            sets_sql.append(f"({', '.join(expressions_sql)})")
+        return [(f"GROUPING SETS ({', '.join(sets_sql)})", sets_params)]
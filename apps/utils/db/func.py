@@ -1,7 +1,8 @@
 from functools import reduce
 
+from django.contrib.postgres.fields import BigIntegerRangeField
 from django.contrib.postgres.search import SearchVector
-from django.db.models import Expression, F, Func, TextField, Value
+from django.db.models import Aggregate, Expression, F, Func, IntegerField, TextField, Value
 
 
 class ArrayToString(Func):
@@ -20,6 +21,22 @@ class RegexpReplace(Func):
         )
 
 
+class Int8Range(Func):
+    function = "INT8RANGE"
+
+    def __init__(self, lower: Expression | F | str, upper: Expression | F | str, bounds: str):
+        super().__init__(lower, upper, Value(bounds), output_field=BigIntegerRangeField())
+
+
+class Grouping(Aggregate):
+    """
+    Bit mask of the expressions a row has not been grouped by with GROUPING SETS.
+    """
+
+    function = "GROUPING"
+    output_field = IntegerField()
+
+
 def normalized_names_search_vector(
     names_expr: Expression | F, config: str, weight: str
 ) -> SearchVector:
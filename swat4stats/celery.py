@@ -14,6 +14,7 @@ class Queue(StrEnum):
     default = auto()
     serverquery = auto()
     heavy = auto()
+    whois = auto()
 
 
 @setup_logging.connect
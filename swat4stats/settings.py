@@ -344,6 +344,14 @@ CELERY_BEAT_SCHEDULE = {
             "expires": 5,
         },
     },
+    "update_pending_games": {
+        "task": "update_pending_games",
+        "schedule": timedelta(seconds=5),
+        "options": {
+            "time_limit": 60,
+            "expires": 5,
+        },
+    },
     "unlist_failed_servers": {
         "task": "unlist_failed_servers",
         "schedule": timedelta(seconds=30),
@@ -380,6 +388,22 @@ CELERY_BEAT_SCHEDULE = {
             "expires": 30 * 60,
         },
     },
+    "drain_player_preferences_queue": {
+        "task": "drain_player_preferences_queue",
+        "schedule": timedelta(seconds=60),
+        "options": {
+            "time_limit": 5 * 60,
+            "expires": 60,
+        },
+    },
+    "drain_player_stats_queue": {
+        "task": "drain_player_stats_queue",
+        "schedule": timedelta(seconds=60),
+        "options": {
+            "time_limit": 10 * 60,
+            "expires": 60,
+        },
+    },
     "merge_server_stats": {
         "task": "merge_server_stats",
         "schedule": crontab(hour="*/2", minute="30"),
@@ -457,6 +481,13 @@ if DEBUG:
 
 # how much seconds into past is considered recent for a player
 TRACKER_RECENT_TIME = 3600 * 24 * 180
+# cache profile match results for this number of seconds
+TRACKER_PROFILE_MATCH_REDIS_KEY = "profile_match"
+TRACKER_PROFILE_MATCH_TTL = 3600
+# failed profile matches are cached for a shorter period
+TRACKER_PROFILE_MATCH_NEGATIVE_TTL = 60
+# aliases created without an isp while the whois lookup for their network is pending
+TRACKER_ALIAS_PENDING_ISP_REDIS_KEY = "alias_pending_isp"
 # number of the latest games to aggregate preferences over
 TRACKER_PREFERRED_GAMES = 25
 # min number of players a game round to be considered qualified
@@ -474,6 +505,33 @@ TRACKER_MIN_TIME = 10 * 60 * 60
 # min time for round based stats
 TRACKER_MIN_GAMES = 100
 
+# fold new games into the stored stats, recomputing them in full every this number of seconds
+TRACKER_STATS_RECOMPUTE_INTERVAL = 7 * 24 * 60 * 60
+# recompute the stats of the profiles in cohorts of this size rather than one by one
+TRACKER_STATS_COHORT_ENABLED = env_bool("SETTINGS_TRACKER_STATS_COHORT_ENABLED", default=False)
+TRACKER_STATS_COHORT_SIZE = 500
+# stats batches of this size or more are copied into the stats tables rather than inserted
+TRACKER_STATS_COPY_MIN_ROWS = 1000
+# queue the profiles requiring a stats or preference update in redis sorted sets
+# instead of scheduling a task per profile. The queues are drained in chunks every minute
+TRACKER_PROFILE_QUEUE_ENABLED = env_bool("SETTINGS_TRACKER_PROFILE_QUEUE_ENABLED", default=False)
+TRACKER_PROFILE_QUEUE_REDIS_KEY = "profile_queue"
+TRACKER_STATS_QUEUE_CHUNK_SIZE = 1000
+TRACKER_PREFERENCES_QUEUE_CHUNK_SIZE = 200
+# keep track of the leaderboard partitions, i.e. categories per gametype, server, etc,
+# that have had their stats saved, and only rank those partitions periodically.
+# The positions of a completed year are still settled in full
+TRACKER_RANK_INCREMENTAL_ENABLED = env_bool(
+    "SETTINGS_TRACKER_RANK_INCREMENTAL_ENABLED", default=False
+)
+TRACKER_RANK_CHANGES_REDIS_KEY = "rank_changes"
+# mirror the points of the ranked stats into redis sorted sets,
+# so the leaderboards are served in near real time rather than from the last ranked positions
+TRACKER_LEADERBOARDS_REDIS_ENABLED = env_bool(
+    "SETTINGS_TRACKER_LEADERBOARDS_REDIS_ENABLED", default=False
+)
+TRACKER_LEADERBOARDS_REDIS_KEY = "leaderboards"
+
 # how much seconds into past to calculate map ratings for
 TRACKER_MAP_RATINGS_FOR_PERIOD = 180 * 24 * 60 * 60
 
@@ -539,6 +597,38 @@ TRACKER_SERVER_DISCOVERY_HTTP_TIMEOUT = 5
 TRACKER_SERVER_DISCOVERY_PROBE_CONCURRENCY = 10
 
 TRACKER_STATUS_REDIS_KEY = "servers"
+# redis keys mapping ip:port addresses of streaming servers to their id and status
+TRACKER_STREAM_SERVERS_REDIS_KEY = "stream_servers"
+# cache the streaming server details for this number of seconds
+TRACKER_STREAM_SERVERS_TTL = 600
+# save streamed games in batches instead of one task per game
+TRACKER_GAME_BATCH_ENABLED = env_bool("SETTINGS_TRACKER_GAME_BATCH_ENABLED", default=False)
+TRACKER_GAME_BATCH_REDIS_KEY = "stream_games"
+# max number of games to save in a single transaction
+TRACKER_GAME_BATCH_SIZE = 50
+# release the queue lock of a worker that has died after this number of seconds
+TRACKER_GAME_BATCH_LOCK_TTL = 60
+
+if TRACKER_GAME_BATCH_ENABLED:
+    CELERY_BEAT_SCHEDULE["process_queued_games"] = {
+        "task": "process_queued_games",
+        "schedule": timedelta(seconds=1),
+        "options": {
+            "time_limit": 30,
+            "expires": 1,
+        },
+    }
+
+# remember tags of saved games for this number of seconds,
+# so that retried round reports are rejected early
+TRACKER_GAME_TAG_REDIS_KEY = "game_tag"
+TRACKER_GAME_TAG_TTL = 24 * 60 * 60
+# redis sorted set of saved games pending the update of their servers, maps and profiles
+TRACKER_PENDING_GAMES_REDIS_KEY = "pending_games"
+# max number of pending games to update servers, maps and profiles with at once
+TRACKER_PENDING_GAMES_CHUNK_SIZE = 1000
+# release the pending games lock of a worker that has died after this number of seconds
+TRACKER_PENDING_GAMES_LOCK_TTL = 60
 # max number of concurrent server status requests
 TRACKER_STATUS_QUERY_CONCURRENCY = 100
 TRACKER_STATUS_QUERY_TIMEOUT = 1
@@ -551,5 +641,33 @@ TRACKER_PORT_DISCOVERY_CONCURRENCY = 20
 
 # keep IPs for this number of seconds
 GEOIP_IP_EXPIRY = 180 * 24 * 60 * 60
+# delete expired IPs in chunks of this size
+GEOIP_IP_EXPIRY_CHUNK_SIZE = 1000
+# delete no more than this number of expired IPs per run
+GEOIP_IP_EXPIRY_BUDGET = 100_000
 # do extra whois request in case existing ip range is too large
 GEOIP_ACCEPTED_IP_LENGTH = 256 * 256 * 64
+# resolve ip addresses against an in-memory index of the known ip ranges
+GEOIP_IP_INDEX_ENABLED = env_bool("SETTINGS_GEOIP_IP_INDEX_ENABLED", default=False)
+# reload the index from scratch every this number of seconds
+GEOIP_IP_INDEX_RELOAD_INTERVAL = 15 * 60
+# pick up the newly created ip ranges every this number of seconds
+GEOIP_IP_INDEX_REFRESH_INTERVAL = 10
+# fetch the ip ranges in chunks of this size while loading the index
+GEOIP_IP_INDEX_CHUNK_SIZE = 10000
+# bumped to have the index reloaded by all processes
+GEOIP_IP_INDEX_VERSION_REDIS_KEY = "ip_index_version"
+# perform whois lookups in the background, using the best known ip range meanwhile
+GEOIP_WHOIS_ASYNC_ENABLED = env_bool("SETTINGS_GEOIP_WHOIS_ASYNC_ENABLED", default=False)
+# perform no more than this number of whois lookups per second across all workers
+GEOIP_WHOIS_RATE_LIMIT = 2
+GEOIP_WHOIS_RATE_LIMIT_REDIS_KEY = "whois_rate"
+# give up a rate limited whois lookup after this number of retries backing off up to a minute
+GEOIP_WHOIS_RATE_LIMIT_RETRIES = 10
+# queue a single whois lookup for the addresses from the same network of this size
+GEOIP_WHOIS_NETWORK_PREFIX = 24
+GEOIP_WHOIS_PENDING_REDIS_KEY = "whois_pending"
+GEOIP_WHOIS_PENDING_TTL = 10 * 60
+# do not query whois for the network again for this number of seconds after a failed lookup
+GEOIP_WHOIS_FAILED_REDIS_KEY = "whois_failed"
+GEOIP_WHOIS_FAILED_TTL = 60 * 60
@@ -21,6 +21,7 @@ from apps.api.views import (
 from apps.tracker.sitemaps import ProfileSitemap, ServerSitemap
 from apps.tracker.views import APIWhoisView, DataStreamView
 from apps.tracker.views.motd import APILegacySummaryView, APIMotdLeaderboardView
+from apps.tracker.views.queues import profile_queues
 from apps.utils.views import healthcheck
 
 
@@ -113,6 +114,7 @@ urlpatterns = [
         ),
     ),
     path("info/", healthcheck.status),
+    path("info/queues/", profile_queues),
     path("healthcheck/", healthcheck.HealthcheckView.as_view()),
 ]
 
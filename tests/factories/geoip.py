@@ -10,6 +10,7 @@ class ISPFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = ISP
         django_get_or_create = ("name", "country")
+        skip_postgeneration_save = True
 
     name = factory.Faker("word")
     country = None
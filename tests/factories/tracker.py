@@ -153,6 +153,12 @@ class PlayerFactory(factory.django.DjangoModelFactory):
     team = fuzzy.FuzzyChoice(teams_reversed.keys())
     team_legacy = factory.LazyAttribute(lambda o: teams_reversed[o.team])
 
+    @factory.post_generation
+    def alias_last_seen(obj, created, extracted, **kwargs):
+        # mirror the denormalization performed along with game creation
+        if created:
+            Alias.objects.update_last_seen(obj.alias_id, seen_at=obj.game.date_finished)
+
     class Params:
         common = factory.Trait(
             score=factory.Faker("pyint", min_value=-100, max_value=100),
@@ -219,5 +225,11 @@ class WeaponFactory(factory.django.DjangoModelFactory):
     kills = factory.Faker("pyint", min_value=0, max_value=50)
     teamkills = factory.Faker("pyint", min_value=0, max_value=10)
 
+    @factory.post_generation
+    def player_weapon_summary(obj, created, extracted, **kwargs):
+        # mirror the weapon summary stored along with game creation
+        if created:
+            Player.objects.fill_weapon_summary(from_pk=obj.player_id, to_pk=obj.player_id)
+
     class Meta:
         model = Weapon
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from ipaddress import IPv4Address
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.geoip.models import IP, ISP
+from apps.geoip.tasks import delete_expired_ips
+from apps.utils.test import freeze_timezone_now
+from tests.factories.geoip import ISPFactory
+
+
+def test_import_ip_ranges(db, tmpdir, whois_mock):
+    now = timezone.now()
+
+    with freeze_timezone_now(now - timedelta(days=360)):
+        existing_isp = ISPFactory(name="Foo Telecom", country="de", ip="1.2.0.0/16")
+        renewed_ip = existing_isp.ip_set.get()
+        other_isp = ISPFactory(name="Bar Networks", country=None, ip="4.3.2.0/24")
+        reassigned_ip = other_isp.ip_set.get()
+
+    path = tmpdir.join("ranges.csv")
+    with path.open("w") as f:
+        f.write("network,org,country\n")
+        f.write("1.2.0.0/16,Foo Telecom,DE\n")
+        f.write("1.3.0.0/16,Foo Telecom,DE\n")
+        f.write("4.3.2.0/24,Ham Online,\n")
+        f.write("5.6.7.0/24,Ham Online,\n")
+        f.write("5.6.7.0/24,Ham Online,\n")
+        f.write("6.0.0.0/8,Spam Ltd,US\n")
+        f.write("2001:db8::/32,Spam Ltd,US\n")
+        f.write("7.0.0.0/8,,US\n")
+        f.write("garbage,Spam Ltd,US\n")
+
+    with freeze_timezone_now(now):
+        call_command(
+            "import_ip_ranges",
+            str(path),
+            "--name-column=org",
+            "--country-column=country",
+        )
+
+    assert ISP.objects.count() == 4
+    ham = ISP.objects.get(name="Ham Online", country__isnull=True)
+    spam = ISP.objects.get(name="Spam Ltd", country="us")
+
+    assert IP.objects.count() == 5
+    assert IP.objects.expired().count() == 0
+
+    renewed_ip.refresh_from_db()
+    assert renewed_ip.isp == existing_isp
+    assert renewed_ip.date_created == now
+
+    reassigned_ip.refresh_from_db()
+    assert reassigned_ip.isp == ham
+
+    assert IP.objects.get(range_from=int(IPv4Address("1.3.0.0"))).isp == existing_isp
+    assert IP.objects.get(range_from=int(IPv4Address("5.6.7.0"))).isp == ham
+    assert IP.objects.get(range_from=int(IPv4Address("6.0.0.0"))).isp == spam
+
+    assert ISP.objects.match_or_create("5.6.7.8") == (ham, False)
+    assert not whois_mock.called
+
+
+def test_imported_ip_ranges_do_not_expire(db, tmpdir, whois_mock):
+    now = timezone.now()
+
+    with freeze_timezone_now(now - timedelta(days=360)):
+        ISPFactory(name="Foo Telecom", country="de", ip="1.2.0.0/16")
+
+    path = tmpdir.join("ranges.csv")
+    with path.open("w") as f:
+        f.write("network,autonomous_system_organization\n")
+        f.write("5.6.7.0/24,Ham Online\n")
+
+    with (
+        freeze_timezone_now(now - timedelta(days=360)),
+        mock.patch.object(ISP.objects, "reset_ip_range_index") as reset_mock,
+    ):
+        call_command("import_ip_ranges", str(path))
+
+    # the index is reset once the import is committed
+    assert reset_mock.call_count == 1
+
+    with freeze_timezone_now(now):
+        assert IP.objects.expired().count() == 1
+        delete_expired_ips.delay()
+
+    imported_ip = IP.objects.get()
+    assert imported_ip.is_imported
+    assert imported_ip.range_from == int(IPv4Address("5.6.7.0"))
+    assert ISP.objects.match_or_create("5.6.7.8") == (imported_ip.isp, False)
+    assert not whois_mock.called
@@ -0,0 +1,264 @@
+from datetime import timedelta
+from ipaddress import IPv4Address
+from unittest import mock
+
+import pytest
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+
+from apps.geoip.managers import ip_range_index
+from apps.geoip.models import IP, ISP
+from apps.geoip.tasks import delete_expired_ips
+from apps.geoip.utils import IPRangeIndex
+from apps.utils.test import freeze_timezone_now
+from tests.factories.geoip import IPFactory, ISPFactory
+
+
+def ip_int(ip_address: str) -> int:
+    return int(IPv4Address(ip_address))
+
+
+@pytest.fixture(autouse=True)
+def _enable_ip_index(db, settings):
+    settings.GEOIP_IP_INDEX_ENABLED = True
+    ip_range_index.clear()
+    yield
+    ip_range_index.clear()
+
+
+@pytest.mark.parametrize(
+    "ip_address, expected",
+    [
+        ("0.255.255.255", None),
+        ("1.0.0.0", (1, 256 * 256 * 256 - 1)),
+        ("1.2.0.0", (2, 256 * 256 - 1)),
+        ("1.2.3.0", (3, 255)),
+        ("1.2.3.4", (4, 0)),
+        ("1.2.3.5", (3, 255)),
+        ("1.2.3.255", (3, 255)),
+        ("1.2.4.0", (2, 256 * 256 - 1)),
+        ("1.2.255.255", (2, 256 * 256 - 1)),
+        ("1.3.0.0", (1, 256 * 256 * 256 - 1)),
+        ("1.255.255.255", (1, 256 * 256 * 256 - 1)),
+        ("2.0.0.0", None),
+        ("3.0.0.1", (None, 255)),
+    ],
+)
+def test_index_picks_narrowest_enclosing_range(ip_address, expected):
+    index = IPRangeIndex()
+    index.extend(
+        [
+            (10, ip_int("1.2.3.0"), ip_int("1.2.3.255"), 3),
+            (20, ip_int("1.0.0.0"), ip_int("1.255.255.255"), 1),
+            (30, ip_int("1.2.3.4"), ip_int("1.2.3.4"), 4),
+            (40, ip_int("1.2.0.0"), ip_int("1.2.255.255"), 2),
+            (50, ip_int("3.0.0.0"), ip_int("3.0.0.255"), None),
+        ]
+    )
+    assert len(index) == 5
+    assert index.last_pk == 50
+    assert index.lookup(ip_int(ip_address)) == expected
+
+
+def test_index_is_rebuilt_after_ranges_are_added():
+    index = IPRangeIndex()
+    assert index.lookup(ip_int("1.2.3.4")) is None
+
+    index.add(ip_int("1.2.0.0"), ip_int("1.2.255.255"), 1)
+    assert index.lookup(ip_int("1.2.3.4")) == (1, 256 * 256 - 1)
+
+    index.add(ip_int("1.2.3.0"), ip_int("1.2.3.255"), 2)
+    assert index.lookup(ip_int("1.2.3.4")) == (2, 255)
+    assert index.lookup(ip_int("1.2.4.4")) == (1, 256 * 256 - 1)
+
+    index.clear()
+    assert index.lookup(ip_int("1.2.3.4")) is None
+
+
+def test_ranges_are_inserted_into_built_segments():
+    ranges = [
+        (ip_int("1.0.0.0"), ip_int("1.255.255.255"), 1),
+        (ip_int("1.2.3.0"), ip_int("1.2.3.255"), 3),
+        (ip_int("1.2.0.0"), ip_int("1.2.255.255"), 2),
+        (ip_int("1.2.3.4"), ip_int("1.2.3.4"), 4),
+        (ip_int("1.2.3.0"), ip_int("1.2.3.255"), 5),
+        (ip_int("0.0.0.0"), ip_int("0.255.255.255"), None),
+        (ip_int("1.2.2.0"), ip_int("1.2.4.255"), 6),
+    ]
+    probes = [
+        "0.0.0.0",
+        "0.255.255.255",
+        "1.0.0.0",
+        "1.2.1.255",
+        "1.2.2.0",
+        "1.2.3.3",
+        "1.2.3.4",
+        "1.2.3.5",
+        "1.2.4.255",
+        "1.2.5.0",
+        "1.255.255.255",
+        "2.0.0.0",
+    ]
+
+    rebuilt_index = IPRangeIndex()
+    rebuilt_index.extend((pk, *item) for pk, item in enumerate(ranges, start=1))
+    expected = [rebuilt_index.lookup(ip_int(ip_address)) for ip_address in probes]
+
+    index = IPRangeIndex()
+    # build the segments, so that the following ranges are inserted in place
+    index.add(*ranges[0])
+    index.lookup(0)
+
+    with mock.patch.object(IPRangeIndex, "_build_segments") as build_mock:
+        for item in ranges[1:]:
+            index.add(*item)
+        assert [index.lookup(ip_int(ip_address)) for ip_address in probes] == expected
+
+    assert build_mock.call_count == 0
+
+
+def test_match_uses_index(django_assert_num_queries):
+    isp1 = ISPFactory(name="foo", ip="1.2.0.0/16")
+    isp2 = ISPFactory(name="bar", ip="1.2.3.0/24")
+
+    # load the index
+    with django_assert_num_queries(2):
+        assert ISP.objects.match("1.2.4.5") == (isp1, 256 * 256 - 1)
+
+    with django_assert_num_queries(1):
+        assert ISP.objects.match("1.2.3.4") == (isp2, 255)
+
+    # the isp rows are cached along with the index
+    with django_assert_num_queries(0):
+        assert ISP.objects.match("1.2.3.5") == (isp2, 255)
+        assert ISP.objects.match("1.2.5.6") == (isp1, 256 * 256 - 1)
+
+    with django_assert_num_queries(1), pytest.raises(ObjectDoesNotExist):
+        ISP.objects.match("4.3.2.1")
+
+
+def test_index_is_refreshed_with_new_ranges(settings):
+    isp1 = ISPFactory(name="foo", ip="1.2.0.0/16")
+    assert ISP.objects.match("1.2.3.4") == (isp1, 256 * 256 - 1)
+
+    isp2 = ISPFactory(name="bar", ip="1.2.3.0/24")
+
+    # the new range is not known to the index yet
+    with mock.patch("apps.geoip.managers.time.monotonic", return_value=ip_range_index.loaded_at):
+        assert ISP.objects.match("1.2.3.4") == (isp1, 256 * 256 - 1)
+
+    next_refresh_at = ip_range_index.loaded_at + settings.GEOIP_IP_INDEX_REFRESH_INTERVAL
+    with mock.patch("apps.geoip.managers.time.monotonic", return_value=next_refresh_at):
+        assert ISP.objects.match("1.2.3.4") == (isp2, 255)
+        assert ISP.objects.match("1.2.4.5") == (isp1, 256 * 256 - 1)
+
+    assert len(ip_range_index) == 2
+    assert ip_range_index.loaded_at < ip_range_index.refreshed_at
+
+
+def test_index_is_reloaded_with_removed_ranges(settings):
+    isp = ISPFactory(name="foo", ip="1.2.0.0/16")
+    assert ISP.objects.match("1.2.3.4") == (isp, 256 * 256 - 1)
+
+    IP.objects.all().delete()
+
+    next_reload_at = ip_range_index.loaded_at + settings.GEOIP_IP_INDEX_RELOAD_INTERVAL
+    with (
+        mock.patch("apps.geoip.managers.time.monotonic", return_value=next_reload_at),
+        pytest.raises(ObjectDoesNotExist),
+    ):
+        ISP.objects.match("1.2.3.4")
+
+    assert len(ip_range_index) == 0
+
+
+def test_index_falls_back_to_database_for_deleted_isp():
+    isp1 = ISPFactory(name="foo", ip="1.2.0.0/16")
+    isp2 = IPFactory(
+        isp__name="bar", range_from=ip_int("1.2.3.0"), range_to=ip_int("1.2.3.255")
+    ).isp
+    assert ISP.objects.match("1.2.3.4") == (isp2, 255)
+
+    isp2.delete()
+    assert ISP.objects.match("1.2.3.4") == (isp1, 256 * 256 - 1)
+
+
+def test_ranges_created_after_whois_are_added_to_index(whois_mock):
+    ISPFactory(name="foo", ip="1.0.0.0/8")
+    whois_mock.return_value = {"nets": [{"description": "bar", "cidr": "1.2.0.0/16"}]}
+
+    obj, created = ISP.objects.match_or_create("1.2.3.4")
+    assert created
+    assert obj.name == "bar"
+    assert len(whois_mock.mock_calls) == 1
+
+    # the new range is resolved without waiting for the index to refresh
+    with mock.patch("apps.geoip.managers.time.monotonic", return_value=ip_range_index.loaded_at):
+        assert ISP.objects.match_or_create("1.2.5.6") == (obj, False)
+    assert len(whois_mock.mock_calls) == 1
+
+
+def test_index_is_reset_after_expired_ips_are_deleted(whois_mock):
+    now = timezone.now()
+
+    with freeze_timezone_now(now - timedelta(days=360)):
+        isp1 = ISPFactory(name="foo", ip="1.2.0.0/16")
+
+    assert ISP.objects.match_or_create("1.2.3.4") == (isp1, False)
+    assert len(whois_mock.mock_calls) == 0
+
+    with freeze_timezone_now(now):
+        delete_expired_ips.delay()
+
+    assert ip_range_index.loaded_at is None
+
+    whois_mock.return_value = {"nets": [{"description": "bar", "cidr": "1.2.0.0/16"}]}
+    obj, created = ISP.objects.match_or_create("1.2.3.4")
+    assert created
+    assert obj.name == "bar"
+    assert len(whois_mock.mock_calls) == 1
+
+
+def test_index_is_kept_when_no_ips_expired():
+    isp = ISPFactory(name="foo", ip="1.2.0.0/16")
+    assert ISP.objects.match("1.2.3.4") == (isp, 256 * 256 - 1)
+    loaded_at = ip_range_index.loaded_at
+
+    with mock.patch.object(ISP.objects, "reset_ip_range_index") as reset_mock:
+        delete_expired_ips.delay()
+
+    assert reset_mock.call_count == 0
+    assert ip_range_index.loaded_at == loaded_at
+
+
+def test_index_is_reset_when_isp_is_changed():
+    isp = ISPFactory(name="foo", country="us", ip="1.2.0.0/16")
+    assert ISP.objects.match("1.2.3.4") == (isp, 256 * 256 - 1)
+
+    isp.country = "gb"
+    isp.save()
+    assert ip_range_index.loaded_at is None
+
+    matched, _ = ISP.objects.match("1.2.3.4")
+    assert matched.country == "gb"
+
+
+def test_index_is_reloaded_after_reset_elsewhere(settings, redis):
+    isp = ISPFactory(name="foo", ip="1.2.0.0/16")
+    assert ISP.objects.match("1.2.3.4") == (isp, 256 * 256 - 1)
+
+    IP.objects.all().delete()
+    # another process resets the index
+    redis.incr(settings.GEOIP_IP_INDEX_VERSION_REDIS_KEY)
+
+    with mock.patch("apps.geoip.managers.time.monotonic", return_value=ip_range_index.loaded_at):
+        assert ISP.objects.match("1.2.3.4") == (isp, 256 * 256 - 1)
+
+    next_refresh_at = ip_range_index.loaded_at + settings.GEOIP_IP_INDEX_REFRESH_INTERVAL
+    with (
+        mock.patch("apps.geoip.managers.time.monotonic", return_value=next_refresh_at),
+        pytest.raises(ObjectDoesNotExist),
+    ):
+        ISP.objects.match("1.2.3.4")
+
+    assert len(ip_range_index) == 0
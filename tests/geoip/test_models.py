@@ -2,6 +2,7 @@ import socket
 from ipaddress import IPv4Address
 
 import pytest
+from django.db.backends.postgresql.psycopg_any import NumericRange
 
 from apps.geoip.models import IP, ISP
 from tests.factories.geoip import ISPFactory
@@ -326,6 +327,15 @@ def test_match_will_prefer_the_smallest_ip_range(whois_mock):
     assert not whois_mock.called
 
 
+def test_ip_range_column_is_generated():
+    isp = ISPFactory(name="foo", ip__from="127.0.0.0", ip__to="127.0.0.255")
+    ip = isp.ip_set.get()
+
+    assert ip.ip_range == NumericRange(int(IPv4Address("127.0.0.0")), int(IPv4Address("127.0.1.0")))
+    assert IP.objects.filter(ip_range__contains=int(IPv4Address("127.0.0.255"))).get() == ip
+    assert not IP.objects.filter(ip_range__contains=int(IPv4Address("127.0.1.0"))).exists()
+
+
 def test_whois_ip_range_is_validated(whois_mock):
     whois_mock.return_value = {"nets": [{"cidr": "1.2.0.0/16"}]}
     obj, created = ISP.objects.match_or_create("4.3.2.1")
@@ -71,3 +71,26 @@ def test_ips_are_deleted_whois_returns_fresh_data(db, whois_mock):
     obj, created = ISP.objects.match_or_create("1.2.3.4")
     assert obj == isp2
     assert not created
+
+
+def test_expired_ips_are_deleted_in_chunks_within_budget(db):
+    now = datetime(2016, 5, 1, 23, 0, 0, tzinfo=UTC)
+
+    expired_ips = []
+    for days in (400, 300, 250, 200, 190):
+        with freeze_timezone_now(now - timedelta(days=days)):
+            expired_ips.append(IPFactory())
+    with freeze_timezone_now(now - timedelta(days=1)):
+        fresh_ip = IPFactory()
+
+    with freeze_timezone_now(now):
+        delete_expired_ips.delay(chunk_size=2, budget=3)
+
+    # the oldest ips go first
+    remaining_pks = set(IP.objects.values_list("pk", flat=True))
+    assert remaining_pks == {expired_ips[3].pk, expired_ips[4].pk, fresh_ip.pk}
+
+    with freeze_timezone_now(now):
+        delete_expired_ips.delay(chunk_size=2, budget=3)
+
+    assert list(IP.objects.values_list("pk", flat=True)) == [fresh_ip.pk]
@@ -0,0 +1,184 @@
+import socket
+from unittest import mock
+
+import pytest
+
+from apps.geoip.models import IP, ISP
+from apps.geoip.tasks import resolve_whois
+from apps.tracker.models import Alias
+from tests.factories.geoip import ISPFactory
+from tests.factories.tracker import AliasFactory, PlayerFactory, ServerFactory
+
+
+@pytest.fixture(autouse=True)
+def _enable_async_whois(db, settings):
+    settings.GEOIP_WHOIS_ASYNC_ENABLED = True
+
+
+@pytest.fixture
+def resolve_mock():
+    with mock.patch("apps.geoip.tasks.resolve_whois.delay") as resolve_mock_obj:
+        yield resolve_mock_obj
+
+
+def test_known_ip_range_is_matched_without_whois(whois_mock, resolve_mock):
+    isp = ISPFactory(name="foo", ip="1.2.0.0/16")
+
+    assert ISP.objects.match_or_queue("1.2.3.4") == isp
+    assert not resolve_mock.called
+    assert not whois_mock.called
+
+
+def test_unknown_ip_is_resolved_in_background(whois_mock):
+    whois_mock.return_value = {
+        "nets": [{"country": "UN", "description": "foo", "cidr": "1.2.3.0/24"}]
+    }
+
+    # the whois task runs eagerly, but the caller does not wait for it
+    assert ISP.objects.match_or_queue("1.2.3.4") is None
+    assert len(whois_mock.mock_calls) == 1
+
+    isp = ISP.objects.get()
+    assert (isp.name, isp.country) == ("foo", "un")
+    assert IP.objects.get().isp == isp
+
+    assert ISP.objects.match_or_queue("1.2.3.5") == isp
+    assert len(whois_mock.mock_calls) == 1
+
+
+def test_broad_ip_range_is_used_until_resolved(whois_mock):
+    broad_isp = ISPFactory(name="foo", ip="1.0.0.0/8")
+    whois_mock.return_value = {"nets": [{"description": "bar", "cidr": "1.2.0.0/16"}]}
+
+    assert ISP.objects.match_or_queue("1.2.3.4") == broad_isp
+    assert len(whois_mock.mock_calls) == 1
+
+    isp = ISP.objects.match_or_queue("1.2.3.4")
+    assert isp.name == "bar"
+    assert len(whois_mock.mock_calls) == 1
+
+
+def test_whois_is_queued_once_per_network(resolve_mock):
+    assert ISP.objects.match_or_queue("1.2.3.4") is None
+    assert ISP.objects.match_or_queue("1.2.3.5") is None
+    assert ISP.objects.match_or_queue("1.2.3.255") is None
+    assert ISP.objects.match_or_queue("1.2.4.1") is None
+
+    assert [c.args for c in resolve_mock.call_args_list] == [("1.2.3.4",), ("1.2.4.1",)]
+
+
+def test_failed_whois_is_not_queued_again(whois_mock):
+    whois_mock.side_effect = socket.timeout
+
+    assert ISP.objects.match_or_queue("1.2.3.4") is None
+    assert ISP.objects.match_or_queue("1.2.3.5") is None
+    assert len(whois_mock.mock_calls) == 1
+
+    # another network is not affected
+    assert ISP.objects.match_or_queue("1.2.4.1") is None
+    assert len(whois_mock.mock_calls) == 2
+
+    assert ISP.objects.count() == 0
+
+
+def test_whois_rate_limit_is_shared(settings):
+    settings.GEOIP_WHOIS_RATE_LIMIT = 2
+
+    with mock.patch("apps.geoip.managers.time.time", return_value=1_700_000_000.5):
+        assert ISP.objects.acquire_whois_rate_limit()
+        assert ISP.objects.acquire_whois_rate_limit()
+        assert not ISP.objects.acquire_whois_rate_limit()
+
+    with mock.patch("apps.geoip.managers.time.time", return_value=1_700_000_001.1):
+        assert ISP.objects.acquire_whois_rate_limit()
+
+
+def test_ingested_alias_does_not_wait_for_whois(resolve_mock):
+    alias, created = Alias.objects.match_or_create(name="Serge", ip_address="1.2.3.4")
+    assert created
+    assert alias.isp is None
+    assert resolve_mock.call_count == 1
+
+
+def test_servers_country_is_updated_once_resolved(whois_mock):
+    whois_mock.return_value = {
+        "nets": [{"country": "UN", "description": "foo", "cidr": "1.2.3.0/24"}]
+    }
+    server1 = ServerFactory(ip="1.2.3.4")
+    server2 = ServerFactory(ip="1.2.3.5", country="eu")
+    other_server = ServerFactory(ip="1.2.4.5")
+
+    isp = ISP.objects.resolve_queued_whois("1.2.3.9")
+    assert isp.country == "un"
+    assert len(whois_mock.mock_calls) == 1
+
+    server1.refresh_from_db()
+    assert server1.country == "un"
+    server2.refresh_from_db()
+    assert server2.country == "un"
+    other_server.refresh_from_db()
+    assert other_server.country is None
+
+
+def test_aliases_without_isp_are_updated_once_resolved(whois_mock, resolve_mock):
+    whois_mock.return_value = {
+        "nets": [{"country": "UN", "description": "foo", "cidr": "1.2.3.0/24"}]
+    }
+    other_isp = ISPFactory(name="bar", ip="5.6.0.0/16")
+
+    alias, _ = Alias.objects.match_or_create(name="Serge", ip_address="1.2.3.4")
+    PlayerFactory(alias=alias, ip="1.2.3.4")
+    assert alias.isp is None
+    other_alias = AliasFactory(name="Another", isp=None)
+    PlayerFactory(alias=other_alias, ip="1.2.4.4")
+    # the alias was not created while the lookup was pending
+    old_alias = AliasFactory(name="Old", isp=None)
+    PlayerFactory(alias=old_alias, ip="1.2.3.6")
+    resolved_alias = AliasFactory(name="Resolved", isp=other_isp)
+    PlayerFactory(alias=resolved_alias, ip="1.2.3.5")
+
+    isp = ISP.objects.resolve_queued_whois("1.2.3.4")
+
+    alias.refresh_from_db()
+    assert alias.isp == isp
+    other_alias.refresh_from_db()
+    assert other_alias.isp is None
+    old_alias.refresh_from_db()
+    assert old_alias.isp is None
+    resolved_alias.refresh_from_db()
+    assert resolved_alias.isp == other_isp
+
+    # the alias is matched by the resolved isp from now on
+    assert Alias.objects.match_or_create(name="Serge", ip_address="1.2.3.10") == (alias, False)
+
+
+def test_aliases_without_isp_are_updated_once_resolved_in_meantime(whois_mock, resolve_mock):
+    alias, _ = Alias.objects.match_or_create(name="Serge", ip_address="1.2.3.4")
+    assert alias.isp is None
+
+    # another lookup has resolved the network in the meantime
+    isp = ISPFactory(name="foo", ip="1.2.3.0/24")
+    assert ISP.objects.resolve_queued_whois("1.2.3.4") == isp
+    assert not whois_mock.called
+
+    alias.refresh_from_db()
+    assert alias.isp == isp
+
+
+def test_rate_limited_whois_is_given_up(settings, resolve_mock, redis):
+    settings.GEOIP_WHOIS_RATE_LIMIT_RETRIES = 3
+    assert ISP.objects.match_or_queue("1.2.3.4") is None
+    assert redis.exists("whois_pending:1.2.3.0/24")
+
+    with (
+        mock.patch.object(
+            ISP.objects, "acquire_whois_rate_limit", return_value=False
+        ) as rate_limit_mock,
+        mock.patch.object(ISP.objects, "resolve_queued_whois") as resolve_queued_mock,
+    ):
+        resolve_whois.apply(args=("1.2.3.4",))
+
+    assert rate_limit_mock.call_count == 4
+    assert not resolve_queued_mock.called
+    # the lookup can be queued again
+    assert not redis.exists("whois_pending:1.2.3.0/24")
@@ -0,0 +1,36 @@
+from datetime import datetime
+from functools import partial
+
+import pytest
+import pytz
+from django.core.management import call_command
+
+from apps.tracker.models import Alias
+from tests.factories.tracker import AliasFactory, PlayerFactory
+
+utc_datetime = partial(datetime, tzinfo=pytz.utc)
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_fill_alias_last_seen(db):
+    alias1, alias2, alias3 = AliasFactory.create_batch(3)
+    PlayerFactory(alias=alias1, game__date_finished=utc_datetime(2016, 3, 14, 1, 1, 1))
+    PlayerFactory(alias=alias1, game__date_finished=utc_datetime(2017, 12, 31, 1, 1, 1))
+    PlayerFactory(alias=alias1, game__date_finished=utc_datetime(2017, 1, 1, 1, 1, 1))
+    PlayerFactory(alias=alias2, game__date_finished=utc_datetime(2018, 2, 15, 1, 1, 1))
+
+    Alias.objects.filter(pk__in=[alias1.pk, alias3.pk]).update(last_seen_at=None)
+    Alias.objects.filter(pk=alias2.pk).update(last_seen_at=utc_datetime(2019, 1, 1))
+
+    call_command("fill_alias_last_seen")
+
+    alias1.refresh_from_db()
+    assert alias1.last_seen_at == utc_datetime(2017, 12, 31, 1, 1, 1)
+
+    # already filled
+    alias2.refresh_from_db()
+    assert alias2.last_seen_at == utc_datetime(2019, 1, 1)
+
+    # never played
+    alias3.refresh_from_db()
+    assert alias3.last_seen_at is None
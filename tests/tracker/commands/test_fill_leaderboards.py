@@ -0,0 +1,51 @@
+import pytest
+from django.core.management import call_command
+
+from apps.tracker.models import GametypeStats, PlayerStats, ServerStats
+from tests.factories.stats import GametypeStatsFactory, PlayerStatsFactory, ServerStatsFactory
+from tests.factories.tracker import ProfileFactory, ServerFactory
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_fill_leaderboards(settings):
+    settings.TRACKER_LEADERBOARDS_REDIS_ENABLED = True
+    settings.TRACKER_MIN_TIME = 1000
+
+    profile1, profile2, profile3 = ProfileFactory.create_batch(3)
+    server = ServerFactory()
+
+    PlayerStatsFactory(category="score", year=2016, profile=profile1, points=100)
+    PlayerStatsFactory(category="score", year=2016, profile=profile2, points=200)
+    PlayerStatsFactory(category="score", year=2016, profile=profile3, points=150)
+    PlayerStatsFactory(category="score", year=2015, profile=profile3, points=1000)
+    PlayerStatsFactory(category="time", year=2016, profile=profile1, points=5000)
+    PlayerStatsFactory(category="time", year=2016, profile=profile2, points=500)
+    PlayerStatsFactory(category="spm_ratio", year=2016, profile=profile1, points=1.5)
+    PlayerStatsFactory(category="spm_ratio", year=2016, profile=profile2, points=3)
+    GametypeStatsFactory(category="score", year=2016, profile=profile1, gametype="VIP Escort")
+    ServerStatsFactory(category="kills", year=2016, profile=profile2, server=server, points=10)
+
+    # stale item
+    PlayerStats.objects.save_stats({"score": 10000}, profile=ProfileFactory(), year=2016)
+    PlayerStats.objects.filter(points=10000).delete()
+
+    call_command("fill_leaderboards", "--year=2016", "--chunk-size=2")
+
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=5) == [
+        (profile2.pk, 200),
+        (profile3.pk, 150),
+        (profile1.pk, 100),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="spm_ratio", limit=5) == [
+        (profile1.pk, 1.5),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2015, category="score", limit=5) == []
+    assert [
+        profile_id
+        for profile_id, _ in GametypeStats.objects.get_leaderboard(
+            year=2016, category="score", limit=5, gametype="VIP Escort"
+        )
+    ] == [profile1.pk]
+    assert ServerStats.objects.get_leaderboard(
+        year=2016, category="kills", limit=5, server_id=server.pk
+    ) == [(profile2.pk, 10)]
@@ -0,0 +1,33 @@
+import pytest
+from django.core.management import call_command
+
+from apps.tracker.models import Player
+from tests.factories.tracker import PlayerFactory, WeaponFactory
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_fill_player_weapon_summary():
+    player1, player2, player3, player4 = PlayerFactory.create_batch(4)
+    WeaponFactory(player=player1, name="9mm SMG", shots=100, hits=20, kills=5, teamhits=1)
+    WeaponFactory(player=player1, name="Colt M4A1 Carbine", shots=50, hits=25, kills=3, teamhits=0)
+    WeaponFactory(player=player1, name="Flashbang", shots=3, hits=2, kills=0, teamhits=1)
+    WeaponFactory(player=player1, name="Taser Stun Gun", shots=10, hits=10, kills=0, teamhits=0)
+    WeaponFactory(player=player2, name="Stinger", shots=2, hits=1, kills=0, teamhits=0)
+    WeaponFactory(player=player4, name="Pepper-ball", shots=7, hits=1, kills=0, teamhits=0)
+
+    summary_fields = list(Player.objects.summarize_weapons([]))
+    # pretend the players were created before the summary
+    Player.objects.update(**dict.fromkeys(summary_fields))
+
+    call_command("fill_player_weapon_summary", "--chunk-size=2")
+
+    summaries = {
+        pk: summary
+        for pk, *summary in Player.objects.values_list("pk", *summary_fields).order_by("pk")
+    }
+    assert summaries == {
+        player1.pk: [150, 45, 8, 1, 3, 2, 0, 1],
+        player2.pk: [None, None, None, None, 2, 1, 0, 0],
+        player3.pk: [None] * 8,
+        player4.pk: [None] * 8,
+    }
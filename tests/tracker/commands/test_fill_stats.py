@@ -6,9 +6,16 @@ import pytz
 from django.core.management import call_command
 from django.utils import timezone
 
-from apps.tracker.models import GametypeStats, MapStats, PlayerStats, ServerStats
+from apps.tracker.models import (
+    GametypeStats,
+    MapStats,
+    PlayerStats,
+    Profile,
+    ServerStats,
+    WeaponStats,
+)
 from apps.utils.test import freeze_timezone_now
-from tests.factories.tracker import MapFactory, PlayerFactory, ProfileFactory
+from tests.factories.tracker import MapFactory, PlayerFactory, ProfileFactory, WeaponFactory
 
 utc_datetime = partial(datetime, tzinfo=pytz.utc)
 
@@ -118,3 +125,68 @@ def test_fill_stats(db, settings):
             model.objects.filter(profile=profile2).values_list("position", flat=True)
         )
         assert profile2_positions == {1}
+
+
+def snapshot_stats():
+    return {
+        (model.__name__, *item[:-1]): item[-1]
+        for model, grouping_key in [
+            (PlayerStats, "category"),
+            (MapStats, "map_id"),
+            (GametypeStats, "gametype"),
+            (ServerStats, "server_id"),
+            (WeaponStats, "weapon"),
+        ]
+        for item in model.objects.values_list(
+            "profile_id", "year", grouping_key, "category", "points"
+        )
+    }
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+@pytest.mark.parametrize("cohort_size", [1, 2, 100])
+def test_fill_stats_match_per_profile_stats(db, settings, cohort_size):
+    settings.TRACKER_MIN_TIME = 0
+    settings.TRACKER_MIN_GAMES = 1
+    settings.TRACKER_MIN_WEAPON_SHOTS = 1
+    settings.TRACKER_MIN_GRENADE_SHOTS = 1
+
+    profiles = [
+        ProfileFactory(
+            first_seen_at=utc_datetime(2014, 4, 4, 4, 4, 4),
+            last_seen_at=utc_datetime(2016, 9, 9, 9, 9, 9),
+        )
+        for _ in range(3)
+    ]
+    for idx, profile in enumerate(profiles):
+        for year, gametype in [
+            (2014, "VIP Escort"),
+            (2015, "Barricaded Suspects"),
+            (2015, "CO-OP"),
+            (2016, "Rapid Deployment"),
+        ]:
+            player = PlayerFactory(
+                alias__profile=profile,
+                game__date_finished=utc_datetime(year, 5, 5 + idx),
+                game__gametype=gametype,
+                game__player_num=16,
+                score=10 + idx,
+                kills=5 * idx,
+                deaths=idx,
+                time=600,
+            )
+            WeaponFactory(player=player, name="9mm SMG")
+            WeaponFactory(player=player, name="Flashbang")
+
+    call_command("fill_stats", f"--cohort-size={cohort_size}")
+    cohort_stats = snapshot_stats()
+    assert cohort_stats
+
+    for model in [PlayerStats, MapStats, GametypeStats, ServerStats, WeaponStats]:
+        model.objects.all().delete()
+
+    for year in [2014, 2015, 2016]:
+        for profile in profiles:
+            Profile.objects.update_annual_stats_for_profile(profile=profile, year=year)
+
+    assert cohort_stats == snapshot_stats()
@@ -1,6 +1,10 @@
+import logging
+from unittest import mock
+
+import pytest
 from django.core.management import call_command
 
-from apps.tracker.models import Game
+from apps.tracker.models import Game, GameReport
 from tests.factories.streaming import ServerGameDataFactory
 
 
@@ -15,3 +19,67 @@ def test_import_games(db, tmpdir):
     call_command("import_games", str(path))
     game = Game.objects.get(tag="foobar")
     assert game.player_set.count() == 16
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_import_games_in_batches(db, tmpdir, workers):
+    path = tmpdir.join("data.txt")
+
+    with path.open("wb") as f:
+        f.write(ServerGameDataFactory(tag="foo").to_julia_v1().encode())
+        f.write(b"\n\n")
+        f.write(ServerGameDataFactory(tag="bar").to_julia_v2().encode())
+        f.write(b"\n")
+        f.write(b"garbage\n")
+        f.write(ServerGameDataFactory(tag="baz").to_json().encode())
+        f.write(b"\n")
+        f.write(ServerGameDataFactory(tag="ham").to_json().encode())
+
+    call_command("import_games", str(path), f"--workers={workers}", "--batch-size=2")
+
+    assert set(Game.objects.values_list("tag", flat=True)) == {"foo", "bar", "baz", "ham"}
+    # imported games are not archived
+    assert GameReport.objects.count() == 0
+
+
+def test_import_games_from_offset(db, tmpdir):
+    path = tmpdir.join("data.txt")
+    first_line = ServerGameDataFactory(tag="foo").to_julia_v1().encode() + b"\n"
+
+    with path.open("wb") as f:
+        f.write(first_line)
+        f.write(ServerGameDataFactory(tag="bar").to_julia_v1().encode())
+        f.write(b"\n")
+
+    call_command("import_games", str(path), f"--offset={len(first_line)}", "--workers=1")
+
+    assert list(Game.objects.values_list("tag", flat=True)) == ["bar"]
+
+
+def test_import_games_reports_failed_games(db, tmpdir, caplog):
+    path = tmpdir.join("data.txt")
+
+    with path.open("wb") as f:
+        f.write(ServerGameDataFactory(tag="foo").to_json().encode())
+        f.write(b"\n")
+        f.write(ServerGameDataFactory(tag="bar").to_json().encode())
+        f.write(b"\n")
+
+    create_game = Game.objects.create_game
+
+    def create_game_failing_foo(*, data, **kwargs):
+        if data["tag"] == "foo":
+            raise ValueError("foo")
+        return create_game(data=data, **kwargs)
+
+    with (
+        caplog.at_level(logging.ERROR, logger="apps.tracker.management.commands.import_games"),
+        mock.patch.object(Game.objects, "create_game", side_effect=create_game_failing_foo),
+        mock.patch("apps.tracker.tasks.stream.process_game_data.delay") as process_mock,
+    ):
+        call_command("import_games", str(path), "--workers=1")
+
+    assert list(Game.objects.values_list("tag", flat=True)) == ["bar"]
+    # failed games are not retried in the background
+    assert process_mock.call_count == 0
+    assert "failed to save 1 games: foo" in caplog.text
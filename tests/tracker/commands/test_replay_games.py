@@ -0,0 +1,118 @@
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from pytz import UTC
+
+from apps.tracker.models import Game, GameReport, Profile, Server
+from apps.tracker.schema import game_schema
+from tests.factories.streaming import PlayerGameDataFactory, ServerGameDataFactory
+from tests.factories.tracker import GameFactory, ServerFactory
+
+
+def archive_game_data(received_at: datetime, **game_data_kwargs) -> None:
+    game_data = ServerGameDataFactory(**game_data_kwargs)
+    GameReport.objects.archive(
+        {
+            "server_ip": "127.0.0.1",
+            "data": game_schema(game_data.to_encoded()),
+            "data_received_ts": received_at.timestamp(),
+        }
+    )
+
+
+def test_accepted_games_are_archived(db, client):
+    game_data = ServerGameDataFactory(tag="foo", port=10480)
+    response = client.post("/stream/", game_data.to_json(), content_type="application/json")
+    assert response.content.decode()[0] == "0"
+
+    report = GameReport.objects.get()
+    assert report.tag == "foo"
+    assert report.server_ip == "127.0.0.1"
+
+    (item,) = GameReport.objects.iterate_queued_items(report.pk)
+    assert item["server_id"] is None
+    assert item["server_ip"] == "127.0.0.1"
+    assert item["data"]["tag"] == "foo"
+    assert item["data"]["port"] == 10480
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_replay_games(db):
+    server = ServerFactory(ip="127.0.0.1", port=10480, hostname="Swat4 Server")
+    existing_game = GameFactory(tag="bar", server=server)
+
+    archive_game_data(datetime(2026, 1, 1, tzinfo=UTC), tag="foo", port=10480)
+    archive_game_data(datetime(2026, 1, 2, tzinfo=UTC), tag="bar", port=10480)
+    archive_game_data(
+        datetime(2026, 1, 3, tzinfo=UTC), tag="baz", port=10480, hostname="-==MYT Team Svr==-"
+    )
+    archive_game_data(datetime(2026, 2, 1, tzinfo=UTC), tag="ham", port=10480)
+
+    call_command("replay_games", "2026-01-01", "2026-02-01", "--chunk-size=2")
+
+    assert set(Game.objects.values_list("tag", flat=True)) == {"foo", "bar", "baz"}
+    assert Game.objects.get(tag="bar") == existing_game
+
+    server.refresh_from_db()
+    # replayed games dont change the server details
+    assert server.hostname == "Swat4 Server"
+    assert server.game_count == 2
+    assert Server.objects.count() == 1
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_replayed_games_do_not_move_latest_games_backwards(db):
+    server = ServerFactory(ip="127.0.0.1", port=10480)
+    latest_game = GameFactory(server=server, date_finished=datetime(2026, 3, 1, tzinfo=UTC))
+    Server.objects.update_game_stats_with_games(latest_game.pk)
+
+    archive_game_data(
+        datetime(2026, 1, 1, tzinfo=UTC),
+        tag="foo",
+        port=10480,
+        players=[PlayerGameDataFactory(name="Serge", ip="127.0.0.10")],
+    )
+    archive_game_data(
+        datetime(2026, 1, 2, tzinfo=UTC),
+        tag="bar",
+        port=10480,
+        players=[PlayerGameDataFactory(name="Serge", ip="127.0.0.10")],
+    )
+    call_command("replay_games", "2026-01-01", "2026-02-01")
+
+    server.refresh_from_db()
+    assert server.game_count == 3
+    assert server.first_game == Game.objects.get(tag="foo")
+    assert server.latest_game == latest_game
+    assert server.latest_game_played_at == latest_game.date_finished
+
+    profile = Profile.objects.get(name="Serge")
+    assert profile.game_last == Game.objects.get(tag="bar")
+    assert profile.last_seen_at == datetime(2026, 1, 2, tzinfo=UTC)
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_failed_replayed_games_are_retried_as_replayed(db):
+    archive_game_data(datetime(2026, 1, 1, tzinfo=UTC), tag="foo", port=10480)
+    archive_game_data(datetime(2026, 1, 2, tzinfo=UTC), tag="bar", port=10480)
+
+    create_game = Game.objects.create_game
+
+    def create_game_failing_foo(*, data, **kwargs):
+        if data["tag"] == "foo":
+            raise ValueError("foo")
+        return create_game(data=data, **kwargs)
+
+    with (
+        mock.patch.object(Game.objects, "create_game", side_effect=create_game_failing_foo),
+        mock.patch("apps.tracker.tasks.stream.process_game_data.delay") as process_mock,
+    ):
+        call_command("replay_games", "2026-01-01", "2026-02-01")
+
+    assert list(Game.objects.values_list("tag", flat=True)) == ["bar"]
+    assert process_mock.call_count == 1
+    assert process_mock.call_args.kwargs["data"]["tag"] == "foo"
+    assert process_mock.call_args.kwargs["replay"] is True
+    assert process_mock.call_args.kwargs["archive"] is False
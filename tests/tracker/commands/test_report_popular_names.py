@@ -0,0 +1,26 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from tests.factories.tracker import AliasFactory
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_report_popular_names(settings):
+    settings.TRACKER_MIN_NAME_LEN = 3
+    settings.TRACKER_POPULAR_NAMES = (r"^player", r"^afk", r"^swat$")
+
+    for name in ["Player", "player1", "AFK", "afk_brb", "Swat", "swat4", "ab", "Serge"]:
+        AliasFactory(name=name)
+
+    stdout = StringIO()
+    call_command("report_popular_names", stdout=stdout)
+
+    assert stdout.getvalue().splitlines() == [
+        "8 aliases",
+        "1\tshorter than 3 characters",
+        "2\t^player",
+        "2\t^afk",
+        "1\t^swat$",
+    ]
@@ -24,7 +24,7 @@ def test_update_game_stats_for_map_for_existing() -> None:
         latest_game=game2,
         latest_game_played_at=game2.date_finished,
     )
-    Map.objects.update_game_stats_with_game(game2)
+    Map.objects.update_game_stats_with_games(game2.pk)
 
     Map.objects.filter(pk=brewer.pk).update(
         game_count=1,
@@ -33,7 +33,7 @@ def test_update_game_stats_for_map_for_existing() -> None:
         latest_game=game4,
         latest_game_played_at=game4.date_finished,
     )
-    Map.objects.update_game_stats_with_game(game5)
+    Map.objects.update_game_stats_with_games(game5.pk)
 
     abomb.refresh_from_db()
     assert abomb.game_count == 1
@@ -57,7 +57,7 @@ def test_update_game_stats_for_map_from_scratch() -> None:
 
     game1, game2 = GameFactory.create_batch(2, map=abomb)
 
-    Map.objects.update_game_stats_with_game(game1)
+    Map.objects.update_game_stats_with_games(game1.pk)
     abomb.refresh_from_db()
     assert abomb.game_count == 1
     assert abomb.first_game == game1
@@ -65,7 +65,7 @@ def test_update_game_stats_for_map_from_scratch() -> None:
     assert abomb.latest_game == game1
     assert abomb.latest_game_played_at == game1.date_finished
 
-    Map.objects.update_game_stats_with_game(game2)
+    Map.objects.update_game_stats_with_games(game2.pk)
     abomb.refresh_from_db()
     assert abomb.game_count == 2
     assert abomb.first_game == game1
@@ -74,7 +74,7 @@ def test_update_game_stats_for_map_from_scratch() -> None:
     assert abomb.latest_game_played_at == game2.date_finished
 
     # check that the stats are not updated if the game is already the latest
-    Map.objects.update_game_stats_with_game(game2)
+    Map.objects.update_game_stats_with_games(game2.pk)
     abomb.refresh_from_db()
     assert abomb.game_count == 2
     assert abomb.first_game == game1
@@ -1,13 +1,14 @@
 # ruff: noqa: C408
 from datetime import UTC, datetime, timedelta
+from unittest import mock
 
 import pytest
 from django.utils import timezone
 
 from apps.geoip.models import ISP
 from apps.tracker.exceptions import NoProfileMatchError
-from apps.tracker.managers.profile import is_name_popular
-from apps.tracker.models import Alias, Profile
+from apps.tracker.managers.profile import ProfileManager, is_name_popular
+from apps.tracker.models import Alias, Game, Profile
 from apps.utils.test import freeze_timezone_now
 from tests.factories.geoip import ISPFactory
 from tests.factories.tracker import (
@@ -130,6 +131,25 @@ def test_match_smart_does_not_match_against_popular_names(db):
         Profile.objects.match_smart(name="newname", ip_address="127.0.0.3", isp=isp)
 
 
+def test_match_smart_takes_single_query(db, django_assert_num_queries):
+    isp = ISPFactory(country="jp")
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    PlayerFactory(alias__profile=profile1, alias__name="Serge", alias__isp=isp, ip="127.0.0.1")
+    PlayerFactory(alias__profile=profile2, alias__name="Serge", alias__isp=None, ip="127.0.0.2")
+
+    # name+ip is preferred to name+isp
+    with django_assert_num_queries(1):
+        profile = Profile.objects.match_smart(name="Serge", ip_address="127.0.0.2", isp=isp)
+    assert profile == profile2
+
+    with django_assert_num_queries(1):
+        profile = Profile.objects.match_smart(name="Serge", ip_address="127.0.0.3", isp=isp)
+    assert profile == profile1
+
+    with django_assert_num_queries(1), pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Player", ip_address="127.0.0.3", isp=isp)
+
+
 class TestProfileMatch:
     @pytest.fixture(autouse=True)
     def _set_up(self, db):
@@ -292,6 +312,21 @@ def test_player_does_not_receive_same_profile_after_long_period(db):
     assert alias3.profile.pk == alias1.profile.pk
 
 
+def test_ip_lookup_requires_recent_game_with_same_ip(db):
+    now = timezone.now()
+
+    profile = ProfileFactory()
+    alias = AliasFactory(profile=profile, name="Player", isp=None)
+    # the ip has been used long ago, whereas the alias has been seen recently with another ip
+    PlayerFactory(alias=alias, ip="127.0.0.1", game__date_finished=now - timedelta(days=181))
+    PlayerFactory(alias=alias, ip="127.0.0.2", game__date_finished=now - timedelta(days=7))
+
+    with pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=None)
+
+    assert Profile.objects.match_smart(name="Serge", ip_address="127.0.0.2", isp=None) == profile
+
+
 @pytest.mark.parametrize(
     "profile_alias_updated_at, new_alias_updated_at",
     [
@@ -365,3 +400,86 @@ def test_alias_is_created_with_new_profile(now_mock, db):
 )
 def test_popular_names(name):
     assert is_name_popular(name)
+
+
+def test_match_smart_results_are_cached(db):
+    isp = ISPFactory(country="jp")
+    profile = ProfileFactory()
+    PlayerFactory(alias__profile=profile, alias__name="Serge", alias__isp=isp, ip="127.0.0.1")
+
+    assert Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=isp) == profile
+
+    with mock.patch.object(ProfileManager, "_prepare_match_smart_queryset") as match_mock:
+        assert Profile.objects.match_smart(name="SERGE", ip_address="127.0.0.1", isp=isp) == profile
+        with pytest.raises(NoProfileMatchError):
+            Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=None)
+
+    assert match_mock.call_count == 1
+
+
+def test_cached_match_smart_failure_is_invalidated_with_new_alias(db):
+    isp = ISPFactory(country="jp")
+
+    with pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=isp)
+    with pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Another", ip_address="127.0.0.3", isp=isp)
+
+    alias = Alias.objects.create_alias(name="Serge", ip_address="127.0.0.2", isp=isp)
+    PlayerFactory(alias=alias, ip="127.0.0.1")
+
+    # only the matches involving the name or the ip of the new alias are invalidated
+    assert Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=isp) == (
+        alias.profile
+    )
+    with pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Another", ip_address="127.0.0.3", isp=isp)
+
+
+def test_cached_match_smart_failure_is_invalidated_with_new_game(db):
+    isp = ISPFactory(country="jp", ip="127.0.0.0/24")
+    alias = AliasFactory(name="Serge", isp=isp)
+    PlayerFactory(alias=alias, ip="127.0.0.1")
+
+    with pytest.raises(NoProfileMatchError):
+        Profile.objects.match_smart(name="Another", ip_address="127.0.0.2", isp=None)
+
+    # the existing alias is seen with the ip in a new game
+    Game.objects.create_game(
+        server=ServerFactory(),
+        data={
+            "tag": "foo",
+            "gametype": "VIP Escort",
+            "mapname": "A-Bomb Nightclub",
+            "outcome": "swat_vip_escape",
+            "time": 600,
+            "player_num": 1,
+            "score_swat": 100,
+            "score_sus": 0,
+            "vict_swat": 1,
+            "vict_sus": 0,
+            "bombs_defused": 0,
+            "bombs_total": 0,
+            "players": [{"name": "Serge", "ip": "127.0.0.2", "score": 10}],
+        },
+        date_finished=timezone.now(),
+    )
+    assert Alias.objects.get() == alias
+
+    assert Profile.objects.match_smart(name="Another", ip_address="127.0.0.2", isp=None) == (
+        alias.profile
+    )
+
+
+def test_cached_match_smart_for_deleted_profile_is_ignored(db):
+    isp = ISPFactory(country="jp")
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    alias = AliasFactory(profile=profile1, name="Serge", isp=isp)
+    PlayerFactory(alias=alias, ip="127.0.0.1")
+
+    assert Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=isp) == profile1
+
+    Alias.objects.filter(pk=alias.pk).update(profile=profile2)
+    profile1.delete()
+
+    assert Profile.objects.match_smart(name="Serge", ip_address="127.0.0.1", isp=isp) == profile2
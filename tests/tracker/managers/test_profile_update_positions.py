@@ -755,3 +755,56 @@ def test_update_last_year_positions(now):
         PlayerStats.objects.get(category="score", year=now.year - 2, profile=profile1).position
         is None
     )
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_update_positions_incrementally(settings, now):
+    settings.TRACKER_RANK_INCREMENTAL_ENABLED = True
+    settings.TRACKER_MIN_TIME = 1000
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    server1, server2 = ServerFactory.create_batch(2)
+
+    for profile, score in [(profile1, 100), (profile2, 200)]:
+        PlayerStats.objects.save_stats(
+            {"score": score, "time": 2000}, profile=profile, year=now.year
+        )
+        for server in [server1, server2]:
+            ServerStats.objects.save_stats(
+                {"score": score, "time": 2000}, profile=profile, year=now.year, server=server
+            )
+
+    Profile.objects.update_player_positions_for_year(now.year, incremental=True)
+
+    assert list(
+        ServerStats.objects.filter(category="score")
+        .order_by("server_id", "profile_id")
+        .values_list("position", flat=True)
+    ) == [2, 1, 2, 1]
+    assert PlayerStats.objects.get(category="score", profile=profile2).position == 1
+    assert ServerStats.objects.get_changed_partitions(now.year) == {}
+    assert PlayerStats.objects.get_changed_partitions(now.year) == {}
+
+    # positions that have not been ranked by the tracker
+    # are left intact, as their partitions have not changed
+    PlayerStats.objects.update(position=None)
+    ServerStats.objects.filter(server=server2).update(position=None)
+    ServerStats.objects.save_stats({"score": 300}, profile=profile1, year=now.year, server=server1)
+
+    Profile.objects.update_player_positions_for_year(now.year, incremental=True)
+
+    assert list(
+        ServerStats.objects.filter(category="score")
+        .order_by("server_id", "profile_id")
+        .values_list("position", flat=True)
+    ) == [1, 2, None, None]
+    assert list(
+        ServerStats.objects.filter(category="time", server=server1)
+        .order_by("profile_id")
+        .values_list("position", flat=True)
+    ) == [1, 2]
+    assert not PlayerStats.objects.filter(position__isnull=False).exists()
+
+    # a full ranking updates all partitions
+    Profile.objects.update_player_positions_for_year(now.year)
+    assert not ServerStats.objects.filter(position__isnull=True).exists()
+    assert not PlayerStats.objects.filter(position__isnull=True).exists()
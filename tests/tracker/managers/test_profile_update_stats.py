@@ -1,12 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import partial
 
 import pytest
+from django.utils import timezone
 from pytz import UTC
 
+from apps.tracker.managers.player import PlayerQuerySet
 from apps.tracker.models import (
     GametypeStats,
     MapStats,
+    Player,
     PlayerStats,
     Profile,
     ServerStats,
@@ -1292,3 +1295,193 @@ def test_update_gametype_stats(db, spieler, jogador):
             "rd_bombs_defused": {"points": 1.0},
         },
     }
+
+
+def snapshot_stats(profile):
+    return {
+        (model.__name__, *item[:-1]): item[-1]
+        for model, grouping_key in [
+            (PlayerStats, "category"),
+            (MapStats, "map_id"),
+            (GametypeStats, "gametype"),
+            (ServerStats, "server_id"),
+            (WeaponStats, "weapon"),
+        ]
+        for item in model.objects.filter(profile=profile).values_list(
+            "year", grouping_key, "category", "points"
+        )
+    }
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+@pytest.mark.parametrize("profile_fixture", ["jogador", "spieler"])
+def test_folded_stats_match_full_recompute(db, request, profile_fixture):
+    profile = request.getfixturevalue(profile_fixture)
+    year = profile.last_seen_at.year
+    game_ids = sorted(
+        Player.objects.filter(alias__profile=profile, game__date_finished__year=year).values_list(
+            "game_id", flat=True
+        )
+    )
+    assert len(game_ids) > 1
+    halfway_game_id = game_ids[len(game_ids) // 2 - 1]
+
+    # the stats are computed in full for the first half of the games
+    Profile.objects.update_annual_stats_for_profile(
+        profile=profile, year=year, until_game_id=halfway_game_id
+    )
+    profile.stats_last_game_id = halfway_game_id
+    profile.stats_recomputed_at = timezone.now()
+    profile.save()
+
+    # then the rest of the games are folded into them
+    Profile.objects.update_stats_for_profile(profile)
+    profile.refresh_from_db()
+    assert profile.stats_last_game_id == max(
+        Player.objects.filter(alias__profile=profile).values_list("game_id", flat=True)
+    )
+    folded_stats = snapshot_stats(profile)
+
+    for model in [PlayerStats, MapStats, GametypeStats, ServerStats, WeaponStats]:
+        model.objects.filter(profile=profile).delete()
+    Profile.objects.update_annual_stats_for_profile(profile=profile, year=year)
+
+    assert folded_stats == pytest.approx(snapshot_stats(profile), abs=1e-4)
+
+
+def _compute_stats_for_first_half_of_games(profile):
+    year = profile.last_seen_at.year
+    game_ids = sorted(
+        Player.objects.filter(alias__profile=profile, game__date_finished__year=year).values_list(
+            "game_id", flat=True
+        )
+    )
+    halfway_game_id = game_ids[len(game_ids) // 2 - 1]
+    Profile.objects.update_annual_stats_for_profile(
+        profile=profile, year=year, until_game_id=halfway_game_id
+    )
+    profile.stats_last_game_id = halfway_game_id
+    profile.stats_recomputed_at = timezone.now() - timedelta(minutes=1)
+    profile.save()
+    return year, game_ids[-1]
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_stats_missing_signed_points_are_recomputed_instead_of_folded(db, jogador):
+    year, last_game_id = _compute_stats_for_first_half_of_games(jogador)
+    recomputed_at = jogador.stats_recomputed_at
+
+    # zero or negative score is never stored, so it cannot be folded into
+    PlayerStats.objects.filter(profile=jogador, year=year, category="score").delete()
+    assert PlayerQuerySet.can_fold_stats({}, {"score": 10}) is False
+    assert PlayerQuerySet.can_fold_stats({"score": 5}, {"score": -5}) is False
+    assert PlayerQuerySet.can_fold_stats({"score": 5}, {"score": -4, "kills": 1}) is True
+    assert PlayerQuerySet.can_fold_stats({}, {"kills": 1, "score": 0}) is True
+
+    Profile.objects.update_stats_for_profile(jogador)
+    jogador.refresh_from_db()
+    assert jogador.stats_recomputed_at > recomputed_at
+    assert jogador.stats_last_game_id == last_game_id
+    updated_stats = snapshot_stats(jogador)
+
+    for model in [PlayerStats, MapStats, GametypeStats, ServerStats, WeaponStats]:
+        model.objects.filter(profile=jogador).delete()
+    Profile.objects.update_annual_stats_for_profile(profile=jogador, year=year)
+
+    assert updated_stats == pytest.approx(snapshot_stats(jogador), abs=1e-4)
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_games_folded_in_the_meantime_are_not_folded_again(db, jogador):
+    year, last_game_id = _compute_stats_for_first_half_of_games(jogador)
+    stats_before = snapshot_stats(jogador)
+
+    # another update has folded the games while this one was aggregating them
+    Profile.objects.filter(pk=jogador.pk).update(stats_last_game_id=last_game_id)
+
+    assert Profile.objects.fold_annual_stats_for_profile(
+        profile=jogador, year=year, until_game_id=last_game_id
+    )
+    assert jogador.stats_last_game_id == last_game_id
+    assert snapshot_stats(jogador) == stats_before
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_cohort_stats_are_saved_under_profile_lock(db, django_assert_max_num_queries, jogador):
+    with django_assert_max_num_queries(100) as captured:
+        Profile.objects.update_stats_for_profiles(jogador.pk)
+
+    queries = [query["sql"] for query in captured.captured_queries]
+    locked_at = next(i for i, sql in enumerate(queries) if sql.endswith("FOR UPDATE"))
+    # the stats and the id of the last folded game are only written under the lock
+    written_at = [i for i, sql in enumerate(queries) if sql.startswith(("INSERT INTO", "UPDATE"))]
+    assert written_at
+    assert min(written_at) > locked_at
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_stats_are_recomputed_periodically(db, settings, jogador):
+    settings.TRACKER_STATS_RECOMPUTE_INTERVAL = 60 * 60
+
+    Profile.objects.update_stats_for_profile(jogador)
+    jogador.refresh_from_db()
+    assert jogador.stats_recomputed_at is not None
+    assert jogador.stats_last_game_id is not None
+
+    # pretend the stats have drifted
+    PlayerStats.objects.filter(profile=jogador, year=2015, category="score").update(points=1)
+
+    # no new games to fold in
+    Profile.objects.update_stats_for_profile(jogador)
+    assert PlayerStats.objects.get(profile=jogador, year=2015, category="score").points == 1
+
+    jogador.stats_recomputed_at = timezone.now() - timedelta(hours=2)
+    jogador.save()
+
+    Profile.objects.update_stats_for_profile(jogador)
+    assert PlayerStats.objects.get(profile=jogador, year=2015, category="score").points == 3400
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+@pytest.mark.parametrize("profile_fixture", ["jogador", "spieler"])
+def test_annual_stats_are_aggregated_in_single_scan(
+    db, request, django_assert_num_queries, profile_fixture
+):
+    profile = request.getfixturevalue(profile_fixture)
+    queryset = Player.objects.for_profile(profile).with_qualified_games()
+
+    with django_assert_num_queries(2):
+        annual_stats = queryset.aggregate_annual_stats()
+
+    assert annual_stats == {
+        "player": queryset.aggregate_player_stats(),
+        "map": queryset.aggregate_stats_by_map(),
+        "gametype": queryset.aggregate_stats_by_gametype(),
+        "server": queryset.aggregate_stats_by_server(),
+        "weapon": queryset.aggregate_stats_by_weapon(),
+    }
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_cohort_stats_match_per_profile_stats(db, jogador, spieler):
+    Profile.objects.update_stats_for_profile(jogador)
+    Profile.objects.update_stats_for_profile(spieler)
+    per_profile_stats = [snapshot_stats(jogador), snapshot_stats(spieler)]
+
+    for model in [PlayerStats, MapStats, GametypeStats, ServerStats, WeaponStats]:
+        model.objects.all().delete()
+
+    # the profiles were last seen in different years
+    Profile.objects.update_stats_for_profiles(jogador.pk, spieler.pk)
+
+    assert [snapshot_stats(jogador), snapshot_stats(spieler)] == per_profile_stats
+
+    for profile in [jogador, spieler]:
+        profile.refresh_from_db()
+        assert profile.stats_updated_at is not None
+        assert profile.stats_recomputed_at is not None
+        assert profile.stats_last_game_id == max(
+            Player.objects.filter(alias__profile__in=[jogador, spieler]).values_list(
+                "game_id", flat=True
+            )
+        )
@@ -21,3 +21,21 @@ def test_create_server_duplicate_raises_exception(db):
     Server.objects.create(ip="127.0.0.1", port=10480)
     with pytest.raises(exceptions.ValidationError):
         Server.objects.create_server("127.0.0.1", 10480)
+
+
+def test_obtain_stream_server_registers_new_server(db):
+    server = Server.objects.obtain_stream_server(ip="127.0.0.1", port=10480)
+    assert (server.ip, server.port) == ("127.0.0.1", 10480)
+    assert Server.objects.count() == 1
+
+
+def test_obtain_stream_server_uses_already_registered_server(db):
+    existing = Server.objects.create(ip="127.0.0.1", port=10480)
+    other = Server.objects.create(ip="127.0.0.2", port=10480)
+
+    assert Server.objects.obtain_stream_server(ip="127.0.0.1", port=10480) == existing
+    assert (
+        Server.objects.obtain_stream_server(ip="127.0.0.1", port=10480, server_id=other.pk)
+        == existing
+    )
+    assert Server.objects.count() == 2
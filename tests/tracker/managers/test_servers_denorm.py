@@ -87,7 +87,7 @@ def test_update_existing_game_stats_for_server() -> None:
         latest_game=game2,
         latest_game_played_at=game2.date_finished,
     )
-    Server.objects.update_game_stats_with_game(game2)
+    Server.objects.update_game_stats_with_games(game2.pk)
 
     Server.objects.filter(pk=server2.pk).update(
         game_count=1,
@@ -96,7 +96,7 @@ def test_update_existing_game_stats_for_server() -> None:
         latest_game=game4,
         latest_game_played_at=game4.date_finished,
     )
-    Server.objects.update_game_stats_with_game(game5)
+    Server.objects.update_game_stats_with_games(game5.pk)
 
     server1.refresh_from_db()
     assert server1.game_count == 1
@@ -118,7 +118,7 @@ def test_update_game_stats_for_server_from_scratch() -> None:
     server = ServerFactory()
     game1, game2 = GameFactory.create_batch(2, server=server)
 
-    Server.objects.update_game_stats_with_game(game1)
+    Server.objects.update_game_stats_with_games(game1.pk)
     server.refresh_from_db()
     assert server.game_count == 1
     assert server.first_game == game1
@@ -126,7 +126,7 @@ def test_update_game_stats_for_server_from_scratch() -> None:
     assert server.latest_game == game1
     assert server.latest_game_played_at == game1.date_finished
 
-    Server.objects.update_game_stats_with_game(game2)
+    Server.objects.update_game_stats_with_games(game2.pk)
     server.refresh_from_db()
     assert server.game_count == 2
     assert server.first_game == game1
@@ -135,7 +135,7 @@ def test_update_game_stats_for_server_from_scratch() -> None:
     assert server.latest_game_played_at == game2.date_finished
 
     # stats are not updated if the game is already saved as the latest
-    Server.objects.update_game_stats_with_game(game2)
+    Server.objects.update_game_stats_with_games(game2.pk)
     server.refresh_from_db()
     assert server.game_count == 2
     assert server.first_game == game1
@@ -144,6 +144,26 @@ def test_update_game_stats_for_server_from_scratch() -> None:
     assert server.latest_game_played_at == game2.date_finished
 
 
+@pytest.mark.django_db
+def test_update_game_stats_for_server_with_games_out_of_order() -> None:
+    server = ServerFactory()
+    now = timezone.now()
+    # replayed games get higher ids than the games that were played after them
+    game1 = GameFactory(server=server, date_finished=now - timedelta(hours=1))
+    game2 = GameFactory(server=server, date_finished=now - timedelta(hours=3))
+    game3 = GameFactory(server=server, date_finished=now - timedelta(hours=2))
+
+    Server.objects.update_game_stats_with_games(game1.pk)
+    Server.objects.update_game_stats_with_games(game2.pk, game3.pk)
+
+    server.refresh_from_db()
+    assert server.game_count == 3
+    assert server.first_game == game2
+    assert server.first_game_played_at == game2.date_finished
+    assert server.latest_game == game1
+    assert server.latest_game_played_at == game1.date_finished
+
+
 @pytest.mark.django_db(databases=["default", "replica"])
 @freeze_timezone_now(datetime(2023, 8, 8, 11, 22, 55, tzinfo=UTC))
 def test_update_search_vector_for_many_servers(
@@ -1,8 +1,13 @@
 from datetime import datetime
 
+import pytest
 from pytz import UTC
 
+from apps.tracker.entities import LegacyStatCategory
 from apps.tracker.managers.stats import get_stats_period_for_year
+from apps.tracker.models import MapStats, PlayerStats
+from tests.factories.stats import MapStatsFactory, PlayerStatsFactory
+from tests.factories.tracker import MapFactory, ProfileFactory
 
 
 def test_period_dates():
@@ -17,3 +22,48 @@ def test_period_dates():
 
     assert get_stats_period_for_year(2015) == annual_2015
     assert get_stats_period_for_year(2022) == annual_2022
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("copy_min_rows", [1, 1000])
+def test_save_stats_batch_upserts_rows(settings, copy_min_rows):
+    settings.TRACKER_STATS_COPY_MIN_ROWS = copy_min_rows
+
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    abomb = MapFactory(name="A-Bomb Nightclub")
+    brewer = MapFactory(name="Brewer County Courthouse")
+    PlayerStatsFactory(profile=profile1, year=2022, category="score", points=100, position=1)
+    MapStatsFactory(profile=profile1, year=2022, map=abomb, category="kills", points=5)
+
+    PlayerStats.objects.save_stats_batch(
+        [
+            *PlayerStats.objects.build_stats(
+                {"score": 150, "kills": 10, "deaths": 0}, profile=profile1, year=2022
+            ),
+            *PlayerStats.objects.build_stats({"score": 50}, profile=profile2, year=2022),
+        ]
+    )
+    MapStats.objects.save_stats_batch(
+        MapStats.objects.build_grouped_stats(
+            {abomb.pk: {"kills": 7}, brewer.pk: {"kills": 1, "score": 2.5}},
+            grouping_key="map_id",
+            profile=profile1,
+            year=2022,
+        )
+    )
+
+    assert set(
+        PlayerStats.objects.values_list("profile_id", "category", "category_legacy", "points")
+    ) == {
+        (profile1.pk, "score", LegacyStatCategory.score, 150),
+        (profile1.pk, "kills", LegacyStatCategory.kills, 10),
+        (profile2.pk, "score", LegacyStatCategory.score, 50),
+    }
+    # the positions are left intact
+    assert PlayerStats.objects.get(profile=profile1, category="score").position == 1
+
+    assert set(MapStats.objects.values_list("map_id", "category", "points")) == {
+        (abomb.pk, "kills", 7),
+        (brewer.pk, "kills", 1),
+        (brewer.pk, "score", 2.5),
+    }
@@ -0,0 +1,187 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+from apps.tracker.models import GametypeStats, MapStats, PlayerStats, ServerStats
+from tests.factories.tracker import MapFactory, ProfileFactory, ServerFactory
+
+
+@pytest.fixture(autouse=True)
+def _enable_redis_leaderboards(settings):
+    settings.TRACKER_LEADERBOARDS_REDIS_ENABLED = True
+    settings.TRACKER_MIN_TIME = 1000
+
+
+@pytest.mark.django_db
+def test_points_are_mirrored_into_leaderboards():
+    profile1, profile2, profile3 = ProfileFactory.create_batch(3)
+
+    PlayerStats.objects.save_stats({"score": 100, "kills": 5}, profile=profile1, year=2016)
+    PlayerStats.objects.save_stats({"score": 300, "kills": 1}, profile=profile2, year=2016)
+    PlayerStats.objects.save_stats({"score": 200}, profile=profile3, year=2016)
+    PlayerStats.objects.save_stats({"score": 1000}, profile=profile3, year=2015)
+
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=5) == [
+        (profile2.pk, 300),
+        (profile3.pk, 200),
+        (profile1.pk, 100),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=1) == [
+        (profile2.pk, 300),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="kills", limit=5) == [
+        (profile1.pk, 5),
+        (profile2.pk, 1),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="arrests", limit=5) == []
+
+    assert (
+        PlayerStats.objects.get_leaderboard_position(
+            profile_id=profile1.pk, year=2016, category="score"
+        )
+        == 3
+    )
+    assert (
+        PlayerStats.objects.get_leaderboard_position(
+            profile_id=profile3.pk, year=2015, category="score"
+        )
+        == 1
+    )
+    assert (
+        PlayerStats.objects.get_leaderboard_position(
+            profile_id=profile3.pk, year=2016, category="kills"
+        )
+        is None
+    )
+
+    # the points are updated in place
+    PlayerStats.objects.save_stats({"score": 500}, profile=profile1, year=2016)
+    assert (
+        PlayerStats.objects.get_leaderboard_position(
+            profile_id=profile1.pk, year=2016, category="score"
+        )
+        == 1
+    )
+
+
+@pytest.mark.django_db
+def test_only_qualified_profiles_make_it_to_leaderboards():
+    profile1, profile2, profile3 = ProfileFactory.create_batch(3)
+
+    PlayerStats.objects.save_stats({"time": 2000, "spm_ratio": 1.5}, profile=profile1, year=2016)
+    PlayerStats.objects.save_stats({"time": 500, "spm_ratio": 5}, profile=profile2, year=2016)
+    # the qualifying points come later
+    PlayerStats.objects.save_stats({"spm_ratio": 2.5}, profile=profile3, year=2016)
+
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="spm_ratio", limit=5) == [
+        (profile1.pk, 1.5),
+    ]
+
+    PlayerStats.objects.save_stats({"time": 1000}, profile=profile3, year=2016)
+    PlayerStats.objects.save_stats({"time": 5000, "spm_ratio": 4}, profile=profile2, year=2016)
+
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="spm_ratio", limit=5) == [
+        (profile2.pk, 4),
+        (profile3.pk, 2.5),
+        (profile1.pk, 1.5),
+    ]
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="time", limit=5) == [
+        (profile2.pk, 5000),
+        (profile1.pk, 2000),
+        (profile3.pk, 1000),
+    ]
+
+
+@pytest.mark.django_db
+def test_leaderboards_are_partitioned():
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    server1, server2 = ServerFactory.create_batch(2)
+
+    ServerStats.objects.save_stats({"score": 100}, profile=profile1, year=2016, server=server1)
+    ServerStats.objects.save_stats({"score": 200}, profile=profile2, year=2016, server=server1)
+    ServerStats.objects.save_stats({"score": 300}, profile=profile1, year=2016, server=server2)
+    GametypeStats.objects.save_stats(
+        {"score": 50, "time": 5000, "spm_ratio": 0.5},
+        profile=profile1,
+        year=2016,
+        gametype="VIP Escort",
+    )
+
+    assert ServerStats.objects.get_leaderboard(
+        year=2016, category="score", limit=5, server_id=server1.pk
+    ) == [(profile2.pk, 200), (profile1.pk, 100)]
+    assert ServerStats.objects.get_leaderboard(
+        year=2016, category="score", limit=5, server_id=server2.pk
+    ) == [(profile1.pk, 300)]
+    assert GametypeStats.objects.get_leaderboard(
+        year=2016, category="spm_ratio", limit=5, gametype="VIP Escort"
+    ) == [(profile1.pk, 0.5)]
+    assert (
+        GametypeStats.objects.get_leaderboard(
+            year=2016, category="score", limit=5, gametype="Rapid Deployment"
+        )
+        == []
+    )
+
+    assert ServerStats.objects.clear_leaderboards(2016) == 2
+    assert (
+        ServerStats.objects.get_leaderboard(
+            year=2016, category="score", limit=5, server_id=server1.pk
+        )
+        == []
+    )
+
+
+@pytest.mark.django_db
+def test_points_are_mirrored_into_leaderboards_on_commit():
+    profile = ProfileFactory()
+
+    with mock.patch.object(transaction, "on_commit") as on_commit_mock:
+        PlayerStats.objects.save_stats({"score": 100}, profile=profile, year=2016)
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=5) == []
+
+    (mirror_leaderboards,), _ = on_commit_mock.call_args
+    mirror_leaderboards()
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=5) == [
+        (profile.pk, 100),
+    ]
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_leaderboards_of_merged_servers_are_deleted(redis):
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    server1 = ServerFactory()
+    server2 = ServerFactory(merged_into=server1, merged_into_at=timezone.now() - timedelta(days=1))
+
+    ServerStats.objects.save_stats(
+        {"score": 100, "time": 5000, "spm_ratio": 1.5}, profile=profile1, year=2016, server=server1
+    )
+    ServerStats.objects.save_stats(
+        {"score": 200, "time": 5000, "spm_ratio": 2.5}, profile=profile2, year=2016, server=server2
+    )
+    assert redis.keys(f"leaderboards:serverstats:2016:*:{server2.pk}*")
+
+    ServerStats.objects.merge_unmerged_stats()
+
+    assert redis.keys(f"leaderboards:serverstats:2016:*:{server2.pk}*") == []
+    assert ServerStats.objects.get_leaderboard(
+        year=2016, category="score", limit=5, server_id=server1.pk
+    ) == [(profile1.pk, 100)]
+
+
+@pytest.mark.django_db
+def test_stats_without_leaderboards_are_not_mirrored(redis):
+    profile = ProfileFactory()
+    MapStats.objects.save_stats({"score": 100}, profile=profile, year=2016, map=MapFactory())
+    assert redis.keys("leaderboards:*") == []
+
+
+@pytest.mark.django_db
+def test_leaderboards_are_not_mirrored_by_default(settings):
+    settings.TRACKER_LEADERBOARDS_REDIS_ENABLED = False
+    profile = ProfileFactory()
+    PlayerStats.objects.save_stats({"score": 100}, profile=profile, year=2016)
+    assert PlayerStats.objects.get_leaderboard(year=2016, category="score", limit=5) == []
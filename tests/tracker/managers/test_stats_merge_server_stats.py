@@ -195,7 +195,7 @@ def test_merge_unmerged_server_stats_happy_flow(now, settings, django_assert_num
         category="kills", year=2021, server=server1, profile=profile3, points=15, position=4
     )
 
-    with django_assert_num_queries(37), freeze_timezone_now(then):
+    with django_assert_num_queries(47), freeze_timezone_now(then):
         ServerStats.objects.merge_unmerged_stats()
 
     assert ServerStats.objects.filter(server=server1, year=2020).count() == 14
@@ -1,9 +1,12 @@
+from unittest import mock
+
 import pytest
+from django.db import transaction
 from django.utils import timezone
 
-from apps.tracker.models import GametypeStats, PlayerStats
-from tests.factories.stats import GametypeStatsFactory, PlayerStatsFactory
-from tests.factories.tracker import ProfileFactory
+from apps.tracker.models import GametypeStats, MapStats, PlayerStats, ServerStats, WeaponStats
+from tests.factories.stats import GametypeStatsFactory, PlayerStatsFactory, ServerStatsFactory
+from tests.factories.tracker import MapFactory, ProfileFactory, ServerFactory
 
 
 @pytest.mark.django_db(databases=["default", "replica"])
@@ -313,3 +316,253 @@ def test_rank_map_stats_qualify():
     assert spmvipnow_1.position is None
     assert spmvipnow_2.position == 1
     assert spmvipnow_3.position is None
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_rank_updates_only_changed_positions():
+    score_1 = PlayerStatsFactory(category="score", year=2016, points=100, position=1)
+    score_2 = PlayerStatsFactory(category="score", year=2016, points=10, position=3)
+    score_3 = PlayerStatsFactory(category="score", year=2016, points=1)
+    kills_1 = PlayerStatsFactory(category="kills", year=2016, points=10, position=1)
+
+    assert PlayerStats.objects.rank(year=2016) == 2
+
+    for obj in [score_1, score_2, score_3, kills_1]:
+        obj.refresh_from_db()
+
+    assert score_1.position == 1
+    assert score_2.position == 2
+    assert score_3.position == 3
+    assert kills_1.position == 1
+
+    # the positions are up to date, hence nothing to update
+    assert PlayerStats.objects.rank(year=2016) == 0
+
+    score_3.points = 1000
+    score_3.save(update_fields=["points"])
+    assert PlayerStats.objects.rank(year=2016) == 3
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_rank_qualify_keeps_positions_outside_filters():
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    server1, server2 = ServerFactory.create_batch(2)
+
+    for server in [server1, server2]:
+        ServerStatsFactory(
+            category="time", server=server, profile=profile1, year=2016, points=10000
+        )
+        ServerStatsFactory(category="time", server=server, profile=profile2, year=2016, points=10)
+
+    spm1_1 = ServerStatsFactory(
+        category="spm_ratio", server=server1, profile=profile1, year=2016, points=1, position=2
+    )
+    spm1_2 = ServerStatsFactory(
+        category="spm_ratio", server=server1, profile=profile2, year=2016, points=2, position=1
+    )
+    spm2_2 = ServerStatsFactory(
+        category="spm_ratio", server=server2, profile=profile2, year=2016, points=2, position=1
+    )
+
+    updated = ServerStats.objects.rank(
+        year=2016,
+        cats=["spm_ratio"],
+        qualify={"time": 1000},
+        filters={"server__in": [server1.pk]},
+    )
+    assert updated == 2
+
+    for obj in [spm1_1, spm1_2, spm2_2]:
+        obj.refresh_from_db()
+
+    assert spm1_1.position == 1
+    assert spm1_2.position is None
+    # the stats of other servers are not affected
+    assert spm2_2.position == 1
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_rank_changed_partitions_only(settings):
+    settings.TRACKER_RANK_INCREMENTAL_ENABLED = True
+    profile1, profile2 = ProfileFactory.create_batch(2)
+    server1, server2 = ServerFactory.create_batch(2)
+
+    for server in [server1, server2]:
+        ServerStats.objects.save_stats(
+            {"score": 100, "time": 10000, "spm_ratio": 1},
+            profile=profile1,
+            year=2016,
+            server=server,
+        )
+        ServerStats.objects.save_stats(
+            {"score": 200, "time": 10, "spm_ratio": 2}, profile=profile2, year=2016, server=server
+        )
+
+    snapshot_at = timezone.now().timestamp()
+    changed = ServerStats.objects.get_changed_partitions(2016, until=snapshot_at)
+    assert changed == {
+        "score": {str(server1.pk), str(server2.pk)},
+        "time": {str(server1.pk), str(server2.pk)},
+        "spm_ratio": {str(server1.pk), str(server2.pk)},
+    }
+    assert (
+        ServerStats.objects.rank_changed(
+            year=2016, changed=changed, cats=["spm_ratio"], qualify={"time": 1000}
+        )
+        == 2
+    )
+    assert (
+        ServerStats.objects.rank_changed(year=2016, changed=changed, exclude_cats=["spm_ratio"])
+        == 4
+    )
+    ServerStats.objects.forget_changed_partitions(2016, until=snapshot_at)
+    assert ServerStats.objects.get_changed_partitions(2016) == {}
+
+    assert list(
+        ServerStats.objects.filter(category="spm_ratio")
+        .order_by("server_id", "profile_id")
+        .values_list("position", flat=True)
+    ) == [1, None, 1, None]
+
+    ServerStats.objects.filter(server=server2, category="score").update(position=None)
+    ServerStats.objects.save_stats({"score": 300}, profile=profile1, year=2016, server=server1)
+
+    changed = ServerStats.objects.get_changed_partitions(2016)
+    assert changed == {"score": {str(server1.pk)}}
+    assert (
+        ServerStats.objects.rank_changed(
+            year=2016, changed=changed, cats=["spm_ratio"], qualify={"time": 1000}
+        )
+        == 0
+    )
+    assert (
+        ServerStats.objects.rank_changed(year=2016, changed=changed, exclude_cats=["spm_ratio"])
+        == 1
+    )
+
+    assert list(
+        ServerStats.objects.filter(category="score")
+        .order_by("server_id", "profile_id")
+        .values_list("position", flat=True)
+    ) == [1, 2, None, None]
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_changed_partitions_are_marked_on_commit(settings):
+    settings.TRACKER_RANK_INCREMENTAL_ENABLED = True
+    profile = ProfileFactory()
+
+    with mock.patch.object(transaction, "on_commit") as on_commit_mock:
+        PlayerStats.objects.save_stats({"score": 100}, profile=profile, year=2016)
+    assert PlayerStats.objects.get_changed_partitions(2016) == {}
+
+    (mark_changed,), _ = on_commit_mock.call_args
+    mark_changed()
+    assert PlayerStats.objects.get_changed_partitions(2016) == {"score": {""}}
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_partitions_changed_while_ranking_are_not_forgotten(settings):
+    settings.TRACKER_RANK_INCREMENTAL_ENABLED = True
+    profile = ProfileFactory()
+    server1, server2 = ServerFactory.create_batch(2)
+
+    ServerStats.objects.save_stats({"score": 100}, profile=profile, year=2016, server=server1)
+    snapshot_at = timezone.now().timestamp()
+    assert ServerStats.objects.get_changed_partitions(2016, until=snapshot_at) == {
+        "score": {str(server1.pk)}
+    }
+
+    # the stats change again while the snapshot is being ranked
+    ServerStats.objects.save_stats({"score": 200}, profile=profile, year=2016, server=server1)
+    ServerStats.objects.save_stats({"score": 300}, profile=profile, year=2016, server=server2)
+
+    ServerStats.objects.forget_changed_partitions(2016, until=snapshot_at)
+    assert ServerStats.objects.get_changed_partitions(2016) == {
+        "score": {str(server1.pk), str(server2.pk)}
+    }
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_changed_partitions_are_not_tracked_for_unranked_stats(settings, redis):
+    settings.TRACKER_RANK_INCREMENTAL_ENABLED = True
+    profile = ProfileFactory()
+    map_ = MapFactory()
+
+    MapStats.objects.save_stats({"score": 100}, profile=profile, year=2016, map=map_)
+    WeaponStats.objects.save_stats({"kills": 10}, profile=profile, year=2016, weapon="9mm SMG")
+    assert redis.keys(f"{settings.TRACKER_RANK_CHANGES_REDIS_KEY}:*") == []
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_changed_partitions_are_not_tracked_by_default():
+    profile = ProfileFactory()
+    PlayerStats.objects.save_stats({"score": 100}, profile=profile, year=2016)
+    assert PlayerStats.objects.get_changed_partitions(2016) == {}
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_rank_categories_sharing_qualification(django_assert_num_queries):
+    profile1, profile2, profile3 = ProfileFactory.create_batch(3)
+    server1, server2 = ServerFactory.create_batch(2)
+
+    ServerStatsFactory(
+        category="weapon_shots", server=server1, profile=profile1, year=2016, points=1000
+    )
+    ServerStatsFactory(
+        category="weapon_shots", server=server1, profile=profile2, year=2016, points=100
+    )
+    ServerStatsFactory(
+        category="weapon_shots", server=server2, profile=profile2, year=2016, points=5000
+    )
+    ServerStatsFactory(
+        category="weapon_shots", server=server2, profile=profile3, year=2016, points=5000
+    )
+
+    hit1_1 = ServerStatsFactory(
+        category="weapon_hit_ratio", server=server1, profile=profile1, year=2016, points=0.1
+    )
+    hit1_2 = ServerStatsFactory(
+        category="weapon_hit_ratio",
+        server=server1,
+        profile=profile2,
+        year=2016,
+        points=0.5,
+        position=1,
+    )
+    hit2_2 = ServerStatsFactory(
+        category="weapon_hit_ratio", server=server2, profile=profile2, year=2016, points=0.2
+    )
+    hit2_3 = ServerStatsFactory(
+        category="weapon_hit_ratio", server=server2, profile=profile3, year=2016, points=0.3
+    )
+    kill1_2 = ServerStatsFactory(
+        category="weapon_kill_ratio", server=server1, profile=profile2, year=2016, points=0.5
+    )
+    kill2_2 = ServerStatsFactory(
+        category="weapon_kill_ratio", server=server2, profile=profile2, year=2016, points=0.5
+    )
+
+    # the qualified profiles are stored once for both categories
+    with django_assert_num_queries(9) as captured:
+        updated = ServerStats.objects.rank(
+            year=2016,
+            cats=["weapon_hit_ratio", "weapon_kill_ratio"],
+            qualify={"weapon_shots": 1000},
+        )
+    assert updated == 5
+    assert [
+        query["sql"]
+        for query in captured.captured_queries
+        if query["sql"].startswith("CREATE TEMPORARY TABLE")
+    ] == [mock.ANY]
+
+    for obj in [hit1_1, hit1_2, hit2_2, hit2_3, kill1_2, kill2_2]:
+        obj.refresh_from_db()
+
+    assert hit1_1.position == 1
+    assert hit1_2.position is None
+    assert hit2_3.position == 1
+    assert hit2_2.position == 2
+    assert kill1_2.position is None
+    assert kill2_2.position == 1
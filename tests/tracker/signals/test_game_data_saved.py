@@ -4,6 +4,7 @@ from django.utils import timezone
 
 from apps.tracker.models import Profile
 from apps.tracker.signals import game_data_saved
+from apps.tracker.tasks import update_pending_games
 from tests.factories.streaming import ServerGameDataFactory
 from tests.factories.tracker import GameFactory, ServerFactory
 
@@ -13,6 +14,7 @@ def test_last_seen_is_updated_when_game_data_is_saved(db):
     game = GameFactory(date_finished=then, players=[{"alias__name": "Serge"}])
 
     game_data_saved.send(sender=None, data=ServerGameDataFactory(), server=game.server, game=game)
+    update_pending_games.delay()
 
     profile = Profile.objects.get()
 
@@ -0,0 +1,192 @@
+from unittest import mock
+
+import pytest
+from django.test import Client
+
+from apps.tracker.models import Game, GameReport, Map, Profile, Server
+from apps.tracker.tasks import process_queued_games
+from tests.factories.streaming import PlayerGameDataFactory, ServerGameDataFactory
+from tests.factories.tracker import GameFactory, ServerFactory
+
+
+@pytest.fixture(autouse=True)
+def _enable_game_batching(settings):
+    settings.TRACKER_GAME_BATCH_ENABLED = True
+
+
+def post_game_data(client: Client, **game_data_kwargs) -> None:
+    game_data = ServerGameDataFactory(**game_data_kwargs)
+    response = client.post("/stream/", game_data.to_json(), content_type="application/json")
+    assert response.content.decode()[0] == "0"
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_queued_games_are_saved_in_batches(db, client):
+    server = ServerFactory(ip="127.0.0.1", port=10480, listed=False, version="1.0")
+
+    post_game_data(
+        client,
+        tag="foo",
+        port=10480,
+        version="1.1",
+        mapname="A-Bomb Nightclub",
+        players=[PlayerGameDataFactory(name="Serge", ip="127.0.0.10")],
+    )
+    post_game_data(
+        client,
+        tag="bar",
+        port=10480,
+        version="1.1",
+        mapname="A-Bomb Nightclub",
+        players=[PlayerGameDataFactory(name="Serge", ip="127.0.0.10")],
+    )
+    post_game_data(
+        client,
+        tag="baz",
+        port=10580,
+        version="1.2",
+        mapname="Brewer County Courthouse",
+    )
+
+    # nothing is saved until the queue is drained
+    assert Game.objects.count() == 0
+
+    with mock.patch.object(Game.objects, "add_pending_games") as pending_games_mock:
+        process_queued_games.delay(batch_size=2)
+
+    assert pending_games_mock.call_count == 0
+
+    foo, bar, baz = Game.objects.order_by("pk")
+    assert (foo.tag, bar.tag, baz.tag) == ("foo", "bar", "baz")
+
+    server.refresh_from_db()
+    assert server.listed
+    assert server.version == "1.1"
+    assert server.game_count == 2
+    assert server.first_game == foo
+    assert server.latest_game == bar
+    assert server.latest_game_played_at == bar.date_finished
+
+    new_server = Server.objects.get(ip="127.0.0.1", port=10580)
+    assert new_server.version == "1.2"
+    assert new_server.game_count == 1
+    assert new_server.first_game == baz
+    assert new_server.latest_game == baz
+
+    abomb = Map.objects.get(name="A-Bomb Nightclub")
+    assert abomb.game_count == 2
+    assert abomb.first_game == foo
+    assert abomb.latest_game == bar
+
+    profile = Profile.objects.get(name="Serge")
+    assert profile.game_first == foo
+    assert profile.first_seen_at == foo.date_finished
+    assert profile.game_last == bar
+    assert profile.last_seen_at == bar.date_finished
+
+    # the queue is empty now
+    process_queued_games.delay()
+    assert Game.objects.count() == 3
+
+
+def test_duplicate_queued_games_are_skipped(db, client):
+    existing_game = GameFactory(tag="foo")
+
+    post_game_data(client, tag="foo", port=10480)
+    post_game_data(client, tag="bar", port=10480)
+    post_game_data(client, tag="bar", port=10480)
+
+    process_queued_games.delay()
+
+    assert Game.objects.filter(tag="foo").get() == existing_game
+    game = Game.objects.get(tag="bar")
+
+    server = Server.objects.get(ip="127.0.0.1", port=10480)
+    assert server.game_count == 1
+    assert server.latest_game == game
+
+
+def test_failed_queued_games_are_retried_individually(db, client):
+    post_game_data(client, tag="foo", port=10480)
+    post_game_data(client, tag="bar", port=10480)
+
+    create_game = Game.objects.create_game
+
+    def create_game_failing_foo(*, data, **kwargs):
+        if data["tag"] == "foo":
+            raise ValueError("foo")
+        return create_game(data=data, **kwargs)
+
+    with (
+        mock.patch.object(Game.objects, "create_game", side_effect=create_game_failing_foo),
+        mock.patch("apps.tracker.tasks.stream.process_game_data.delay") as process_mock,
+    ):
+        process_queued_games.delay()
+
+    assert list(Game.objects.values_list("tag", flat=True)) == ["bar"]
+
+    assert process_mock.call_count == 1
+    assert process_mock.call_args.kwargs["data"]["tag"] == "foo"
+    assert process_mock.call_args.kwargs["server_ip"] == "127.0.0.1"
+
+
+def test_unacknowledged_queued_games_are_picked_up_again(db, client):
+    post_game_data(client, tag="foo", port=10480)
+    post_game_data(client, tag="bar", port=10480)
+    post_game_data(client, tag="baz", port=10480)
+
+    # the worker dies before the batch is saved
+    assert [item["data"]["tag"] for item in Game.objects.pop_queued_game_data(2)] == [
+        "foo",
+        "bar",
+    ]
+
+    process_queued_games.delay(batch_size=2)
+
+    assert sorted(Game.objects.values_list("tag", flat=True)) == ["bar", "baz", "foo"]
+    assert Game.objects.pop_queued_game_data(2) == []
+
+
+def test_picked_up_queued_games_are_archived_once(db, client):
+    post_game_data(client, tag="foo", port=10480)
+    post_game_data(client, tag="bar", port=10480)
+    post_game_data(client, tag="baz", port=10480)
+
+    # the worker dies after the batch has been archived
+    GameReport.objects.archive(*Game.objects.pop_queued_game_data(2))
+    assert GameReport.objects.count() == 2
+
+    process_queued_games.delay(batch_size=2)
+
+    assert sorted(Game.objects.values_list("tag", flat=True)) == ["bar", "baz", "foo"]
+    assert sorted(GameReport.objects.values_list("tag", flat=True)) == ["bar", "baz", "foo"]
+
+
+def test_queued_games_are_not_drained_concurrently(db, client):
+    post_game_data(client, tag="foo", port=10480)
+
+    lock = Game.objects.get_game_queue_lock()
+    assert lock.acquire(blocking=False)
+    try:
+        process_queued_games.delay()
+        assert Game.objects.count() == 0
+    finally:
+        lock.release()
+
+    process_queued_games.delay()
+    assert Game.objects.get().tag == "foo"
+
+
+def test_update_game_stats_with_games_counts_games_once(db):
+    server = ServerFactory()
+    game1, game2, game3 = GameFactory.create_batch(3, server=server)
+
+    Server.objects.update_game_stats_with_games(game1.pk, game2.pk)
+    Server.objects.update_game_stats_with_games(game2.pk, game3.pk)
+
+    server.refresh_from_db()
+    assert server.game_count == 3
+    assert server.first_game == game1
+    assert server.first_game_played_at == game1.date_finished
+    assert server.latest_game == game3
+    assert server.latest_game_played_at == game3.date_finished
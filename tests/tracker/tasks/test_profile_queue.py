@@ -0,0 +1,144 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.utils import timezone
+
+from apps.tracker.entities import ProfileUpdateQueue
+from apps.tracker.models import PlayerStats, Profile
+from apps.tracker.tasks import (
+    drain_player_preferences_queue,
+    drain_player_stats_queue,
+    update_player_preferences,
+    update_player_stats,
+    update_player_stats_for_profile,
+)
+from tests.factories.tracker import PlayerFactory, ProfileFactory
+
+
+@pytest.fixture(autouse=True)
+def _enable_profile_queue(settings):
+    settings.TRACKER_PROFILE_QUEUE_ENABLED = True
+
+
+@pytest.fixture
+def profiles(db):
+    now = timezone.now()
+    profiles = []
+    for score in [10, 20, 30]:
+        profile = ProfileFactory(
+            first_seen_at=now - timedelta(days=1),
+            last_seen_at=now,
+            stats_updated_at=None,
+            preferences_updated_at=None,
+        )
+        PlayerFactory(alias__profile=profile, score=score, game__date_finished=now)
+        profiles.append(profile)
+    return profiles
+
+
+def test_profiles_are_queued_once(profiles):
+    with mock.patch.object(update_player_stats_for_profile, "apply_async") as task_mock:
+        update_player_stats.delay()
+        update_player_stats.delay()
+    assert not task_mock.called
+
+    metrics = Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)
+    assert metrics["depth"] == 3
+    assert metrics["lag"] >= 0
+
+    assert Profile.objects.queue_for_update(ProfileUpdateQueue.stats, profiles[0].pk) == 0
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.preferences) == {
+        "depth": 0,
+        "lag": 0,
+    }
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+@pytest.mark.parametrize("cohort_enabled", [True, False])
+def test_stats_queue_is_drained_in_chunks(settings, profiles, cohort_enabled):
+    settings.TRACKER_STATS_COHORT_ENABLED = cohort_enabled
+    settings.TRACKER_STATS_QUEUE_CHUNK_SIZE = 2
+
+    update_player_stats.delay()
+
+    drain_player_stats_queue.delay()
+    assert Profile.objects.filter(stats_updated_at__isnull=False).count() == 2
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)["depth"] == 1
+
+    drain_player_stats_queue.delay()
+    assert Profile.objects.filter(stats_updated_at__isnull=False).count() == 3
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)["depth"] == 0
+
+    for profile, score in zip(profiles, [10, 20, 30], strict=True):
+        assert PlayerStats.objects.get(profile=profile, category="score").points == score
+
+    # the drained profiles are up-to-date
+    update_player_stats.delay()
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)["depth"] == 0
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_profiles_failed_to_update_are_left_in_stats_queue(settings, profiles):
+    settings.TRACKER_STATS_COHORT_ENABLED = False
+    settings.TRACKER_STATS_QUEUE_CHUNK_SIZE = 10
+
+    update_player_stats.delay()
+    update_stats_for_profile = Profile.objects.update_stats_for_profile
+
+    def update_stats_or_fail(profile):
+        if profile.pk == profiles[1].pk:
+            raise RuntimeError("stats update failed")
+        update_stats_for_profile(profile)
+
+    with (
+        mock.patch.object(
+            Profile.objects, "update_stats_for_profile", side_effect=update_stats_or_fail
+        ),
+        pytest.raises(RuntimeError),
+    ):
+        drain_player_stats_queue.delay()
+
+    # the failed profile and the ones yet to be updated are picked up again
+    queued_ids = Profile.objects.get_queued_for_update(ProfileUpdateQueue.stats, 10)
+    assert profiles[1].pk in queued_ids
+    assert set(queued_ids) == set(
+        Profile.objects.filter(stats_updated_at__isnull=True).values_list("pk", flat=True)
+    )
+
+    drain_player_stats_queue.delay()
+    assert Profile.objects.filter(stats_updated_at__isnull=False).count() == 3
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)["depth"] == 0
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_merged_profiles_are_removed_from_stats_queue(settings, profiles):
+    settings.TRACKER_STATS_COHORT_ENABLED = False
+
+    update_player_stats.delay()
+    Profile.objects.filter(pk=profiles[0].pk).delete()
+
+    drain_player_stats_queue.delay()
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.stats)["depth"] == 0
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_preferences_queue_is_drained(settings, profiles):
+    settings.TRACKER_PREFERENCES_QUEUE_CHUNK_SIZE = 10
+
+    update_player_preferences.delay()
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.preferences)["depth"] == 3
+
+    drain_player_preferences_queue.delay()
+    assert Profile.objects.filter(preferences_updated_at__isnull=False).count() == 3
+    assert Profile.objects.get_update_queue_metrics(ProfileUpdateQueue.preferences)["depth"] == 0
+
+
+def test_queue_metrics_view(client, profiles):
+    Profile.objects.queue_for_update(ProfileUpdateQueue.stats, *[p.pk for p in profiles])
+
+    response = client.get("/info/queues/")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["stats"]["depth"] == 3
+    assert body["preferences"] == {"depth": 0, "lag": 0}
@@ -0,0 +1,123 @@
+from unittest import mock
+
+import pytest
+
+from apps.tracker.models import Game, Map, Profile
+from apps.tracker.signals import game_data_saved
+from apps.tracker.tasks import (
+    update_map_games,
+    update_pending_games,
+    update_profile_games,
+    update_server_games,
+)
+from tests.factories.streaming import ServerGameDataFactory
+from tests.factories.tracker import AliasFactory, GameFactory, MapFactory, ServerFactory
+
+
+def test_pending_games_are_updated_in_chunks(db):
+    server = ServerFactory()
+    abomb = MapFactory(name="A-Bomb Nightclub")
+    alias = AliasFactory(name="Serge")
+    game1, game2, game3 = GameFactory.create_batch(
+        3, server=server, map=abomb, players=[{"alias": alias}]
+    )
+
+    for game in [game3, game1, game2]:
+        game_data_saved.send(sender=None, data=ServerGameDataFactory(), server=server, game=game)
+
+    # nothing is updated until the pending games are picked up
+    server.refresh_from_db()
+    assert server.game_count == 0
+
+    update_pending_games.delay(chunk_size=2)
+
+    server.refresh_from_db()
+    assert server.game_count == 3
+    assert server.first_game == game1
+    assert server.latest_game == game3
+
+    abomb.refresh_from_db()
+    assert abomb.game_count == 3
+    assert abomb.first_game == game1
+    assert abomb.latest_game == game3
+
+    profile = Profile.objects.get(pk=alias.profile_id)
+    assert profile.game_first == game1
+    assert profile.game_last == game3
+
+    assert Game.objects.get_pending_games(10) == []
+
+
+def test_pending_games_committed_out_of_order_are_counted(db):
+    server = ServerFactory()
+    alias = AliasFactory(name="Serge")
+    game1, game2, game3 = GameFactory.create_batch(3, server=server, players=[{"alias": alias}])
+
+    # the transaction of the game with the lower id commits after the other games are updated
+    Game.objects.add_pending_games(game2.pk, game3.pk)
+    update_pending_games.delay()
+    Game.objects.add_pending_games(game1.pk)
+    update_pending_games.delay()
+
+    server.refresh_from_db()
+    assert server.game_count == 3
+    assert server.first_game == game1
+    assert server.first_game_played_at == game1.date_finished
+    assert server.latest_game == game3
+    assert server.latest_game_played_at == game3.date_finished
+
+    profile = Profile.objects.get(pk=alias.profile_id)
+    assert profile.game_first == game1
+    assert profile.game_last == game3
+
+
+def test_failed_pending_games_are_picked_up_again(db):
+    game = GameFactory()
+    Game.objects.add_pending_games(game.pk)
+
+    with (
+        mock.patch.object(
+            Map.objects, "update_game_stats_with_games", side_effect=ValueError("boom")
+        ),
+        pytest.raises(ValueError, match="boom"),
+    ):
+        update_pending_games.delay()
+
+    assert Game.objects.get_pending_games(10) == [game.pk]
+
+
+def test_pending_games_are_acknowledged_after_commit(db):
+    game1, game2 = GameFactory.create_batch(2)
+    Game.objects.add_pending_games(game1.pk, game2.pk)
+
+    # the games are not acknowledged until the updates are committed
+    with mock.patch.object(Game.objects, "ack_pending_games") as ack_mock:
+        update_pending_games.delay()
+    ack_mock.assert_called_once_with(game1.pk, game2.pk)
+    assert Game.objects.get_pending_games(10) == [game1.pk, game2.pk]
+
+    update_pending_games.delay()
+    assert Game.objects.get_pending_games(10) == []
+
+
+def test_pending_games_are_not_updated_concurrently(db):
+    game = GameFactory()
+    Game.objects.add_pending_games(game.pk)
+
+    lock = Game.objects.get_pending_games_lock()
+    assert lock.acquire(blocking=False)
+    try:
+        update_pending_games.delay()
+        assert Game.objects.get_pending_games(10) == [game.pk]
+    finally:
+        lock.release()
+
+    update_pending_games.delay()
+    assert Game.objects.get_pending_games(10) == []
+
+
+@pytest.mark.parametrize("task", [update_profile_games, update_server_games, update_map_games])
+def test_deprecated_game_tasks_add_pending_games(db, task):
+    game = GameFactory()
+    task.delay(game.pk)
+    assert Game.objects.get_pending_games(10) == [game.pk]
@@ -89,7 +89,7 @@ def test_update_player_stats(db, abomb, brewer, django_assert_num_queries):
         score=25,
     )
 
-    with django_assert_num_queries(35):
+    with django_assert_num_queries(29):
         update_player_stats.delay()
 
     profile1.refresh_from_db()
@@ -202,7 +202,9 @@ def test_update_player_stats_no_updates(db):
 
 
 @pytest.mark.django_db(databases=["default", "replica"])
-def test_update_player_stats_for_last_played_year(db):
+@pytest.mark.parametrize("cohort_enabled", [True, False])
+def test_update_player_stats_for_last_played_year(db, settings, cohort_enabled):
+    settings.TRACKER_STATS_COHORT_ENABLED = cohort_enabled
     now = timezone.now()
 
     old_profile = ProfileFactory(
@@ -5,10 +5,12 @@ from urllib.parse import urlencode
 import pytest
 from pytz import UTC
 
+from apps.tracker.models import GametypeStats, PlayerStats
 from apps.tracker.utils.misc import force_clean_name
 from apps.tracker.views import motd as motd_views
 from apps.utils.test import freeze_timezone_now
 from tests.factories.stats import GametypeStatsFactory, PlayerStatsFactory
+from tests.factories.tracker import ProfileFactory
 
 
 def parse_content(content: bytes) -> list[str]:
@@ -311,3 +313,32 @@ def test_motd_leaderboard_gametype_categories_compat(db, client, names, category
         assert lines[1] == f"example.com - TOP 5 by {title}"
         assert lines[4] == "#1 - Player"
         assert lines[7] == "#2 - Giocatore"
+
+
+def test_motd_leaderboard_from_redis(db, names, client, settings):
+    settings.TRACKER_LEADERBOARDS_REDIS_ENABLED = True
+
+    for i, name in enumerate(names[:4]):
+        profile = ProfileFactory(name=name)
+        PlayerStats.objects.save_stats({"score": 100 - i}, profile=profile, year=2021)
+        GametypeStats.objects.save_stats(
+            {"vip_escapes": i + 1}, profile=profile, year=2021, gametype="VIP Escort"
+        )
+    # the positions in the database are not used
+    PlayerStatsFactory(category="score", year=2021, position=1, profile__name=names[5])
+
+    with freeze_timezone_now(datetime(2021, 5, 29, 12, 17, 1, tzinfo=UTC)):
+        response = client.get("/api/motd/leaderboard/score/?limit=3")
+        lines = parse_content(response.content)
+        assert lines[1] == "example.com - TOP 3 by Score"
+        assert lines[4] == "#1 - Player"
+        assert lines[7] == "#2 - Giocatore"
+        assert lines[10] == "#3 - Jogador"
+        assert lines[13] == "Feel free to visit example.com to see more"
+
+        response = client.get("/api/motd/leaderboard/vip_escapes/")
+        lines = parse_content(response.content)
+        assert lines[1] == "example.com - TOP 5 by VIP Escapes"
+        assert lines[4] == "#1 - Spieler"
+        assert lines[13] == "#4 - Player"
+        assert lines[16] == "Feel free to visit example.com to see more"
@@ -11,7 +11,8 @@ from django.utils.timezone import now
 from mypy_extensions import Arg, KwArg
 from pytz import UTC
 
-from apps.tracker.models import Game, Map, Player, Profile, Server
+from apps.tracker.models import Alias, Game, Map, Player, Profile, Server
+from apps.tracker.tasks import update_pending_games
 from apps.utils.test import freeze_timezone_now
 from tests.factories.geoip import ISPFactory
 from tests.factories.loadout import LoadoutFactory
@@ -208,6 +209,7 @@ def test_post_game_data(
     )
     response = post_game_data(game_data)
     assert_success_code(response)
+    update_pending_games.delay()
 
     # server is created/updated
     server = Server.objects.get(ip="127.0.0.1", port=10580)
@@ -325,6 +327,12 @@ def test_post_game_data(
     assert player2_weapon.time == 100
     assert player2_weapon.distance == 10
 
+    # the qualified weapons and the grenades are summarized
+    assert (player2.weapon_hits, player2.weapon_kills, player2.weapon_teamhits) == (40, 15, 6)
+    assert (player2.grenade_hits, player2.grenade_kills, player2.grenade_teamhits) == (10, 0, 20)
+    assert player1.weapon_shots == player1_weapon.shots
+    assert player1.grenade_shots is None
+
     assert player3.vip
     assert player3.score == 15
     assert player3.kills == 15
@@ -762,9 +770,14 @@ def test_post_game_data_updates_player_profiles(
     game_time = datetime(2016, 3, 14, 12, 45, 12, tzinfo=UTC)
     with freeze_timezone_now(game_time):
         post_game_data(game_data)
+    update_pending_games.delay()
+
     new_game = Game.objects.get(tag=game_data["tag"])
     assert new_game.date_finished == game_time
     assert new_game.player_set.count() == 3
+    assert set(
+        Alias.objects.filter(player__game=new_game).values_list("last_seen_at", flat=True)
+    ) == {game_time}
 
     profile1.refresh_from_db()
     assert profile1.game_first == profile1.game_last == new_game
@@ -1255,3 +1268,112 @@ def test_pick_correct_from_multiple_servers(
             assert test_server.pk != new_server.pk
     else:
         assert game.server.pk == servers[server_id].pk
+
+
+def test_stream_server_details_are_cached(
+    post_game_data: PostGameDataT,
+    django_assert_num_queries,
+    redis,
+) -> None:
+    server = ServerFactory(ip="127.0.0.1", port=10480, version="1.0")
+
+    assert Server.objects.get_stream_server(ip="127.0.0.1", port=10480) is not None
+
+    with django_assert_num_queries(0):
+        stream_server = Server.objects.get_stream_server(ip="127.0.0.1", port=10480)
+
+    assert stream_server.id == server.pk
+    assert stream_server.enabled
+    # the cached details eventually expire
+    assert 0 < redis.ttl("stream_servers:127.0.0.1:10480") <= 600
+
+    response = post_game_data(ServerGameDataFactory(tag="foobar", port=10480, version="1.1"))
+    assert_success_code(response)
+
+    server.refresh_from_db()
+    assert server.version == "1.1"
+    assert Game.objects.get(tag="foobar").server == server
+    # the version change has invalidated the cached details
+    assert not redis.exists("stream_servers:127.0.0.1:10480")
+    with django_assert_num_queries(1):
+        Server.objects.get_stream_server(ip="127.0.0.1", port=10480)
+
+
+def test_stream_server_cache_is_invalidated_on_disable(
+    post_game_data: PostGameDataT,
+) -> None:
+    server = ServerFactory(ip="127.0.0.1", port=10480)
+
+    response = post_game_data(ServerGameDataFactory(tag="foo", port=10480))
+    assert_success_code(response)
+
+    server.enabled = False
+    server.save()
+
+    response = post_game_data(ServerGameDataFactory(tag="bar", port=10480))
+    assert_error_code(response)
+    assert list(Game.objects.values_list("tag", flat=True)) == ["foo"]
+
+
+def test_unknown_stream_servers_are_not_cached(
+    post_game_data: PostGameDataT,
+) -> None:
+    assert Server.objects.get_stream_server(ip="127.0.0.1", port=10480) is None
+
+    response = post_game_data(ServerGameDataFactory(tag="foobar", port=10480, version="1.1"))
+    assert_success_code(response)
+
+    server = Server.objects.get(ip="127.0.0.1", port=10480)
+    assert server.version == "1.1"
+    assert Game.objects.get(tag="foobar").server == server
+
+    stream_server = Server.objects.get_stream_server(ip="127.0.0.1", port=10480)
+    assert stream_server.id == server.pk
+
+
+def test_stream_server_readdressed_after_accept_is_not_used(
+    post_game_data: PostGameDataT,
+) -> None:
+    server = ServerFactory(ip="127.0.0.1", port=10480)
+    Server.objects.get_stream_server(ip="127.0.0.1", port=10480)
+
+    # bypass the invalidation signal
+    Server.objects.filter(pk=server.pk).update(ip="127.0.0.2")
+
+    response = post_game_data(ServerGameDataFactory(tag="foobar", port=10480))
+    assert_success_code(response)
+
+    game = Game.objects.get(tag="foobar")
+    assert game.server != server
+    assert (game.server.ip, game.server.port) == ("127.0.0.1", 10480)
+
+
+def test_recently_saved_game_is_not_queued_again(
+    post_game_data: PostGameDataT,
+) -> None:
+    game_data = ServerGameDataFactory(tag="foobar", port=10480, with_players_count=3)
+
+    response = post_game_data(game_data)
+    assert_success_code(response)
+    assert Game.objects.get(tag="foobar")
+    assert Game.objects.is_game_tag_saved("foobar")
+
+    with mock.patch("apps.tracker.views.stream.process_game_data.delay") as process_mock:
+        response = post_game_data(game_data)
+
+    assert_success_code(response)
+    assert process_mock.call_count == 0
+    assert Game.objects.count() == 1
+
+
+def test_saved_game_tags_are_remembered_for_already_saved_games(
+    post_game_data: PostGameDataT,
+) -> None:
+    GameFactory(tag="123")
+    assert not Game.objects.is_game_tag_saved("123")
+
+    response = post_game_data(ServerGameDataFactory(tag="123"))
+    assert_success_code(response)
+
+    assert Game.objects.is_game_tag_saved("123")
+    assert Game.objects.get_saved_game_tags("123", "456") == {"123"}